@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Scale benchmarks for snapshot discovery, filtering, output and delete
+
+Every benchmark runs in a forked child process so that its peak memory
+can be measured on its own. Results are appended to a JSON lines file
+and compared with the previous run of the same benchmark and size.
+
+Run from the repository root::
+
+    $ python -m benchmarks.bench_snapshot --sizes 100000 1000000
+
+"""
+from __future__ import print_function
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from multiprocessing import Pipe, Process
+
+from benchmarks.fakeconn import FakeEC2Connection
+from simplesnapshot.bulk import bulk_delete
+from simplesnapshot.retention import RetentionPolicy
+from simplesnapshot.snapshot import SimpleSnapshotConsole
+
+RESULTS = os.path.join(os.path.dirname(__file__), "results.jsonl")
+
+
+def _peak_rss():
+    # ru_maxrss is reported in kilobytes on Linux and bytes on OS X.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak / 1024.0
+
+
+@contextmanager
+def _devnull_stdout():
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def _console(conn, **kwargs):
+    return SimpleSnapshotConsole(conn, auto_confirm=True, **kwargs)
+
+
+def _discovered(conn, **kwargs):
+    console = _console(conn, **kwargs)
+    console.snapshots
+    return console
+
+
+# Every benchmark is a function of a FakeEC2Connection returning a
+# callable. Only the callable is timed.
+
+def bench_find_snapshots(conn):
+    return _console(conn)._find_snapshots
+
+
+def bench_find_snapshots_paged(conn):
+    return _console(conn, page_size=1000)._find_snapshots
+
+
+def _get_snapshots(conn, inverse, **kwargs):
+    console = _discovered(conn, **kwargs)
+    return lambda: list(console.get_snapshots(inverse=inverse))
+
+
+def bench_get_snapshots_num(conn):
+    return _get_snapshots(conn, False, count=len(conn.snapshots) // 2)
+
+
+def bench_get_snapshots_num_inverse(conn):
+    return _get_snapshots(conn, True, count=len(conn.snapshots) // 2)
+
+
+def bench_get_snapshots_days(conn):
+    return _get_snapshots(conn, False, count=30, count_type="days")
+
+
+def bench_get_snapshots_days_inverse(conn):
+    return _get_snapshots(conn, True, count=30, count_type="days")
+
+
+def bench_get_snapshots_per_volume(conn):
+    return _get_snapshots(conn, True, count=30, group_by="volume-id")
+
+
+def bench_retention_policy(conn):
+    return _get_snapshots(conn, True, count_type="policy",
+                          retention=RetentionPolicy(daily=7, weekly=4,
+                                                    monthly=12))
+
+
+def bench_output_snap(conn):
+    console = _discovered(conn)
+
+    def run():
+        with _devnull_stdout():
+            console.list()
+    return run
+
+
+def bench_output_ndjson(conn):
+    console = _discovered(conn, output="ndjson",
+                          columns=["id", "start_time", "volume_id", "tags"])
+
+    def run():
+        with _devnull_stdout():
+            console.list()
+    return run
+
+
+def bench_bulk_delete(conn):
+    console = _discovered(conn)
+    return lambda: bulk_delete(conn, console.snapshots, workers=8)
+
+
+BENCHMARKS = [
+    bench_find_snapshots,
+    bench_find_snapshots_paged,
+    bench_get_snapshots_num,
+    bench_get_snapshots_num_inverse,
+    bench_get_snapshots_days,
+    bench_get_snapshots_days_inverse,
+    bench_get_snapshots_per_volume,
+    bench_retention_policy,
+    bench_output_snap,
+    bench_output_ndjson,
+    bench_bulk_delete,
+]
+
+
+def _child(bench, size, pipe):
+    conn = FakeEC2Connection(size)
+    func = bench(conn)
+    baseline = _peak_rss()
+
+    start = time.time()
+    func()
+    elapsed = time.time() - start
+
+    pipe.send({"seconds": elapsed, "peak_mb": _peak_rss(),
+               "delta_mb": _peak_rss() - baseline})
+    pipe.close()
+
+
+def run_benchmark(bench, size):
+    """Run a single benchmark in a child process
+
+    :rtype: dict
+    :return: The elapsed seconds, the peak resident memory of the
+        child process and the growth of the peak during the timed
+        section, in megabytes.
+
+    """
+
+    parent, child = Pipe(duplex=False)
+    proc = Process(target=_child, args=(bench, size, child))
+    proc.start()
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        raise RuntimeError("{0} failed".format(bench.__name__))
+    finally:
+        proc.join()
+
+    return result
+
+
+def load_results(path):
+    """Load previous results keyed by (benchmark, size)"""
+
+    previous = {}
+    if os.path.exists(path):
+        with open(path) as fp:
+            for line in fp:
+                result = json.loads(line)
+                previous[(result["benchmark"], result["size"])] = result
+    return previous
+
+
+def _label():
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--tags", "--always", "--dirty"],
+            stderr=open(os.devnull, "w")
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_args(args):
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100000],
+                        help="Snapshot counts. DEFAULT: %(default)s")
+    parser.add_argument("--only", nargs="+", default=[],
+                        help="Only run benchmarks containing these names.")
+    parser.add_argument("--results", default=RESULTS,
+                        help="Results file. DEFAULT: %(default)s")
+    parser.add_argument("--label", default=None,
+                        help="Label stored with results. DEFAULT: git "
+                             "describe output")
+    parser.add_argument("--threshold", default=0.10, type=float,
+                        help=("Flag slow downs larger than this fraction. "
+                              "DEFAULT: %(default)s"))
+    parser.add_argument("--no-save", dest="save", default=True,
+                        action="store_false",
+                        help="Do not store the results.")
+    return parser.parse_args(args)
+
+
+def main(argv):
+    args = parse_args(argv)
+    label = args.label or _label()
+    previous = load_results(args.results)
+    regressions = 0
+
+    print("{0:<36}{1:>10}{2:>11}{3:>11}{4:>11}{5:>9}".format(
+        "BENCHMARK", "SIZE", "SECONDS", "PEAK_MB", "DELTA_MB", "CHANGE"))
+
+    for size in args.sizes:
+        for bench in BENCHMARKS:
+            name = bench.__name__[len("bench_"):]
+            if args.only and not any(x in name for x in args.only):
+                continue
+
+            result = run_benchmark(bench, size)
+            result.update({"benchmark": name, "size": size, "label": label,
+                           "time": time.time()})
+
+            change = ""
+            last = previous.get((name, size))
+            if last and last["seconds"] > 0:
+                ratio = result["seconds"] / last["seconds"] - 1
+                change = "{0:+.0%}".format(ratio)
+                if ratio > args.threshold:
+                    change += " !"
+                    regressions += 1
+
+            print("{0:<36}{1:>10}{2:>11.3f}{3:>11.1f}{4:>11.1f}{5:>9}".format(
+                name, size, result["seconds"], result["peak_mb"],
+                result["delta_mb"], change))
+
+            if args.save:
+                with open(args.results, "a") as fp:
+                    fp.write(json.dumps(result, sort_keys=True) + "\n")
+
+    if regressions:
+        print("{0} benchmark(s) slower than the previous run by more than "
+              "{1:.0%}".format(regressions, args.threshold), file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
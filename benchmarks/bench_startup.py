@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Startup time benchmarks for the command line
+
+Every case runs in a new interpreter, like a cron job would. The best
+of several runs is compared with a time budget, after subtracting the
+startup time of a bare interpreter. The run fails if a case is over
+budget or loads modules that only commands need, such as boto.ec2.
+
+Run from the repository root::
+
+    $ python -m benchmarks.bench_startup
+
+"""
+from __future__ import print_function
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser
+
+# Modules that must not be loaded before a command runs.
+HEAVY_MODULES = ["boto", "boto.ec2", "simplesnapshot.snapshot",
+                 "simplesnapshot.bulk", "multiprocessing.pool"]
+
+# Each case runs a statement after `import simplesnapshot`. `CONFIG`
+# is replaced with the path of a generated configuration file.
+CASES = [
+    ("help", "simplesnapshot.main()", ["-h"]),
+    ("argument_error", "simplesnapshot.main()", ["list", "--bogus"]),
+    ("parse_args", "from simplesnapshot.cmdline import parse_args\n"
+     "parse_args(sys.argv[1:])",
+     ["-p", "prod-*", "-r", "us-east-1", "delete", "--daily", "7",
+      "--per", "volume-id", "--workers", "8"]),
+    ("read_config", "from simplesnapshot.cmdline import parse_args, "
+     "read_config\n"
+     "args = parse_args(sys.argv[1:])\n"
+     "read_config(args.config, args.profile)",
+     ["-c", "CONFIG", "list", "--count", "3"]),
+]
+
+# Runs the case statement with output discarded, then reports which
+# heavy modules it loaded.
+_WRAPPER = """
+import json, os, sys
+import simplesnapshot
+stdout, stderr = sys.stdout, sys.stderr
+sys.stdout = sys.stderr = open(os.devnull, "w")
+try:
+{0}
+except SystemExit:
+    pass
+sys.stdout, sys.stderr = stdout, stderr
+print(json.dumps([x for x in {1!r} if sys.modules.get(x)]))
+"""
+
+
+def _time(argv):
+    start = time.time()
+    output = subprocess.check_output(argv)
+    return time.time() - start, output
+
+
+def run_case(statement, args, runs=10):
+    """Run a case in new interpreters
+
+    :rtype: tuple
+    :return: The best wall time in seconds and the list of heavy
+        modules the case loaded.
+
+    """
+
+    code = _WRAPPER.format(
+        "\n".join("    " + x for x in statement.splitlines()), HEAVY_MODULES)
+    argv = [sys.executable, "-c", code] + args
+
+    best = None
+    for _ in xrange(runs):
+        elapsed, output = _time(argv)
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, json.loads(output.splitlines()[-1])
+
+
+def parse_args(args):
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", default=10, type=int,
+                        help="Runs per case. DEFAULT: %(default)s")
+    parser.add_argument("--budget", default=0.06, type=float,
+                        help=("Seconds allowed per case on top of a bare "
+                              "interpreter. DEFAULT: %(default)s"))
+    return parser.parse_args(args)
+
+
+def main(argv):
+    args = parse_args(argv)
+
+    fd, config = tempfile.mkstemp()
+    with os.fdopen(fd, "w") as fp:
+        fp.write("[default]\naws_access_key_id = AKTEST\n"
+                 "aws_secret_access_key = TESTKEY\nregion = us-east-1\n")
+
+    try:
+        base = min(_time([sys.executable, "-c", "pass"])[0]
+                   for _ in xrange(args.runs))
+        print("{0:<20} {1:>8.3f}s".format("interpreter", base))
+
+        failed = False
+        for name, statement, case_args in CASES:
+            case_args = [config if x == "CONFIG" else x for x in case_args]
+            seconds, heavy = run_case(statement, case_args, args.runs)
+            over = seconds - base > args.budget
+            failed = failed or over or bool(heavy)
+
+            notes = []
+            if over:
+                notes.append("over budget of {0}s".format(args.budget))
+            if heavy:
+                notes.append("loaded " + ", ".join(heavy))
+            print("{0:<20} {1:>8.3f}s {2:>+8.3f}s  {3}".format(
+                name, seconds, seconds - base, "; ".join(notes) or "ok"))
+    finally:
+        os.remove(config)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
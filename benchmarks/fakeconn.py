@@ -0,0 +1,99 @@
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import random
+
+from datetime import datetime, timedelta
+
+from boto.ec2.connection import EC2Connection
+from boto.ec2.regioninfo import RegionInfo
+from boto.ec2.snapshot import Snapshot
+from boto.resultset import ResultSet
+
+
+class FakeEC2Connection(EC2Connection):
+    """An EC2Connection serving synthetic snapshots from memory
+
+    No requests are sent to AWS. The snapshots are generated once,
+    in random order, when the connection is created so that the cost
+    of generating them is never part of a measurement.
+
+    """
+
+    def __init__(self, count, volumes=1000, days=365, seed=0,
+                 region="us-east-1"):
+        """Initialize a FakeEC2Connection instance
+
+        :type count: int
+        :param count: The number of synthetic snapshots.
+
+        :type volumes: int
+        :param volumes: The number of distinct volume ids.
+
+        :type days: int
+        :param days: Snapshot start times are spread over this many
+            days before now.
+
+        :type seed: int
+        :param seed: Random seed, so runs are comparable.
+
+        """
+
+        # The parent constructor only builds request settings, no
+        # connection to AWS is made.
+        super(FakeEC2Connection, self).__init__(
+            aws_access_key_id="AKFAKE", aws_secret_access_key="FAKE",
+            region=RegionInfo(name=region,
+                              endpoint="ec2.{0}.amazonaws.com".format(region))
+        )
+
+        rand = random.Random(seed)
+        now = datetime.utcnow()
+        seconds = days * 86400
+
+        self.snapshots = []
+        for i in xrange(count):
+            snap = Snapshot(self)
+            snap.id = "snap-{0:08x}".format(i)
+            snap.volume_id = "vol-{0:08x}".format(rand.randrange(volumes))
+            snap.status = "completed"
+            snap.progress = "100%"
+            snap.volume_size = rand.choice([8, 16, 100, 500])
+            snap.description = "Synthetic snapshot {0}".format(i)
+            start = now - timedelta(seconds=rand.randrange(seconds))
+            snap.start_time = start.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            if rand.random() < 0.5:
+                snap.tags["Name"] = "backup-{0}".format(i % 50)
+            self.snapshots.append(snap)
+
+        self.deleted = 0
+
+    def get_all_snapshots(self, snapshot_ids=None, owner=None,
+                          restorable_by=None, filters=None, dry_run=False):
+        return list(self.snapshots)
+
+    def get_list(self, action, params, markers, path="/", parent=None,
+                 verb="GET"):
+        # Only DescribeSnapshots paging is supported.
+        start = int(params.get("NextToken", 0))
+        stop = start + int(params["MaxResults"])
+
+        page = ResultSet(markers)
+        page.extend(self.snapshots[start:stop])
+        if stop < len(self.snapshots):
+            page.next_token = str(stop)
+        return page
+
+    def delete_snapshot(self, snapshot_id, dry_run=False):
+        self.deleted += 1
+        return True
@@ -10,6 +10,7 @@ setup(
     entry_points={
         "console_scripts": [
             'ec2-simple-snapshot = simplesnapshot:main',
+            'ec2-simple-snapshot-standin = simplesnapshot.standin:main',
         ]
     },
     author="Nick Downs",
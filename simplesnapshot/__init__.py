@@ -14,8 +14,9 @@
 # limitations under the License.
 import sys
 
-from simplesnapshot.cmdline import main as _main
 
 def main():
-    # Entry point for command line script
+    # Entry point for command line script. Imported here so that
+    # importing any simplesnapshot module does not load the command line.
+    from simplesnapshot.cmdline import main as _main
     sys.exit(_main(sys.argv[1:]))
@@ -0,0 +1,374 @@
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A non-blocking library API for embedding SimpleSnapshot
+
+Every operation returns a `Future` at once and runs on the worker
+threads of a shared `SnapshotExecutor`. Many accounts and regions can
+be driven from a single thread by starting their operations and then
+waiting on the futures, for example with `gather`.
+
+"""
+import sys
+import threading
+
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from simplesnapshot.bulk import (BulkResult, CREATE_OUTCOMES, CREATED,
+                                 _create_one, _delete_one, tag_snapshots)
+from simplesnapshot.snapshot import SimpleSnapshot
+
+
+# Future, gather and _then stand in for the 'futures' backport of
+# concurrent.futures, which would be a second dependency next to boto.
+# It has no way to chain futures either, which create and delete need.
+class Future(object):
+    """The result of an operation that may not have finished yet"""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._result = None
+        self._error = None
+
+    def done(self):
+        """Return True once the operation has finished"""
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the operation and return its result
+
+        The exception raised by the operation is raised again here.
+
+        :type timeout: float
+        :param timeout: Seconds to wait. Waits forever if None.
+
+        """
+
+        # Event.wait without a timeout can not be interrupted with
+        # Ctrl-C on Python 2, so wait in slices.
+        if timeout is None:
+            while not self._done.wait(3600):
+                pass
+        elif not self._done.wait(timeout):
+            raise TimeoutError("Operation did not finish in time")
+
+        if self._error is not None:
+            raise self._error[0], self._error[1], self._error[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """Wait for the operation and return its exception or None"""
+        try:
+            self.result(timeout)
+        except TimeoutError:
+            raise
+        except Exception, e:
+            return e
+
+    def add_done_callback(self, func):
+        """Call `func` with this future once it has finished
+
+        Callbacks run on the thread finishing the operation, or at
+        once if the operation already finished.
+
+        """
+
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(func)
+                return
+        func(self)
+
+    def set_result(self, result):
+        self._finish(result, None)
+
+    def set_exception(self, exc_info):
+        """Finish with an error, `exc_info` as returned by sys.exc_info"""
+        self._finish(None, exc_info)
+
+    def _finish(self, result, error):
+        with self._lock:
+            self._result = result
+            self._error = error
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for func in callbacks:
+            func(self)
+
+
+def gather(futures):
+    """Combine futures into a single future of a list of results
+
+    The combined future fails with the first error raised by any of
+    `futures`, once all of them have finished.
+
+    """
+
+    futures = list(futures)
+    combined = Future()
+    if not futures:
+        combined.set_result([])
+        return combined
+
+    pending = [len(futures)]
+    lock = threading.Lock()
+
+    def finished(future):
+        with lock:
+            pending[0] -= 1
+            if pending[0]:
+                return
+
+        errors = [x._error for x in futures if x._error is not None]
+        if errors:
+            combined.set_exception(errors[0])
+        else:
+            combined.set_result([x._result for x in futures])
+
+    for future in futures:
+        future.add_done_callback(finished)
+
+    return combined
+
+
+class SnapshotExecutor(object):
+    """A pool of worker threads shared by AsyncSimpleSnapshot instances
+
+    The number of workers bounds the number of EC2 requests in flight
+    across every instance using the executor.
+
+    """
+
+    def __init__(self, workers=10):
+        self.workers = workers
+        self.pool = ThreadPool(workers)
+
+    def submit(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) on a worker thread
+
+        :rtype: class:`Future`
+        :return: A future of the return value of `func`.
+
+        """
+
+        future = Future()
+
+        def run():
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                future.set_exception(sys.exc_info())
+            else:
+                future.set_result(result)
+
+        self.pool.apply_async(run)
+        return future
+
+    def close(self):
+        """Wait for submitted work to finish and stop the workers"""
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncSimpleSnapshot(SimpleSnapshot):
+    """A SimpleSnapshot whose operations return futures
+
+    Filtering works exactly as in SimpleSnapshot; the `count`, `limit`,
+    `count_type`, `retention` and `group_by` options are all supported.
+    Every EC2 request is made on a worker thread of `executor`.
+
+    Create and delete requests are submitted to the executor one by
+    one, so a large delete never blocks other instances sharing the
+    executor for longer than a single request.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Initialize an AsyncSimpleSnapshot instance
+
+        Accepts every SimpleSnapshot argument and:
+
+        :type executor: class:`SnapshotExecutor`
+        :param executor: The executor running EC2 requests. A private
+            executor with 10 workers is created if not given, and
+            stopped by `close`.
+
+        """
+
+        self.executor = kwargs.pop("executor", None)
+        self._own_executor = self.executor is None
+        if self._own_executor:
+            self.executor = SnapshotExecutor()
+        # Serializes discovery, which may be started by several
+        # operations at once.
+        self._discovery = threading.Lock()
+        super(AsyncSimpleSnapshot, self).__init__(*args, **kwargs)
+
+    def close(self):
+        """Wait for submitted work and stop the private executor
+
+        A shared executor passed to the constructor is left running.
+
+        """
+
+        if self._own_executor:
+            self.executor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _discovered(self, refresh=False):
+        with self._discovery:
+            if refresh:
+                self.refresh()
+            return self.snapshots
+
+    def discover(self, refresh=False):
+        """Discover snapshots
+
+        :type refresh: boolean
+        :param refresh: Ask AWS again even if snapshots were already
+            discovered, bypassing the catalog.
+
+        :rtype: class:`Future`
+        :return: A future of the sorted list of snapshots.
+
+        """
+
+        return self.executor.submit(self._discovered, refresh)
+
+    def fetch_snapshots(self, inverse=False):
+        """Discover snapshots if needed and filter them
+
+        :rtype: class:`Future`
+        :return: A future of the list `get_snapshots(inverse)` yields.
+
+        """
+
+        def run():
+            self._discovered()
+            return list(self.get_snapshots(inverse=inverse))
+
+        return self.executor.submit(run)
+
+    def delete(self, snapshots=None, dry_run=False):
+        """Delete snapshots, one request per worker thread
+
+        :type snapshots: list
+        :param snapshots: The snapshots to delete. Defaults to the
+            oldest first snapshots `fetch_snapshots(inverse=True)`
+            matches.
+
+        :rtype: class:`Future`
+        :return: A future of a `BulkResult`.
+
+        """
+
+        def start(snapshots):
+            return self._bulk(lambda snap: _delete_one(self.conn, snap,
+                                                       dry_run),
+                              snapshots, BulkResult())
+
+        if snapshots is None:
+            return _then(self.fetch_snapshots(inverse=True), start)
+        return start(snapshots)
+
+    def create(self, volumes, description="", tags=None, dry_run=False):
+        """Create snapshots, one request per worker thread
+
+        Once every snapshot is created they are tagged like
+        `simplesnapshot.bulk.bulk_create` does.
+
+        :type volumes: dict
+        :param volumes: Maps volume ids to the Name tag of the volume,
+            or None for volumes without a Name tag.
+
+        :rtype: class:`Future`
+        :return: A future of a `BulkResult`. The created snapshots are
+            available in its `snapshots` attribute.
+
+        """
+
+        def create_one(volume_id):
+            volume_id, outcome, message, snap = _create_one(
+                self.conn, volume_id, description, dry_run=dry_run)
+            return volume_id, outcome or CREATED, message, snap
+
+        def tag(result):
+            return self.executor.submit(self._tag, result, volumes, tags,
+                                        dry_run)
+
+        created = self._bulk(create_one, volumes,
+                             BulkResult(CREATE_OUTCOMES))
+        return _then(created, tag)
+
+    def _tag(self, result, volumes, tags, dry_run):
+        tag_snapshots(self.conn, result.snapshots, volumes, tags,
+                      dry_run=dry_run)
+        return result
+
+    def _bulk(self, func, items, result):
+        # Submit func(item) for every item and collect the outcome
+        # tuples into `result`.
+        futures = []
+        for item in items:
+            futures.append(self.executor.submit(func, item))
+
+        def collect(outcomes):
+            for outcome in outcomes:
+                if len(outcome) == 4:
+                    if outcome[3] is not None:
+                        result.snapshots.append(outcome[3])
+                    outcome = outcome[:3]
+                result.add(*outcome)
+            return result
+
+        return _then(gather(futures), collect)
+
+
+def _then(future, func):
+    # Return a future of func(future.result()). If func returns a
+    # future itself, the returned future follows it.
+    chained = Future()
+
+    def finished(future):
+        if future._error is not None:
+            chained.set_exception(future._error)
+            return
+        try:
+            result = func(future._result)
+        except Exception:
+            chained.set_exception(sys.exc_info())
+            return
+
+        if isinstance(result, Future):
+            result.add_done_callback(lambda x: chained._finish(x._result,
+                                                               x._error))
+        else:
+            chained.set_result(result)
+
+    future.add_done_callback(finished)
+    return chained
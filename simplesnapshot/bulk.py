@@ -0,0 +1,402 @@
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import print_function
+
+import time
+
+from collections import Counter, OrderedDict
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from boto.ec2.snapshot import Snapshot
+from boto.exception import BotoServerError
+from simplesnapshot.metrics import THROTTLE_CODES
+
+# Per resource outcomes collected by `bulk_delete`, `bulk_create` and
+# `wait_snapshots`
+COMPLETED = "completed"
+CREATED = "created"
+DELETED = "deleted"
+IN_USE = "in_use"
+NOT_FOUND = "not_found"
+THROTTLED = "throttled"
+DRY_RUN = "dry_run"
+FAILED = "failed"
+TIMED_OUT = "timed_out"
+
+OUTCOMES = [DELETED, DRY_RUN, IN_USE, NOT_FOUND, THROTTLED, FAILED]
+CREATE_OUTCOMES = [CREATED, DRY_RUN, NOT_FOUND, THROTTLED, FAILED]
+WAIT_OUTCOMES = [COMPLETED, NOT_FOUND, FAILED, TIMED_OUT]
+
+_ERROR_OUTCOMES = {
+    "InvalidSnapshot.InUse": IN_USE,
+    "InvalidSnapshot.NotFound": NOT_FOUND,
+    "InvalidVolume.NotFound": NOT_FOUND,
+    "RequestLimitExceeded": THROTTLED,
+    "DryRunOperation": DRY_RUN,
+}
+
+# Resource ids sent in a single CreateTags request
+TAG_BATCH_SIZE = 500
+
+# Snapshot ids polled by a single DescribeSnapshots request, the most
+# values EC2 accepts for one filter.
+POLL_BATCH_SIZE = 200
+
+# Polls in a row that must miss a snapshot never seen by DescribeSnapshots
+# before it is given up on. Snapshots are not always listed right after
+# CreateSnapshot returns.
+MISSING_POLLS = 3
+
+
+class BulkResult(object):
+    """Collected outcomes of a bulk operation
+
+    Every processed resource is recorded as a tuple of
+    (resource_id, outcome, message). `message` is None for
+    successful operations. Snapshots created by `bulk_create` are
+    collected in `snapshots`.
+
+    """
+
+    def __init__(self, outcomes=OUTCOMES):
+        self.outcomes = outcomes
+        self.results = []
+        self.counts = Counter()
+        self.snapshots = []
+
+    def add(self, resource_id, outcome, message=None):
+        self.results.append((resource_id, outcome, message))
+        self.counts[outcome] += 1
+
+    @property
+    def gone(self):
+        """Ids of snapshots that were deleted or did not exist"""
+        return [x[0] for x in self.results if x[1] in (DELETED, NOT_FOUND)]
+
+    @property
+    def errors(self):
+        """Results that did not delete (or dry run) the snapshot"""
+        return [x for x in self.results
+                if x[1] not in (COMPLETED, CREATED, DELETED, DRY_RUN)]
+
+    def summary(self):
+        """Return a one line summary of outcome counts"""
+        return "  ".join("{0}: {1}".format(outcome, self.counts[outcome])
+                         for outcome in self.outcomes)
+
+
+def _attempt(resource_id, func, *args, **kwargs):
+    # Call func, turning exceptions into an outcome tuple. The
+    # return value of func is passed back as the fourth item.
+    try:
+        value = func(*args, **kwargs)
+    except BotoServerError, e:
+        # Throttling that outlasts boto's own retries is raised as a
+        # BotoServerError rather than an EC2ResponseError.
+        return (resource_id, _ERROR_OUTCOMES.get(e.error_code, FAILED),
+                "{0}: {1}".format(e.error_code, e.error_message), None)
+    except Exception, e:
+        # Network errors and the like must not abort the rest
+        # of the batch.
+        return (resource_id, FAILED, str(e), None)
+
+    return (resource_id, None, None, value)
+
+
+def _delete_one(conn, snap, dry_run=False):
+    snap_id, outcome, message, _ = _attempt(snap.id, conn.delete_snapshot,
+                                            snap.id, dry_run=dry_run)
+    return (snap_id, outcome or DELETED, message)
+
+
+def _create_one(conn, volume_id, description="", dry_run=False):
+    # EC2Connection.create_snapshot also looks up the volume and copies
+    # its Name tag, two more requests per volume. bulk_create does both
+    # in batches instead, so only CreateSnapshot is sent here.
+    params = {"VolumeId": volume_id}
+    if description:
+        params["Description"] = description[0:255]
+    if dry_run:
+        params["DryRun"] = "true"
+
+    return _attempt(volume_id, conn.get_object, "CreateSnapshot", params,
+                    Snapshot, verb="POST")
+
+
+def _run(func, items, workers):
+    # Yield func(item) for every item using `workers` threads.
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    pool = ThreadPool(workers)
+    try:
+        outcomes = pool.imap_unordered(func, items)
+        while True:
+            # Waiting without a timeout blocks KeyboardInterrupt until
+            # every item is done, so wait in short slices.
+            try:
+                outcome = outcomes.next(0.5)
+            except TimeoutError:
+                continue
+            except StopIteration:
+                break
+            yield outcome
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def bulk_delete(conn, snapshots, workers=1, dry_run=False, progress=None):
+    """Delete snapshots using a pool of worker threads
+
+    A failure to delete a snapshot never stops the rest of the
+    batch. Each outcome is recorded in the returned `BulkResult`.
+
+    :type conn: class:`boto.ec2.EC2Connection`
+    :param conn: The connection used for the delete requests.
+
+    :type snapshots: iterable
+    :param snapshots: Snapshot objects with an `id` attribute.
+
+    :type workers: int
+    :param workers: The number of concurrent delete requests. A value
+        of 1 or less deletes serially in the calling thread.
+
+    :type dry_run: boolean
+    :param dry_run: Enable dry_run mode for each delete request.
+
+    :type progress: callable
+    :param progress: Called in the calling thread with the
+        (snapshot_id, outcome, message) of every delete as it finishes.
+
+    :rtype: class:`BulkResult`
+    :return: The outcome of every delete request.
+
+    """
+
+    result = BulkResult()
+    delete = lambda snap: _delete_one(conn, snap, dry_run=dry_run)
+    for outcome in _run(delete, snapshots, workers):
+        result.add(*outcome)
+        if progress is not None:
+            progress(*outcome)
+
+    return result
+
+
+def tag_resources(conn, resource_ids, tags, dry_run=False):
+    """Tag resources using as few CreateTags requests as possible
+
+    :type resource_ids: list
+    :param resource_ids: The ids of the resources to tag. Requests
+        are sent for at most `TAG_BATCH_SIZE` resources at a time.
+
+    :type tags: dict
+    :param tags: Tag names and values.
+
+    :rtype: int
+    :return: The number of CreateTags requests sent.
+
+    """
+
+    requests = 0
+    for i in xrange(0, len(resource_ids), TAG_BATCH_SIZE):
+        conn.create_tags(resource_ids[i:i + TAG_BATCH_SIZE], tags,
+                         dry_run=dry_run)
+        requests += 1
+
+    return requests
+
+
+def bulk_create(conn, volumes, description="", tags=None, workers=1,
+                dry_run=False):
+    """Create snapshots for many volumes using a pool of worker threads
+
+    CreateSnapshot requests are issued concurrently. Once they are all
+    done, the new snapshots are tagged with `tags` plus the Name tag of
+    their volume, with one multi-resource CreateTags request per
+    distinct set of tags.
+
+    :type volumes: dict
+    :param volumes: Maps volume ids to the Name tag of the volume, or
+        None for volumes without a Name tag.
+
+    :type description: string
+    :param description: The description of every new snapshot.
+
+    :type tags: dict
+    :param tags: Tags set on every new snapshot.
+
+    :type workers: int
+    :param workers: The number of concurrent CreateSnapshot requests.
+
+    :type dry_run: boolean
+    :param dry_run: Enable dry_run mode for each request.
+
+    :rtype: class:`BulkResult`
+    :return: The outcome for every volume. The created snapshots are
+        available in the `snapshots` attribute.
+
+    """
+
+    result = BulkResult(CREATE_OUTCOMES)
+    create = lambda volume_id: _create_one(conn, volume_id, description,
+                                           dry_run=dry_run)
+    for volume_id, outcome, message, snap in _run(create, volumes, workers):
+        if snap is not None:
+            result.snapshots.append(snap)
+        result.add(volume_id, outcome or CREATED, message)
+
+    tag_snapshots(conn, result.snapshots, volumes, tags, dry_run=dry_run)
+    return result
+
+
+def tag_snapshots(conn, snapshots, volumes, tags=None, dry_run=False):
+    """Tag new snapshots with `tags` and the Name tag of their volume
+
+    Snapshots are grouped by the tags they need and each group is
+    tagged with as few CreateTags requests as possible. Tags given by
+    the caller take precedence over the Name tag copied from the volume.
+
+    :type volumes: dict
+    :param volumes: Maps volume ids to the Name tag of the volume.
+
+    """
+
+    groups = {}
+    for snap in snapshots:
+        name = volumes.get(snap.volume_id)
+        snap_tags = dict({"Name": name} if name else {}, **(tags or {}))
+        if snap_tags:
+            key = tuple(sorted(snap_tags.items()))
+            groups.setdefault(key, []).append(snap.id)
+            snap.tags.update(snap_tags)
+
+    for key, snap_ids in groups.items():
+        tag_resources(conn, snap_ids, dict(key), dry_run=dry_run)
+
+
+def wait_snapshots(conn, snapshots, timeout=3600, interval=5,
+                   max_interval=60, progress=None, sleep=time.sleep,
+                   clock=time.time):
+    """Wait for pending snapshots to complete
+
+    Every pending snapshot is polled together, with one DescribeSnapshots
+    request per `POLL_BATCH_SIZE` snapshots. The poll interval starts at
+    `interval` and grows by half after every poll in which no snapshot
+    made progress, up to `max_interval`. It drops back to `interval`
+    once a snapshot progresses. Throttled polls and server errors count
+    as polls without progress; any other error fails every snapshot still
+    pending. A snapshot missing from a successful poll, for example
+    because it was deleted meanwhile, is not waited for any longer once
+    a poll has listed it, or after `MISSING_POLLS` polls that did not.
+
+    :type snapshots: list
+    :param snapshots: Snapshots returned by CreateSnapshot. Their
+        `status` and `progress` attributes are updated in place.
+
+    :type timeout: float
+    :param timeout: Give up after this many seconds.
+
+    :type progress: callable
+    :param progress: Called with the list of snapshots whose progress
+        or status changed, after every poll with changes.
+
+    :rtype: class:`BulkResult`
+    :return: A result with a 'completed', 'not_found', 'failed'
+        (status 'error') or 'timed_out' outcome for every snapshot.
+
+    """
+
+    result = BulkResult(WAIT_OUTCOMES)
+    pending = OrderedDict()
+    for snap in snapshots:
+        if snap.status == "completed":
+            result.add(snap.id, COMPLETED)
+        else:
+            pending[snap.id] = snap
+
+    seen = set()
+    misses = Counter()
+    deadline = clock() + timeout
+    delay = interval
+    while pending:
+        remaining = deadline - clock()
+        if remaining <= 0:
+            break
+        sleep(min(delay, remaining))
+
+        changed = []
+        ids = list(pending)
+        for i in xrange(0, len(ids), POLL_BATCH_SIZE):
+            batch = ids[i:i + POLL_BATCH_SIZE]
+            try:
+                # A filter, unlike SnapshotId parameters, does not fail
+                # the whole request if a snapshot was deleted meanwhile.
+                polled = conn.get_all_snapshots(
+                    owner="self", filters={"snapshot-id": batch})
+            except BotoServerError, e:
+                if e.error_code in THROTTLE_CODES or e.status >= 500:
+                    continue
+                # Expired credentials and the like do not go away by
+                # polling until the timeout.
+                for snap_id in pending:
+                    result.add(snap_id, FAILED, "{0}: {1}".format(
+                        e.error_code, e.error_message))
+                return result
+
+            found = set(x.id for x in polled)
+            seen.update(found)
+            for snap_id in batch:
+                if snap_id in found:
+                    misses.pop(snap_id, None)
+                    continue
+                misses[snap_id] += 1
+                if snap_id in seen or misses[snap_id] >= MISSING_POLLS:
+                    result.add(pending.pop(snap_id).id, NOT_FOUND,
+                               "snapshot no longer exists")
+
+            for current in polled:
+                snap = pending.get(current.id)
+                if snap is None or (snap.status, snap.progress) == \
+                        (current.status, current.progress):
+                    continue
+
+                snap.status = current.status
+                snap.progress = current.progress
+                changed.append(snap)
+                if snap.status == "completed":
+                    result.add(pending.pop(snap.id).id, COMPLETED)
+                elif snap.status == "error":
+                    result.add(pending.pop(snap.id).id, FAILED,
+                               "snapshot status is error")
+
+        if changed:
+            delay = interval
+            if progress is not None:
+                progress(changed)
+        else:
+            delay = min(delay * 1.5, max_interval)
+
+    for snap_id in pending:
+        result.add(snap_id, TIMED_OUT,
+                   "not completed after {0} seconds".format(timeout))
+
+    return result
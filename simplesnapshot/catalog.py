@@ -0,0 +1,191 @@
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+import sqlite3
+import time
+
+from contextlib import closing
+
+DEFAULT_PATH = "~/.cache/ec2-simple-snapshot/catalog.db"
+
+# Snapshot attributes stored in the catalog, in column order.
+FIELDS = ["id", "volume_id", "status", "progress", "start_time",
+          "volume_size", "description"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    key TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    fetched REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    key TEXT NOT NULL,
+    region TEXT,
+    tags TEXT,
+    {0},
+    PRIMARY KEY (key, id)
+);
+CREATE INDEX IF NOT EXISTS snapshots_id ON snapshots (id);
+""".format(",\n    ".join(FIELDS))
+
+
+class SnapshotCatalog(object):
+    """A persistent local cache of discovered snapshots
+
+    Snapshot discovery results are stored in an SQLite database keyed
+    by scope (usually profile and region), owner, filters and snapshot
+    ids. A stored result is used until it is older than `ttl` seconds.
+
+    Each operation opens its own database connection, so a single
+    catalog file may be shared by several threads and processes.
+
+    """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=300, scope=(),
+                 refresh=False):
+        """Initialize a SnapshotCatalog instance
+
+        :type path: string
+        :param path: The location of the SQLite database. Missing
+            directories are created.
+
+        :type ttl: int
+        :param ttl: The number of seconds a stored discovery result
+            stays valid.
+
+        :type scope: tuple
+        :param scope: Values separating one account and region from
+            another, for example (profile, region).
+
+        :type refresh: boolean
+        :param refresh: Ignore stored results. Newly discovered
+            snapshots are still stored.
+
+        """
+
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.scope = json.dumps(list(scope))
+        self.refresh = refresh
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        with closing(self._connect()) as db:
+            db.executescript(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def key(self, owner, filters, snapshot_ids):
+        """Build the catalog key for a discovery request"""
+
+        return json.dumps([self.scope, owner, filters,
+                           sorted(snapshot_ids or [])], sort_keys=True)
+
+    def load(self, key):
+        """Load a stored discovery result
+
+        :type key: string
+        :param key: A key returned by `key`.
+
+        :rtype: list
+        :return: A list of `SnapshotRecord` instances or None if no
+            valid result is stored.
+
+        """
+
+        if self.refresh:
+            return None
+
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT fetched FROM queries WHERE key = ?",
+                             (key,)).fetchone()
+            if row is None or row[0] + self.ttl < time.time():
+                return None
+
+            rows = db.execute("SELECT region, tags, {0} FROM snapshots "
+                              "WHERE key = ?".format(", ".join(FIELDS)),
+                              (key,))
+            return _records(rows)
+
+    def store(self, key, snapshots):
+        """Replace the stored discovery result for `key`
+
+        :type snapshots: list
+        :param snapshots: SnapshotRecord or boto Snapshot instances.
+
+        """
+
+        rows = [(key, getattr(x.region, "name", None),
+                 json.dumps(dict(x.tags or {})))
+                + tuple(getattr(x, field, None) for field in FIELDS)
+                for x in snapshots]
+
+        with closing(self._connect()) as db:
+            with db:
+                db.execute("DELETE FROM snapshots WHERE key = ?", (key,))
+                db.executemany("INSERT INTO snapshots (key, region, tags, "
+                               "{0}) VALUES ({1})".format(
+                                   ", ".join(FIELDS),
+                                   ", ".join("?" * (len(FIELDS) + 3))),
+                               rows)
+                db.execute("INSERT OR REPLACE INTO queries "
+                           "(key, scope, fetched) VALUES (?, ?, ?)",
+                           (key, self.scope, time.time()))
+
+    def discard(self, snapshot_ids):
+        """Drop snapshots from every stored result, e.g. after a delete"""
+
+        with closing(self._connect()) as db:
+            with db:
+                db.executemany("DELETE FROM snapshots WHERE id = ?",
+                               ((x,) for x in snapshot_ids))
+
+    def invalidate(self):
+        """Expire every stored result in this catalog's scope
+
+        Used after creating snapshots, since there is no way to tell
+        locally which filters a new snapshot would match.
+
+        """
+
+        with closing(self._connect()) as db:
+            with db:
+                db.execute("DELETE FROM snapshots WHERE key IN "
+                           "(SELECT key FROM queries WHERE scope = ?)",
+                           (self.scope,))
+                db.execute("DELETE FROM queries WHERE scope = ?",
+                           (self.scope,))
+
+
+def _records(rows):
+    # Imported here rather than at module level, so that the command
+    # line can import DEFAULT_PATH without loading boto.ec2.
+    from boto.ec2.regioninfo import RegionInfo
+    from simplesnapshot.snapshot import SnapshotRecord
+
+    # Records loaded together share a single RegionInfo per region.
+    regions = {}
+    records = []
+    for row in rows:
+        region = regions.get(row[0])
+        if region is None and row[0] is not None:
+            region = regions[row[0]] = RegionInfo(name=row[0])
+
+        records.append(SnapshotRecord(*row[2:], tags=json.loads(row[1]),
+                                      region=region))
+    return records
@@ -14,13 +14,59 @@
 # limitations under the License.
 from __future__ import print_function
 import os
+import socket
 import sys
 
+from fnmatch import fnmatch
+
 from ConfigParser import SafeConfigParser, NoOptionError
 from argparse import ArgumentParser
-
-from boto import ec2
-from simplesnapshot.snapshot import SimpleSnapshotConsole
+from urlparse import urlparse
+
+from simplesnapshot.catalog import DEFAULT_PATH
+from simplesnapshot.journal import DEFAULT_PATH as DEFAULT_JOURNAL
+from simplesnapshot.retention import RetentionPolicy
+from simplesnapshot.session import Session
+from simplesnapshot.where import compile_where
+from simplesnapshot.output import (COLUMNS, DEFAULT_COLUMNS, WRITERS,
+                                   parse_columns)
+
+__all__ = ["load_commands", "parse_args", "read_config", "parse_profiles",
+           "parse_items", "parse_regions", "build_catalog",
+           "build_retention", "connect", "build_console", "build_consoles",
+           "journal_path", "run", "report_metrics", "main"]
+
+# boto.ec2 and the modules using it take most of the startup time, so
+# they are only imported by `load_commands` once a command needs them.
+# `--help` and argument errors never load them.
+ec2 = None
+RegionInfo = None
+SimpleSnapshotConsole = None
+SnapshotCatalog = None
+run_consoles = None
+ApiMetrics = None
+
+
+def load_commands():
+    """Import the modules needed to run commands, if not done yet"""
+
+    global ec2, RegionInfo, SimpleSnapshotConsole, SnapshotCatalog
+    global run_consoles, ApiMetrics
+
+    # Each name is checked on its own so that tests can replace any
+    # of them.
+    if ec2 is None:
+        from boto import ec2
+    if RegionInfo is None:
+        from boto.ec2.regioninfo import RegionInfo
+    if SimpleSnapshotConsole is None:
+        from simplesnapshot.snapshot import SimpleSnapshotConsole
+    if SnapshotCatalog is None:
+        from simplesnapshot.catalog import SnapshotCatalog
+    if run_consoles is None:
+        from simplesnapshot.fanout import run_consoles
+    if ApiMetrics is None:
+        from simplesnapshot.metrics import ApiMetrics
 
 
 def parse_args(args):
@@ -38,9 +84,14 @@ def parse_args(args):
 
     parser = ArgumentParser()
     parser.add_argument("-p", "--profile", default="default",
-                        help="Profile in aws config to use.")
+                        help=("Profile in aws config to use. Several "
+                              "profiles may be given as a comma separated "
+                              "list of names or glob patterns such as "
+                              "'prod-*'."))
     parser.add_argument("-r", "--region", default=None,
-                        help="EC2 region to connect to.")
+                        help=("EC2 region to connect to. Several regions "
+                              "may be given as a comma separated list. "
+                              "Use 'all' for every EC2 region."))
     parser.add_argument("-c", "--config", default="~/.aws/config",
                         help=("AWS cli configuration file location. "
                               "Default: %(default)s"))
@@ -48,7 +99,55 @@ def parse_args(args):
                         help="Answer yes to all prompts automatically.")
     parser.add_argument("--dry-run", dest="dry_run", action="store_true",
                         default=False, help="Enable aws dry run mode.")
-
+    parser.add_argument("--endpoint-url", dest="endpoint_url", default=None,
+                        help=("Send EC2 requests to this URL instead of "
+                              "the AWS endpoint for the region, for "
+                              "example a local ec2-simple-snapshot-standin "
+                              "server."))
+    parser.add_argument("-o", "--output", default="table",
+                        choices=list(WRITERS),
+                        help=("Output format of snapshot listings. "
+                              "DEFAULT: %(default)s"))
+    parser.add_argument("--columns", default=None,
+                        help=("Comma separated columns of snapshot "
+                              "listings. Valid columns: {0}. DEFAULT: "
+                              "{1}".format(",".join(COLUMNS),
+                                           ",".join(DEFAULT_COLUMNS))))
+    parser.add_argument("-j", "--jobs", default=10, type=int,
+                        help=("Max number of profiles and regions to work "
+                              "on concurrently. DEFAULT: %(default)s"))
+    parser.add_argument("--api-rate", dest="api_rate", default=None,
+                        type=float,
+                        help=("EC2 API calls per second allowed per action "
+                              "and region. Throttled calls are retried "
+                              "with backoff and concurrency is reduced. "
+                              "0 disables rate limiting. DEFAULT: the EC2 "
+                              "rate of each action"))
+    parser.add_argument("--stats", default=False, action="store_true",
+                        help=("Print call counts, errors, throttling, bytes "
+                              "and latency of every EC2 API action to "
+                              "stderr when done."))
+    parser.add_argument("--metrics-file", dest="metrics_file", default=None,
+                        help=("Write EC2 API metrics to this file in the "
+                              "Prometheus text format, e.g. for the node "
+                              "exporter textfile collector."))
+    parser.add_argument("--statsd", default=None, metavar="HOST:PORT",
+                        help=("Send EC2 API metrics to a StatsD server. "
+                              "DEFAULT PORT: 8125"))
+    parser.add_argument("--profile-run", dest="profile_run", default=None,
+                        metavar="PREFIX",
+                        help=("Time the API, record, sort, filter and "
+                              "output phases of the run and write a "
+                              "report to PREFIX.txt."))
+    parser.add_argument("--cprofile", default=False, action="store_true",
+                        help=("With --profile-run, also run cProfile and "
+                              "write its stats to PREFIX.pstats."))
+    parser.add_argument("--trace-memory", dest="trace_memory",
+                        default=False, action="store_true",
+                        help=("With --profile-run, also record the memory "
+                              "of each phase, using tracemalloc if "
+                              "available and the peak resident set size "
+                              "otherwise."))
     # Sub parser for each supported command
     subparser = parser.add_subparsers(title="snapshot commands",
                                       dest="command")
@@ -56,6 +155,9 @@ def parse_args(args):
     create_parser = subparser.add_parser("create", help="Create a snapshot")
     list_parser = subparser.add_parser("list", help="List snapshots")
     delete_parser = subparser.add_parser("delete", help="Delete Snapshots")
+    daemon_parser = subparser.add_parser("daemon",
+                                         help=("Run create and delete "
+                                               "commands on a schedule"))
 
     for _parser in [list_parser, delete_parser]:
         _parser.add_argument("snapshot_ids", nargs="*", metavar="snapshot_id",
@@ -70,20 +172,111 @@ def parse_args(args):
         _parser.add_argument("--limit", default=0, type=int,
                              help="max number of snapshots to operate on.")
         _parser.add_argument("--type", default="num",
-                             choices=["num", "days"],
+                             choices=["num", "days", "policy"],
                              help=("The type of filter you want to use."
                                    " 'num' will trigger a normal numerical"
                                    " filter. 'days' will filter by date."
+                                   " 'policy' matches the snapshots kept by"
+                                   " --daily, --weekly and --monthly."
                                    " DEFAULT: '%(default)s'"))
+        _parser.add_argument("--per", dest="group_by", default=None,
+                             metavar="KEY",
+                             help=("Apply --count, retention policies and "
+                                   "--limit to each group of snapshots "
+                                   "sharing this key: 'volume-id' or a tag "
+                                   "name such as 'Name'."))
+        for period in ["daily", "weekly", "monthly"]:
+            _parser.add_argument("--" + period, default=0, type=int,
+                                 help=("Number of {0} snapshots kept by a "
+                                       "retention policy. Implies --type "
+                                       "policy.".format(period)))
+        _parser.add_argument("--cache-ttl", dest="cache_ttl", default=0,
+                             type=int,
+                             help=("Reuse discovery results stored in the "
+                                   "local catalog for this many seconds. "
+                                   "DEFAULT: %(default)s (disabled)"))
+        _parser.add_argument("--refresh", default=False, action="store_true",
+                             help=("Discover snapshots from AWS and update "
+                                   "the local catalog."))
+        _parser.add_argument("--page-size", dest="page_size", default=0,
+                             type=int,
+                             help=("Discover snapshots in pages of this "
+                                   "size. DEFAULT: a single request"))
+        _parser.add_argument("--where", default=None, metavar="EXPR",
+                             help=("Only operate on snapshots matching this "
+                                   "expression, checked locally before "
+                                   "--count and --limit apply. "
+                                   "EXAMPLE: \"size > 100 and description "
+                                   "~ '^nightly' and not tag:Keep\""))
+
+    for _parser in [list_parser, delete_parser, create_parser]:
+        _parser.add_argument("--cache-file", dest="cache_file",
+                             default=DEFAULT_PATH,
+                             help=("Local snapshot catalog location. "
+                                   "DEFAULT: %(default)s"))
+
+    for _parser, action in [(delete_parser, "delete"),
+                            (create_parser, "create")]:
+        _parser.add_argument("--workers", default=1, type=int,
+                             help=("Number of concurrent {0} requests. "
+                                   "DEFAULT: %(default)s".format(action)))
 
     list_parser.add_argument("--owner", default=["self"], nargs="+",
                              help=("Snapshot owner(s). Valid values are "
                                    "'self', 'amazon' and/or valid "
                                    "aws account ids. "
                                    "DEFAULT: 'self'"))
-
-    create_parser.add_argument("volume_id",
-                               help="EC2 EBS Volume Identification Number.")
+    list_parser.add_argument("--unsorted", dest="stream", default=False,
+                             action="store_true",
+                             help=("Print snapshots as they are discovered "
+                                   "instead of sorted by date. Only used "
+                                   "with a single profile and region."))
+
+    delete_parser.add_argument("--journal", default=DEFAULT_JOURNAL,
+                               help=("Write the snapshots to delete to this "
+                                     "file before deleting them and record "
+                                     "every outcome, so that an "
+                                     "interrupted run can be continued "
+                                     "with --resume. '{profile}' and "
+                                     "'{region}' are replaced by the "
+                                     "profile and region. "
+                                     "DEFAULT: %(default)s"))
+    plan_group = delete_parser.add_mutually_exclusive_group()
+    plan_group.add_argument("--resume", default=False, action="store_true",
+                            help=("Continue an interrupted run from its "
+                                  "journal instead of discovering "
+                                  "snapshots. Snapshots deleted or "
+                                  "missing are skipped."))
+    plan_group.add_argument("--plan-out", dest="plan_out", default=None,
+                            metavar="FILE",
+                            help=("Only write the snapshots to delete to "
+                                  "FILE, for review. Placeholders as for "
+                                  "--journal."))
+    plan_group.add_argument("--apply", default=None, metavar="FILE",
+                            help=("Delete the snapshots planned with "
+                                  "--plan-out FILE without discovering "
+                                  "snapshots, recording outcomes in FILE. "
+                                  "Run again to continue if interrupted."))
+
+    create_parser.add_argument("volume_ids", nargs="*", metavar="volume_id",
+                               help="EC2 EBS Volume Identification Numbers.")
+    create_parser.add_argument("--volume-filter", nargs="+",
+                               dest="volume_filters",
+                               metavar="\"name=value\"", default=[],
+                               help=("Snapshot every volume matching these "
+                                     "filters. This option may be used "
+                                     "multiple times. "
+                                     "EXAMPLE: 'tag:Backup=true'"))
+    create_parser.add_argument("--instance", dest="instance_id",
+                               metavar="INSTANCE_ID", default=None,
+                               help=("Snapshot every volume attached to this "
+                                     "instance at once, tagged with a shared "
+                                     "SnapshotSet id."))
+    create_parser.add_argument("--max-skew", dest="max_skew", default=None,
+                               type=float, metavar="SECONDS",
+                               help=("Fail if the start times of an "
+                                     "instance's snapshots are further apart "
+                                     "than this."))
     create_parser.add_argument("--description", default="",
                                help="Add a description to new snapshot.")
     create_parser.add_argument("--tags", nargs="+", dest="tags",
@@ -91,8 +284,68 @@ def parse_args(args):
                                help=("Tags to set on the Snapshot. This option"
                                      " may be used multiple times. "
                                      "EXAMPLE: 'type=backup'"))
-
-    return parser.parse_args(args)
+    create_parser.add_argument("--wait", default=False, action="store_true",
+                               help=("Wait for the new snapshots to complete, "
+                                     "printing their progress."))
+    create_parser.add_argument("--wait-timeout", dest="wait_timeout",
+                               default=3600, type=float,
+                               help=("Seconds to wait with --wait before "
+                                     "giving up. DEFAULT: %(default)s"))
+    create_parser.add_argument("--poll-interval", dest="poll_interval",
+                               default=5, type=float,
+                               help=("Initial seconds between progress checks "
+                                     "with --wait. Checks slow down while no "
+                                     "snapshot progresses. "
+                                     "DEFAULT: %(default)s"))
+
+    daemon_parser.add_argument("schedule",
+                               help=("Schedule file. Each section is a job "
+                                     "with a 'command', an 'every' interval "
+                                     "and an optional 'offset', for example "
+                                     "'every = 1d' and 'offset = 2h'."))
+    daemon_parser.add_argument("--once", default=False, action="store_true",
+                               help="Run every job once and exit.")
+
+    args = parser.parse_args(args)
+    if (args.cprofile or args.trace_memory) and not args.profile_run:
+        parser.error("--cprofile and --trace-memory require --profile-run")
+
+    if args.statsd is not None:
+        host, _, port = args.statsd.partition(":")
+        if not host or not (port == "" or port.isdigit() and
+                            0 < int(port) < 65536):
+            parser.error("--statsd: expected HOST or HOST:PORT, "
+                         "got '{0}'".format(args.statsd))
+
+    if args.columns is not None:
+        try:
+            args.columns = parse_columns(args.columns)
+        except ValueError, e:
+            parser.error(str(e))
+
+    if args.command == "create":
+        if not (args.volume_ids or args.volume_filters or args.instance_id):
+            create_parser.error("a volume_id, --volume-filter or --instance "
+                                "is required")
+        if args.max_skew is not None and not args.instance_id:
+            create_parser.error("--max-skew requires --instance")
+
+    if args.command in ["list", "delete"]:
+        if args.where is not None:
+            try:
+                compile_where(args.where)
+            except ValueError, e:
+                parser.error("--where: {0}".format(e))
+        if args.daily or args.weekly or args.monthly:
+            if args.type == "days":
+                parser.error("--type days can not be combined with a "
+                             "retention policy")
+            args.type = "policy"
+        elif args.type == "policy":
+            parser.error("--type policy requires --daily, --weekly "
+                         "or --monthly")
+
+    return args
 
 
 def read_config(fp, section):
@@ -111,11 +364,7 @@ def read_config(fp, section):
     :return: A dictionary containing the configuration file data.
 
     """
-    if isinstance(fp, str):
-        fp = file(os.path.expanduser(fp))
-
-    conf = SafeConfigParser()
-    conf.readfp(fp)
+    conf = _parse_config(fp)
 
     items = {}
     items["aws_access_key_id"] = conf.get(section, 'aws_access_key_id')
@@ -128,6 +377,51 @@ def read_config(fp, section):
     return items
 
 
+def _parse_config(fp):
+    if isinstance(fp, str):
+        fp = file(os.path.expanduser(fp))
+
+    conf = SafeConfigParser()
+    conf.readfp(fp)
+    return conf
+
+
+def parse_profiles(fp, profile):
+    """Expand a profile string into a list of profile names
+
+    :type fp: string or file-like object
+    :param fp: The path to a configuration file or a file like object
+        containing the configuration data. The configuration is only
+        read if `profile` contains glob patterns.
+
+    :type profile: string
+    :param profile: A profile name or a comma separated list of
+        profile names and glob patterns, for example 'prod-*,staging'.
+
+    :rtype: list
+    :return: A list of profile names in the order they were matched.
+
+    """
+
+    patterns = [x.strip() for x in profile.split(",") if x.strip()]
+    sections = None
+
+    profiles = []
+    for pattern in patterns:
+        if not any(c in pattern for c in "*?["):
+            matched = [pattern]
+        else:
+            if sections is None:
+                sections = _parse_config(fp).sections()
+            matched = [x for x in sections if fnmatch(x, pattern)]
+            if not matched:
+                raise ValueError("No profiles match {0}".format(pattern))
+
+        profiles.extend(x for x in matched if x not in profiles)
+
+    return profiles
+
+
 def parse_items(items):
     """Parse name=value strings into a dictionary
 
@@ -152,31 +446,132 @@ def parse_items(items):
     return items_dict
 
 
-def main(argv):
-    args = parse_args(argv)
+def parse_regions(region):
+    """Parse a comma separated region string into a list
+
+    :type region: string
+    :param region: A region name, a comma separated list of region
+        names or 'all' for every EC2 region.
+
+    :rtype: list
+    :return: A list of region names. [None] is returned if `region`
+        is None so boto can fall back to its default region.
+
+    """
+
+    if region is None:
+        return [None]
+
+    if region == "all":
+        load_commands()
+        return sorted(x.name for x in ec2.regions())
+
+    regions = []
+    for name in region.split(","):
+        name = name.strip()
+        if name and name not in regions:
+            regions.append(name)
+
+    return regions
+
+
+def build_catalog(args, profile, region):
+    """Build the local snapshot catalog if caching is enabled
+
+    `create` has no caching options of its own, but uses an existing
+    catalog so that stored results made stale by it are expired.
+
+    """
+
+    ttl = getattr(args, "cache_ttl", 0)
+    refresh = getattr(args, "refresh", False)
+    if args.command == "create":
+        if not os.path.exists(os.path.expanduser(args.cache_file)):
+            return None
+    elif ttl <= 0 and not refresh:
+        return None
+
+    load_commands()
+    return SnapshotCatalog(args.cache_file, ttl=ttl,
+                           scope=(profile, region), refresh=refresh)
+
 
-    config = read_config(args.config, args.profile)
+def build_retention(args):
+    """Build the retention policy if `--type policy` is used"""
 
-    # Update region from the command line if passed
-    if args.region is not None:
-        config['region'] = args.region
+    if getattr(args, "type", "num") != "policy":
+        return None
 
-    conn = ec2.connect_to_region(
-        config['region'],
+    return RetentionPolicy(daily=args.daily, weekly=args.weekly,
+                           monthly=args.monthly)
+
+
+def connect(config, region, endpoint_url=None):
+    """Connect to EC2 in `region`
+
+    :type endpoint_url: string
+    :param endpoint_url: Override the AWS endpoint of the region,
+        for example 'http://localhost:8773/'.
+
+    :rtype: class:`boto.ec2.EC2Connection`
+    :return: An EC2Connection instance.
+
+    """
+
+    load_commands()
+    if endpoint_url is None:
+        return ec2.connect_to_region(
+            region,
+            aws_access_key_id=config['aws_access_key_id'],
+            aws_secret_access_key=config['aws_secret_access_key']
+        )
+
+    url = urlparse(endpoint_url)
+    secure = url.scheme == "https"
+    return ec2.EC2Connection(
         aws_access_key_id=config['aws_access_key_id'],
-        aws_secret_access_key=config['aws_secret_access_key']
+        aws_secret_access_key=config['aws_secret_access_key'],
+        region=RegionInfo(name=region or "us-east-1", endpoint=url.hostname),
+        port=url.port or (443 if secure else 80),
+        is_secure=secure,
+        path=url.path or "/"
     )
 
+
+def build_console(args, session, region, profile, tag_rows=False,
+                  warm=None):
+    """Build a SimpleSnapshotConsole for a single profile and region
+
+    :type session: class:`simplesnapshot.session.Session`
+    :param session: The session providing the connection.
+
+    :type warm: class:`simplesnapshot.daemon.WarmState`
+    :param warm: Reuse the catalogs kept by `warm` instead of creating
+        new ones.
+
+    """
+
+    conn = session.connection(region, profile)
+    if warm is None:
+        catalog = build_catalog(args, profile, region)
+    else:
+        catalog = warm.catalog(args, profile, region)
+
+    load_commands()
+
     # Extensive use of getattr here so we can provide defaults and not
     # raise an exception for a missing attribute. This is done because
     # not all commands share the same command line arguments. For instance
     # the 'create' command does not support an 'owner' argument. Attempting
     # to access args.owner during a create snapshot run would raise an
     # AttributeError.
-    command = SimpleSnapshotConsole(
+    return SimpleSnapshotConsole(
         conn,
         snapshot_ids=getattr(args, "snapshot_ids", []),
-        volume_id=getattr(args, "volume_id", None),
+        volume_ids=getattr(args, "volume_ids", []),
+        volume_filters=parse_items(getattr(args, "volume_filters", [])),
+        instance_id=getattr(args, "instance_id", None),
+        max_skew=getattr(args, "max_skew", None),
         description=getattr(args, "description", ""),
         count=getattr(args, "count", 0),
         limit=getattr(args, "limit", 0),
@@ -186,9 +581,175 @@ def main(argv):
         tags=parse_items(getattr(args, "tags", [])),
         owner=' '.join(getattr(args, "owner", ["self"])),
         auto_confirm=args.yes,
-        dry_run=args.dry_run
+        dry_run=args.dry_run,
+        workers=getattr(args, "workers", 1),
+        page_size=getattr(args, "page_size", 0),
+        stream=getattr(args, "stream", False),
+        catalog=catalog,
+        retention=build_retention(args),
+        group_by=getattr(args, "group_by", None),
+        date_pushdown=args.command == "list",
+        where=getattr(args, "where", None),
+        output=args.output,
+        columns=args.columns,
+        wait=getattr(args, "wait", False),
+        wait_timeout=getattr(args, "wait_timeout", 3600),
+        poll_interval=getattr(args, "poll_interval", 5),
+        journal=journal_path(args, profile, region),
+        plan_info={"profile": profile},
+        plan_only=bool(getattr(args, "plan_out", None)),
+        resume=bool(getattr(args, "resume", False) or
+                    getattr(args, "apply", None)),
+        profile=profile if tag_rows else None
     )
-    return command.run(args.command)
+
+
+def journal_path(args, profile, region):
+    """Return the delete journal of a profile and region, if any"""
+
+    if args.command != "delete":
+        return None
+
+    path = args.plan_out or args.apply or args.journal
+    return path.replace("{profile}", profile).replace(
+        "{region}", region or "default")
+
+
+def build_consoles(args, warm=None):
+    """Build a SimpleSnapshotConsole for every profile and region
+
+    When more than one profile is used, output rows are tagged with
+    their profile and a profile with a broken configuration is
+    reported as a failure instead of raising.
+
+    All consoles share one `simplesnapshot.session.Session`, so
+    consoles of the same profile and region share a connection.
+
+    :type warm: class:`simplesnapshot.daemon.WarmState`
+    :param warm: Reuse the session and catalogs kept by `warm`.
+
+    :rtype: tuple
+    :return: A tuple of (consoles, failures). `failures` is a list of
+        (profile, exception) tuples.
+
+    """
+
+    profiles = parse_profiles(args.config, args.profile)
+    multi = len(profiles) > 1
+
+    endpoint_url = getattr(args, "endpoint_url", None)
+    api_rate = getattr(args, "api_rate", None)
+    if warm is None:
+        session = Session(args.config, endpoint_url=endpoint_url,
+                          api_rate=api_rate)
+    else:
+        session = warm.session(args.config, endpoint_url, api_rate)
+
+    consoles = []
+    failures = []
+    journals = set()
+    for profile in profiles:
+        try:
+            config = session.credentials(profile)
+
+            # Update region from the command line if passed
+            if args.region is not None:
+                config['region'] = args.region
+
+            for region in parse_regions(config['region']):
+                journal = journal_path(args, profile, region)
+                if journal is not None and journal in journals:
+                    raise ValueError("Use '{profile}' and '{region}' in "
+                                     "journal and plan paths with several "
+                                     "profiles or regions")
+                journals.add(journal)
+                consoles.append(build_console(args, session, region,
+                                              profile, multi, warm))
+        except Exception, e:
+            if not multi:
+                raise
+            failures.append((profile, e))
+
+    return consoles, failures
+
+
+def run(args, warm=None):
+    """Run the command of parsed arguments on every profile and region
+
+    With `--stats`, `--metrics-file` or `--statsd`, every EC2 call is
+    measured and reported once the command finishes, even if it fails.
+    The same goes for the phase timings of `--profile-run`.
+
+    :rtype: int
+    :return: The exit status of the command.
+
+    """
+
+    load_commands()
+
+    profiler = None
+    if args.profile_run:
+        from simplesnapshot.profiling import RunProfiler
+        profiler = RunProfiler(cprofile=args.cprofile,
+                               memory=args.trace_memory)
+        profiler.start()
+
+    try:
+        if profiler is None:
+            consoles, failures = build_consoles(args, warm)
+        else:
+            with profiler.phase("setup"):
+                consoles, failures = build_consoles(args, warm)
+            for console in consoles:
+                console.profiler = profiler
+
+        metrics = None
+        if args.stats or args.metrics_file or args.statsd:
+            metrics = ApiMetrics()
+            for console in consoles:
+                metrics.instrument(console.conn)
+
+        try:
+            if len(consoles) == 1 and not failures:
+                return consoles[0].run(args.command)
+
+            return run_consoles(consoles, args.command, workers=args.jobs,
+                                failures=failures)
+        finally:
+            if metrics is not None:
+                report_metrics(args, metrics)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            for path in profiler.write(os.path.expanduser(args.profile_run),
+                                       args):
+                print("Profile written to {0}".format(path),
+                      file=sys.stderr)
+
+
+def report_metrics(args, metrics):
+    """Report API metrics as requested by the command line options"""
+
+    if args.stats:
+        print(metrics.summary(), file=sys.stderr)
+    if args.metrics_file:
+        metrics.write_textfile(os.path.expanduser(args.metrics_file))
+    if args.statsd:
+        # The command's own outcome matters more than its metrics.
+        try:
+            metrics.send_statsd(args.statsd)
+        except (socket.error, ValueError), e:
+            print("Warning: could not send metrics to StatsD at {0}: "
+                  "{1}".format(args.statsd, e), file=sys.stderr)
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.command == "daemon":
+        from simplesnapshot.daemon import run_daemon
+        return run_daemon(args)
+
+    return run(args)
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,253 @@
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Run ec2-simple-snapshot commands on a schedule in one process
+
+Starting a process per cron job imports boto, parses the configuration
+and opens new connections every time. The daemon does all of that once
+and keeps connections, configurations and snapshot catalogs between
+runs.
+
+A schedule file has one section per job::
+
+    [nightly]
+    command = -p prod -y create --volume-filter tag:Backup=true
+    every = 1d
+    offset = 2h
+
+`command` is a command line as passed to ec2-simple-snapshot. Jobs run
+at every multiple of `every` since the epoch (UTC), shifted by
+`offset`, so the job above runs at 02:00 UTC every day.
+
+"""
+from __future__ import print_function
+
+import os
+import shlex
+import sys
+import time
+import traceback
+
+from ConfigParser import SafeConfigParser, NoOptionError
+
+from simplesnapshot.cmdline import build_catalog, parse_args, run
+from simplesnapshot.session import Session
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_interval(interval):
+    """Parse an interval such as '90', '15m', '6h' or '1d' into seconds
+
+    :rtype: int
+    :return: The number of seconds.
+
+    """
+
+    interval = interval.strip().lower()
+    unit = 1
+    if interval and interval[-1] in _UNITS:
+        interval, unit = interval[:-1], _UNITS[interval[-1]]
+
+    try:
+        return int(interval) * unit
+    except ValueError:
+        raise ValueError("Invalid interval {0!r}".format(interval))
+
+
+class Job(object):
+    """A command run on a fixed schedule"""
+
+    def __init__(self, name, args, every, offset=0):
+        """Initialize a Job instance
+
+        :type args: class:`argparse.Namespace`
+        :param args: The parsed command line of the job.
+
+        :type every: int
+        :param every: Seconds between runs.
+
+        :type offset: int
+        :param offset: Seconds the runs are shifted from multiples of
+            `every` since the epoch.
+
+        """
+
+        if every <= 0:
+            raise ValueError("Job {0}: 'every' must be positive".format(name))
+
+        self.name = name
+        self.args = args
+        self.every = every
+        self.offset = offset % every
+
+    def next_run(self, now):
+        """Return the first run time after `now`"""
+        return ((now - self.offset) // self.every + 1) * self.every + \
+            self.offset
+
+
+def read_schedule(fp):
+    """Read jobs from a schedule file
+
+    :type fp: string or file-like object
+    :param fp: The path to a schedule file or a file like object
+        containing the schedule.
+
+    :rtype: list
+    :return: A list of `Job` instances.
+
+    """
+
+    if isinstance(fp, str):
+        fp = file(os.path.expanduser(fp))
+
+    conf = SafeConfigParser()
+    conf.readfp(fp)
+
+    jobs = []
+    for name in conf.sections():
+        try:
+            command = conf.get(name, "command")
+            every = parse_interval(conf.get(name, "every"))
+        except NoOptionError, e:
+            raise ValueError("Job {0}: {1}".format(name, e))
+
+        offset = 0
+        if conf.has_option(name, "offset"):
+            offset = parse_interval(conf.get(name, "offset"))
+
+        try:
+            args = parse_args(shlex.split(command))
+        except SystemExit:
+            # argparse has printed the reason already.
+            raise ValueError("Job {0}: invalid command".format(name))
+
+        if args.command == "daemon":
+            raise ValueError("Job {0}: can not run a daemon".format(name))
+        if args.command != "list" and not args.yes:
+            raise ValueError("Job {0}: scheduled {1} commands must not "
+                             "prompt, add -y".format(name, args.command))
+
+        jobs.append(Job(name, args, every, offset))
+
+    if not jobs:
+        raise ValueError("The schedule has no jobs")
+    return jobs
+
+
+class WarmState(object):
+    """Sessions and catalogs kept between runs
+
+    One `Session` is kept per configuration file, endpoint and API
+    rate, so configurations are only read again when they change and
+    the HTTP connections and rate limits of every profile and region
+    are reused by later runs.
+
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.catalogs = {}
+
+    def session(self, config, endpoint_url=None, api_rate=None):
+        """Return the session for a configuration file and endpoint"""
+
+        key = (config, endpoint_url, api_rate)
+        session = self.sessions.get(key)
+        if session is None:
+            session = self.sessions[key] = Session(
+                config, endpoint_url=endpoint_url, api_rate=api_rate)
+        return session
+
+    def catalog(self, args, profile, region):
+        """Return the catalog `build_catalog` would, reused if possible"""
+
+        key = (args.command == "create", args.cache_file,
+               getattr(args, "cache_ttl", 0), getattr(args, "refresh", False),
+               profile, region)
+        catalog = self.catalogs.get(key)
+        if catalog is None:
+            catalog = build_catalog(args, profile, region)
+            # `create` only uses a catalog file once it exists.
+            if catalog is not None:
+                self.catalogs[key] = catalog
+        return catalog
+
+
+class Scheduler(object):
+    """Run jobs when they are due"""
+
+    def __init__(self, jobs, warm=None, clock=time.time, sleep=time.sleep):
+        self.jobs = jobs
+        self.warm = warm or WarmState()
+        self.clock = clock
+        self.sleep = sleep
+
+        now = clock()
+        self.due = dict((job.name, job.next_run(now)) for job in jobs)
+
+    def run_job(self, job):
+        """Run a job, reporting its outcome to stderr
+
+        :rtype: boolean
+        :return: True if the job succeeded.
+
+        """
+
+        start = self.clock()
+        try:
+            status = run(job.args, self.warm)
+        except Exception:
+            print("{0}: failed".format(job.name), file=sys.stderr)
+            traceback.print_exc()
+            return False
+
+        print("{0}: exit status {1} after {2:.1f}s".format(
+            job.name, status or 0, self.clock() - start), file=sys.stderr)
+        return not status
+
+    def run_pending(self):
+        """Run every due job and return the seconds until the next one"""
+
+        for job in self.jobs:
+            if self.due[job.name] <= self.clock():
+                self.run_job(job)
+                # Runs missed while jobs were running are skipped.
+                self.due[job.name] = job.next_run(self.clock())
+
+        return max(0, min(self.due.values()) - self.clock())
+
+    def run_forever(self):
+        while True:
+            self.sleep(self.run_pending())
+
+
+def run_daemon(args):
+    """Run the jobs of the schedule file in `args.schedule`"""
+
+    try:
+        jobs = read_schedule(args.schedule)
+    except (IOError, ValueError), e:
+        print(e, file=sys.stderr)
+        return 2
+
+    scheduler = Scheduler(jobs)
+    if args.once:
+        results = [scheduler.run_job(job) for job in jobs]
+        return 0 if all(results) else 1
+
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        return 0
@@ -0,0 +1,211 @@
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import print_function
+
+import heapq
+import sys
+
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+
+from simplesnapshot.output import SharedWriter
+
+
+def run_parallel(func, items, workers=None):
+    """Call `func` for every item using a pool of threads
+
+    :type func: callable
+    :param func: A callable accepting a single item.
+
+    :type items: list
+    :param items: The items to process.
+
+    :type workers: int
+    :param workers: The maximum number of concurrent calls. Defaults
+        to one thread per item.
+
+    :rtype: list
+    :return: The return values of `func` in the order of `items`.
+
+    """
+
+    items = list(items)
+    workers = min(workers or len(items), len(items))
+    if workers <= 1:
+        return [func(x) for x in items]
+
+    pool = ThreadPool(workers)
+    try:
+        # map_async().get() with a timeout keeps the main thread
+        # responsive to KeyboardInterrupt while waiting.
+        results = pool.map_async(func, items).get(1e9)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return results
+
+
+def _newest_first(stream, tag):
+    # heapq.merge only merges ascending streams, so decorate each
+    # snapshot with the distance of its date from datetime.max.
+    for snap in stream:
+        yield (datetime.max - snap.date, tag, snap)
+
+
+def merge_snapshots(streams):
+    """Merge date sorted snapshot streams into a single stream
+
+    Each stream must already be sorted newest to oldest, as returned
+    by `SimpleSnapshot.get_snapshots`. The merge is lazy, so the
+    combined sequence is never sorted or held in memory as a whole.
+
+    :type streams: list
+    :param streams: A list of snapshot iterables.
+
+    :rtype: generator
+    :return: Yields (stream index, snapshot) tuples ordered newest
+        to oldest across all streams.
+
+    """
+
+    decorated = [_newest_first(x, i) for i, x in enumerate(streams)]
+    for _, tag, snap in heapq.merge(*decorated):
+        yield tag, snap
+
+
+def console_label(console):
+    """Return a 'profile/region' label identifying a console"""
+
+    region = getattr(getattr(console.conn, "region", None), "name", None)
+    return "/".join(x for x in (console.profile, region) if x)
+
+
+def _attempt(func):
+    # Wrap func so that exceptions are returned instead of raised.
+    # One failing account or region must not kill the whole run.
+    def wrapper(console):
+        try:
+            return func(console), None
+        except Exception, e:
+            return None, e
+    return wrapper
+
+
+def run_consoles(consoles, command, workers=None, failures=None):
+    """Run a command against several SimpleSnapshotConsole instances
+
+    Snapshot discovery for `list` and `delete` is done in parallel,
+    so the wall clock time is set by the slowest console rather than
+    the sum of all of them. Deletes resumed from a journal skip
+    discovery. `list` output is merged into a single date ordered
+    listing. Other commands run concurrently when no confirmation
+    prompt is needed, otherwise once per console in turn. Their rows
+    are written to a single `SharedWriter` document and their summaries
+    start with the profile and region of the console.
+
+    A console that raises an exception is dropped from the run and
+    reported in an aggregated failure summary once all other consoles
+    are done.
+
+    :type consoles: list
+    :param consoles: SimpleSnapshotConsole instances, for example one
+        per region and profile.
+
+    :type command: string
+    :param command: The command name passed to `run`.
+
+    :type workers: int
+    :param workers: The maximum number of concurrent consoles.
+
+    :type failures: list
+    :param failures: (label, exception) tuples for consoles that
+        already failed while being set up.
+
+    :rtype: int
+    :return: 1 if any console reported a failure, otherwise 0.
+
+    """
+
+    failures = list(failures or [])
+
+    def keep_working(func, consoles, workers):
+        results = run_parallel(_attempt(func), consoles, workers)
+        working = []
+        for console, (result, error) in zip(consoles, results):
+            if error is None:
+                working.append((console, result))
+            else:
+                failures.append((console_label(console), error))
+        return working
+
+    if command in ("list", "delete"):
+        # Resumed deletes take their snapshots from the journal.
+        resumed = [x for x in consoles
+                   if command == "delete" and getattr(x, "resume", False)]
+        discovered = [x for x, _ in keep_working(lambda console:
+                                                 console.snapshots,
+                                                 [x for x in consoles
+                                                  if x not in resumed],
+                                                 workers)]
+        consoles = [x for x in consoles
+                    if x in resumed or x in discovered]
+
+    status = 0
+    if command == "list":
+        if consoles:
+            # A single writer keeps the merged listing in one document.
+            out = consoles[0].make_writer()
+            out.header()
+            streams = [x.get_snapshots() for x in consoles]
+            for tag, snap in merge_snapshots(streams):
+                out.write(snap, consoles[tag].profile)
+            out.close()
+    else:
+        shared = None
+        if len(consoles) > 1:
+            # Rows of every console go into a single document.
+            shared = SharedWriter(consoles[0].make_writer())
+            for console in consoles:
+                console.shared_writer = shared
+                console.summary_label = console_label(console)
+
+        prompts = not all(x.auto_confirm for x in consoles)
+        try:
+            done = keep_working(lambda console: console.run(command),
+                                consoles, 1 if prompts else workers)
+        finally:
+            if shared is not None:
+                shared.finish()
+        if any(result for _, result in done):
+            status = 1
+
+    if failures:
+        output_failures(failures)
+        status = 1
+
+    return status
+
+
+def output_failures(failures):
+    """Prints an aggregated report of failed consoles"""
+
+    for label, error in failures:
+        print("FAILED {0}: {1}: {2}".format(label or "default",
+                                            error.__class__.__name__, error),
+              file=sys.stderr)
+    print("{0} target(s) failed".format(len(failures)), file=sys.stderr)
@@ -0,0 +1,186 @@
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Delete plans and journals of their outcomes
+
+A journal file holds one JSON document per line. The first line
+describes the plan, the following lines are the snapshots to delete
+and, once deletes start, the outcome of each delete::
+
+    {"plan": {"profile": "prod", "region": "us-east-1", "count": 2, ...}}
+    {"snapshot": {"id": "snap-1", "volume_id": "vol-1", ...}}
+    {"snapshot": {"id": "snap-2", "volume_id": "vol-1", ...}}
+    {"outcome": ["snap-1", "deleted", null]}
+
+Plans are written to a temporary file and renamed into place, so a
+journal never holds a partial plan. Outcomes are appended and synced
+to disk one at a time, so an interrupted run loses at most the outcome
+being written.
+
+"""
+import json
+import os
+import time
+
+from collections import OrderedDict
+
+from simplesnapshot.catalog import FIELDS
+
+DEFAULT_PATH = "~/.cache/ec2-simple-snapshot/delete-{profile}-{region}.jsonl"
+
+# Outcomes after which a snapshot is not deleted again. Matches
+# DELETED and NOT_FOUND of simplesnapshot.bulk, which loads boto.
+GONE = frozenset(["deleted", "not_found"])
+
+
+def _fsync_dir(directory):
+    # Make a rename in `directory` durable.
+    fd = os.open(directory or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class DeleteJournal(object):
+    """A delete plan and the outcomes of applying it"""
+
+    def __init__(self, path):
+        """Initialize a DeleteJournal instance
+
+        :type path: string
+        :param path: The location of the journal file. Missing
+            directories are created when a plan is written.
+
+        """
+
+        self.path = os.path.expanduser(path)
+        self.info = None
+        self.snapshots = []
+        self.outcomes = OrderedDict()
+        self._fp = None
+
+    def write_plan(self, snapshots, **info):
+        """Replace the journal with a plan to delete `snapshots`
+
+        :type snapshots: list
+        :param snapshots: SnapshotRecord or boto Snapshot instances, in
+            the order they are to be deleted.
+
+        :param info: Values describing the plan, such as the profile
+            and region it was made for.
+
+        """
+
+        self.close()
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        info = dict(info, count=len(snapshots), created=time.strftime(
+            "%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+        tmp = "{0}.{1}.tmp".format(self.path, os.getpid())
+        with open(tmp, "w") as fp:
+            fp.write(json.dumps({"plan": info}) + "\n")
+            for snap in snapshots:
+                record = dict((x, getattr(snap, x, None)) for x in FIELDS)
+                record["tags"] = dict(snap.tags or {})
+                fp.write(json.dumps({"snapshot": record}) + "\n")
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.rename(tmp, self.path)
+        _fsync_dir(directory)
+
+        self.info = info
+        self.snapshots = list(snapshots)
+        self.outcomes = OrderedDict()
+
+    def load(self, region=None):
+        """Read the plan and the outcomes recorded so far
+
+        A last line cut short by a crash is removed from the file.
+
+        :type region: class:`boto.ec2.regioninfo.RegionInfo`
+        :param region: The region set on the loaded snapshots.
+
+        :raises: ValueError if the file is not a journal.
+
+        """
+
+        from simplesnapshot.snapshot import SnapshotRecord
+
+        with open(self.path) as fp:
+            content = fp.read()
+        lines = content.splitlines()
+
+        docs = []
+        for i, line in enumerate(lines):
+            try:
+                docs.append(json.loads(line))
+            except ValueError:
+                if i < len(lines) - 1:
+                    raise ValueError("{0}: line {1} is not valid JSON"
+                                     .format(self.path, i + 1))
+
+        if not docs or "plan" not in docs[0]:
+            raise ValueError("{0} is not a delete plan".format(self.path))
+
+        if not content.endswith("\n"):
+            # Outcomes recorded from now on must start on a line of
+            # their own, so drop a partial line or end a complete one.
+            with open(self.path, "r+") as fp:
+                if len(docs) < len(lines):
+                    fp.truncate(content.rfind("\n") + 1)
+                else:
+                    fp.seek(0, os.SEEK_END)
+                    fp.write("\n")
+
+        self.info = docs[0]["plan"]
+        self.snapshots = []
+        self.outcomes = OrderedDict()
+        for doc in docs[1:]:
+            if "snapshot" in doc:
+                self.snapshots.append(SnapshotRecord(region=region,
+                                                     **doc["snapshot"]))
+            elif "outcome" in doc:
+                snap_id, outcome, message = doc["outcome"]
+                self.outcomes[snap_id] = (outcome, message)
+
+    def pending(self):
+        """Return the planned snapshots that are not gone yet
+
+        Snapshots whose delete failed, was throttled or never ran are
+        pending, snapshots deleted or found missing are not.
+
+        """
+
+        return [x for x in self.snapshots
+                if self.outcomes.get(x.id, (None,))[0] not in GONE]
+
+    def record(self, snapshot_id, outcome, message=None):
+        """Append the outcome of a delete and sync it to disk"""
+
+        if self._fp is None:
+            self._fp = open(self.path, "a")
+        self._fp.write(json.dumps({"outcome": [snapshot_id, outcome,
+                                               message]}) + "\n")
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        self.outcomes[snapshot_id] = (outcome, message)
+
+    def close(self):
+        """Close the file outcomes are appended to"""
+
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
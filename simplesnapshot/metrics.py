@@ -0,0 +1,313 @@
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Per API call metrics of EC2 connections
+
+`ApiMetrics.instrument` wraps the `make_request` method every EC2 call
+of a boto connection goes through, recording latency, response size,
+errors and throttling per API action. Requests boto retries internally
+are timed as a single call.
+
+Calls sent through a `simplesnapshot.ratelimit.RateLimiter` report the
+throttled attempts it retried with `throttle`, and the time spent
+waiting for the limiter with `wait`. That time is recorded separately
+and left out of the call latency.
+
+"""
+import os
+import re
+import socket
+import threading
+import time
+
+from array import array
+from collections import OrderedDict
+
+from boto.exception import BotoServerError
+
+# Upper bounds of the latency histogram buckets in seconds, the
+# Prometheus client defaults.
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+PREFIX = "simplesnapshot_api"
+
+THROTTLE_CODES = set(["RequestLimitExceeded", "Throttling"])
+
+# Port of StatsD addresses given without one
+STATSD_PORT = 8125
+
+_ERROR_CODE = re.compile(r"<Code>([^<]+)</Code>")
+
+
+class ActionStats(object):
+    """Metrics of a single API action"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+        self.bytes = 0
+        self.wait = 0.0
+        self.latencies = array("d")
+
+    def quantile(self, q):
+        """Return the latency below which a fraction `q` of calls were"""
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def buckets(self):
+        """Return the cumulative count of calls per `BUCKETS` bound"""
+        counts = [0] * len(BUCKETS)
+        for latency in self.latencies:
+            for i, bound in enumerate(BUCKETS):
+                if latency <= bound:
+                    counts[i] += 1
+                    break
+        total = 0
+        for i, count in enumerate(counts):
+            total += count
+            counts[i] = total
+        return counts
+
+
+class ApiMetrics(object):
+    """Thread safe metrics of every instrumented EC2 call"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.actions = OrderedDict()
+        # Seconds the current call of each thread waited for a limiter.
+        self._local = threading.local()
+
+    def _stats(self, action):
+        # Must be called with the lock held.
+        stats = self.actions.get(action)
+        if stats is None:
+            stats = self.actions[action] = ActionStats()
+        return stats
+
+    def record(self, action, seconds, nbytes=0, error_code=None):
+        """Record a single API call
+
+        :type error_code: string
+        :param error_code: The AWS error code of a failed call, or the
+            exception class name for errors without a response.
+
+        """
+
+        with self.lock:
+            stats = self._stats(action)
+            stats.calls += 1
+            stats.bytes += nbytes
+            stats.latencies.append(seconds)
+            if error_code is not None:
+                stats.errors += 1
+                if error_code in THROTTLE_CODES:
+                    stats.throttled += 1
+
+    def throttle(self, action):
+        """Record a throttled attempt of a call that is retried"""
+
+        with self.lock:
+            self._stats(action).throttled += 1
+
+    def wait(self, action, seconds):
+        """Record time a call spent waiting before being sent
+
+        The time is left out of the latency of the instrumented call
+        running in the same thread.
+
+        """
+
+        with self.lock:
+            self._stats(action).wait += seconds
+        self._local.waited = getattr(self._local, "waited", 0.0) + seconds
+
+    def _waited(self):
+        # Return and reset the wait time of the current thread's call.
+        waited = getattr(self._local, "waited", 0.0)
+        self._local.waited = 0.0
+        return waited
+
+    def instrument(self, conn):
+        """Record every call made through a boto connection
+
+        A connection is wrapped once; instrumenting it again only
+        makes later calls count towards this instance instead.
+
+        :type conn: class:`boto.ec2.EC2Connection`
+        :param conn: The connection to instrument.
+
+        """
+
+        first = getattr(conn, "_api_metrics", None) is None
+        conn._api_metrics = self
+        if not first:
+            return
+
+        make_request = conn.make_request
+
+        def timed(action, params=None, path="/", verb="GET"):
+            metrics = conn._api_metrics
+            metrics._waited()
+            start = time.time()
+            try:
+                response = make_request(action, params, path, verb)
+                # boto caches the body, so reading it here costs
+                # nothing later and includes the transfer in the time.
+                body = response.read()
+            except BotoServerError, e:
+                metrics.record(action, time.time() - start -
+                               metrics._waited(), len(e.body or ""),
+                               e.error_code or str(e.status))
+                raise
+            except Exception, e:
+                metrics.record(action, time.time() - start -
+                               metrics._waited(),
+                               error_code=type(e).__name__)
+                raise
+
+            error_code = None
+            if response.status >= 400:
+                match = _ERROR_CODE.search(body)
+                error_code = match.group(1) if match else str(response.status)
+            metrics.record(action, time.time() - start - metrics._waited(),
+                           len(body), error_code)
+            return response
+
+        conn.make_request = timed
+
+    def _snapshot(self):
+        with self.lock:
+            return list(self.actions.items())
+
+    def summary(self):
+        """Return a text table of the metrics of every action"""
+
+        lines = ["{0:<22}{1:>8}{2:>8}{3:>10}{4:>12}{5:>9}{6:>9}{7:>9}"
+                 "{8:>10}{9:>9}".format("ACTION", "CALLS", "ERRORS",
+                                        "THROTTLED", "BYTES", "P50_MS",
+                                        "P90_MS", "P99_MS", "TOTAL_S",
+                                        "WAIT_S")]
+        for action, stats in self._snapshot():
+            lines.append("{0:<22}{1:>8}{2:>8}{3:>10}{4:>12}{5:>9.1f}{6:>9.1f}"
+                         "{7:>9.1f}{8:>10.2f}{9:>9.2f}".format(
+                             action, stats.calls, stats.errors,
+                             stats.throttled, stats.bytes,
+                             stats.quantile(0.5) * 1000,
+                             stats.quantile(0.9) * 1000,
+                             stats.quantile(0.99) * 1000,
+                             sum(stats.latencies), stats.wait))
+        return "\n".join(lines)
+
+    def prometheus(self):
+        """Return the metrics in the Prometheus text exposition format"""
+
+        actions = self._snapshot()
+        lines = []
+
+        for name, attr, help in [
+                ("requests_total", "calls", "EC2 API calls"),
+                ("errors_total", "errors", "EC2 API calls that failed"),
+                ("throttled_total", "throttled",
+                 "EC2 API call attempts rejected by request rate limits"),
+                ("response_bytes_total", "bytes",
+                 "Bytes received from the EC2 API")]:
+            lines.append("# HELP {0}_{1} {2}".format(PREFIX, name, help))
+            lines.append("# TYPE {0}_{1} counter".format(PREFIX, name))
+            for action, stats in actions:
+                lines.append('{0}_{1}{{action="{2}"}} {3}'.format(
+                    PREFIX, name, action, getattr(stats, attr)))
+
+        name = PREFIX + "_rate_limit_wait_seconds_total"
+        lines.append("# HELP {0} Time EC2 API calls waited for the client "
+                     "side rate limiter".format(name))
+        lines.append("# TYPE {0} counter".format(name))
+        for action, stats in actions:
+            lines.append('{0}{{action="{1}"}} {2:.6f}'.format(
+                name, action, stats.wait))
+
+        name = PREFIX + "_request_duration_seconds"
+        lines.append("# HELP {0} EC2 API call latency".format(name))
+        lines.append("# TYPE {0} histogram".format(name))
+        for action, stats in actions:
+            for bound, count in zip(BUCKETS, stats.buckets()):
+                lines.append('{0}_bucket{{action="{1}",le="{2}"}} {3}'.format(
+                    name, action, bound, count))
+            lines.append('{0}_bucket{{action="{1}",le="+Inf"}} {2}'.format(
+                name, action, stats.calls))
+            lines.append('{0}_sum{{action="{1}"}} {2:.6f}'.format(
+                name, action, sum(stats.latencies)))
+            lines.append('{0}_count{{action="{1}"}} {2}'.format(
+                name, action, stats.calls))
+
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Write the Prometheus metrics for the node exporter
+
+        The file is written next to `path` and renamed over it, so the
+        exporter never reads a partial file.
+
+        """
+
+        tmp = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(tmp, "w") as fp:
+            fp.write(self.prometheus())
+        os.rename(tmp, path)
+
+    def statsd_lines(self, prefix="simplesnapshot.api"):
+        """Return the metrics as StatsD counters and gauges"""
+
+        lines = []
+        for action, stats in self._snapshot():
+            key = "{0}.{1}".format(prefix, action)
+            lines.extend([
+                "{0}.calls:{1}|c".format(key, stats.calls),
+                "{0}.errors:{1}|c".format(key, stats.errors),
+                "{0}.throttled:{1}|c".format(key, stats.throttled),
+                "{0}.bytes:{1}|c".format(key, stats.bytes),
+                "{0}.wait_ms:{1}|c".format(key, int(stats.wait * 1000)),
+                "{0}.latency_p50:{1:.1f}|g".format(
+                    key, stats.quantile(0.5) * 1000),
+                "{0}.latency_p99:{1:.1f}|g".format(
+                    key, stats.quantile(0.99) * 1000),
+            ])
+        return lines
+
+    def send_statsd(self, address, prefix="simplesnapshot.api"):
+        """Send the metrics to a StatsD server over UDP
+
+        :type address: string
+        :param address: The server as 'host:port' or 'host', for
+            port `STATSD_PORT`.
+
+        """
+
+        host, _, port = address.partition(":")
+        port = int(port or STATSD_PORT)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            # Several metrics per packet, kept below a common MTU.
+            packet = []
+            for line in self.statsd_lines(prefix):
+                if packet and len("\n".join(packet + [line])) > 512:
+                    sock.sendto("\n".join(packet), (host, port))
+                    packet = []
+                packet.append(line)
+            if packet:
+                sock.sendto("\n".join(packet), (host, port))
+        finally:
+            sock.close()
@@ -0,0 +1,344 @@
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import csv
+import json
+import sys
+import threading
+import time
+
+from json.encoder import encode_basestring_ascii
+
+from collections import namedtuple, OrderedDict
+from operator import attrgetter
+
+Column = namedtuple("Column", ["name", "header", "width", "field"])
+
+# Every column that can be selected with `columns`. `field` is a format
+# string field of the snapshot (0) and the profile name of the row (1).
+COLUMNS = OrderedDict((x.name, x) for x in [
+    Column("profile", "PROFILE", 20, "1"),
+    Column("id", "SNAPSHOT_ID", 14, "0.id"),
+    Column("status", "STATUS", 10, "0.status"),
+    Column("progress", "%", 5, "0.progress"),
+    Column("start_time", "START_TIME", 25, "0.start_time"),
+    Column("region", "REGION", 15, "0.region.name"),
+    Column("volume_id", "VOLUME_ID", 13, "0.volume_id"),
+    Column("volume_size", "SIZE", 6, "0.volume_size"),
+    Column("description", "DESCRIPTION", 40, "0.description"),
+    Column("tags", "TAGS", 40, None),
+])
+
+DEFAULT_COLUMNS = ["id", "status", "progress", "start_time", "region",
+                   "volume_id", "description"]
+
+
+def parse_columns(columns):
+    """Parse a comma separated list of column names
+
+    :rtype: list
+    :return: A list of column names.
+
+    """
+
+    names = [x.strip() for x in columns.split(",") if x.strip()]
+    unknown = [x for x in names if x not in COLUMNS]
+    if unknown:
+        raise ValueError("Unknown column(s) {0}. Valid columns: {1}".format(
+            ", ".join(unknown), ", ".join(COLUMNS)))
+    return names
+
+
+class BufferedOutput(object):
+    """Collect output and write it to a file in chunks
+
+    Output is written once `rows` writes are pending or, if
+    `interval` is set, once `interval` seconds have passed since the
+    last write. Unicode output is encoded as UTF-8.
+
+    """
+
+    def __init__(self, fp, rows=1000, interval=None):
+        self.fp = fp
+        self.rows = rows
+        self.interval = interval
+        self.pending = []
+        self.flushed = time.time()
+
+    def write(self, data):
+        self.pending.append(data)
+        if len(self.pending) >= self.rows or (
+                self.interval is not None and
+                time.time() - self.flushed >= self.interval):
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            data = "".join(self.pending)
+            if isinstance(data, unicode):
+                data = data.encode("utf-8")
+            self.fp.write(data)
+            del self.pending[:]
+        self.fp.flush()
+        self.flushed = time.time()
+
+
+class SnapshotWriter(object):
+    """Base class for snapshot output formats
+
+    The selected columns are resolved once when the writer is created.
+    Call `header` once, `write` for every snapshot and `close` when
+    done.
+
+    """
+
+    rows = 1000
+    interval = None
+
+    def __init__(self, fp=None, columns=None, profile=False):
+        """Initialize a SnapshotWriter instance
+
+        :type fp: file
+        :param fp: The output file. Default is sys.stdout.
+
+        :type columns: list
+        :param columns: Names of the columns to write, see `COLUMNS`.
+            Default is `DEFAULT_COLUMNS`.
+
+        :type profile: boolean
+        :param profile: Write the profile of each row as the first
+            column, unless `columns` already includes it.
+
+        """
+
+        names = list(columns or DEFAULT_COLUMNS)
+        if profile and "profile" not in names:
+            names.insert(0, "profile")
+
+        self.columns = [COLUMNS[x] for x in names]
+        self.values = [self._value(x) for x in self.columns]
+        self.out = BufferedOutput(fp or sys.stdout, self.rows, self.interval)
+
+    def header(self):
+        pass
+
+    def write(self, snap, profile=None):
+        raise NotImplementedError("Must be defined in a subclass")
+
+    def flush(self):
+        """Write pending rows out now"""
+        self.out.flush()
+
+    def close(self):
+        self.out.flush()
+
+    @staticmethod
+    def _value(column):
+        # Return a function of (snap, profile) returning the raw value.
+        if column.name == "profile":
+            return lambda snap, profile: profile
+        if column.name == "region":
+            return lambda snap, profile: getattr(snap.region, "name", None)
+        if column.name == "tags":
+            return lambda snap, profile: snap.tags or {}
+        get = attrgetter(column.field[2:])
+        return lambda snap, profile: get(snap)
+
+    @staticmethod
+    def _text(value):
+        if isinstance(value, dict):
+            return ";".join("{0}={1}".format(k, v)
+                            for k, v in sorted(value.items()))
+        return value
+
+
+class TableWriter(SnapshotWriter):
+    """Fixed width text columns, the last column is not padded"""
+
+    def __init__(self, *args, **kwargs):
+        super(TableWriter, self).__init__(*args, **kwargs)
+
+        # Rows are formatted with a single format string built here.
+        # Columns without a field (tags) are converted to text first and
+        # passed as extra arguments.
+        last = len(self.columns) - 1
+        fields = []
+        headers = []
+        self.converted = []
+        for i, column in enumerate(self.columns):
+            field = column.field
+            if field is None:
+                field = str(2 + len(self.converted))
+                self.converted.append(self.values[i])
+            width = ":<{0}".format(column.width) if i < last else ""
+            fields.append("{" + field + width + "}")
+            headers.append(format(column.header, width[1:]))
+        self.format = "".join(fields) + "\n"
+        self.uformat = unicode(self.format)
+        self.headers = "".join(headers) + "\n"
+
+    def header(self):
+        self.out.write(self.headers)
+
+    def write(self, snap, profile=None):
+        args = (snap, profile)
+        if self.converted:
+            args += tuple(self._text(value(snap, profile))
+                          for value in self.converted)
+
+        try:
+            self.out.write(self.format.format(*args))
+        except UnicodeEncodeError:
+            # Formatting into a byte string is much faster and works
+            # for plain ASCII values, which are by far the most common.
+            self.out.write(self.uformat.format(*args))
+
+
+class CSVWriter(SnapshotWriter):
+    """Comma separated values with a header row"""
+
+    def __init__(self, *args, **kwargs):
+        super(CSVWriter, self).__init__(*args, **kwargs)
+        self.csv = csv.writer(self.out, lineterminator="\n")
+
+    def header(self):
+        self.csv.writerow([x.name for x in self.columns])
+
+    def write(self, snap, profile=None):
+        row = []
+        for value in self.values:
+            value = self._text(value(snap, profile))
+            if value is None:
+                value = ""
+            elif isinstance(value, unicode):
+                # The Python 2 csv module only handles byte strings.
+                value = value.encode("utf-8")
+            row.append(value)
+        self.csv.writerow(row)
+
+
+class NDJSONWriter(SnapshotWriter):
+    """One JSON object per line
+
+    Output is flushed often so that consumers can process a long
+    listing as a stream.
+
+    """
+
+    rows = 100
+    interval = 0.2
+
+    def __init__(self, *args, **kwargs):
+        super(NDJSONWriter, self).__init__(*args, **kwargs)
+
+        # Objects are built from a template holding the encoded keys,
+        # so they keep the column order. Columns holding strings (or
+        # None) are encoded with the C string encoder directly.
+        self.template = "{" + ", ".join(json.dumps(x.name) + ": %s"
+                                        for x in self.columns) + "}"
+        encode = json.JSONEncoder().encode
+        self.encoders = [encode if x.name in ("volume_size", "tags")
+                         else _encode_string for x in self.columns]
+
+    def _object(self, snap, profile):
+        return self.template % tuple([encode(value(snap, profile))
+                                      for encode, value in
+                                      zip(self.encoders, self.values)])
+
+    def write(self, snap, profile=None):
+        self.out.write(self._object(snap, profile) + "\n")
+
+
+def _encode_string(value):
+    if value is None:
+        return "null"
+    return encode_basestring_ascii(value)
+
+
+class JSONWriter(NDJSONWriter):
+    """A single JSON array of objects, written as rows arrive"""
+
+    rows = 1000
+    interval = None
+
+    def header(self):
+        self.out.write("[")
+        self.separator = "\n"
+
+    def write(self, snap, profile=None):
+        self.out.write(self.separator + self._object(snap, profile))
+        self.separator = ",\n"
+
+    def close(self):
+        self.out.write("\n]\n")
+        super(JSONWriter, self).close()
+
+
+class SharedWriter(object):
+    """A writer shared by consoles running at the same time
+
+    Rows of every console go into a single document: the header is
+    written by the first console asking for it, rows are written one
+    at a time, and `close` only flushes. `finish` closes the document
+    once every console is done.
+
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.lock = threading.Lock()
+        self.started = False
+
+    def header(self):
+        with self.lock:
+            if not self.started:
+                self.writer.header()
+                self.started = True
+
+    def write(self, snap, profile=None):
+        with self.lock:
+            self.writer.write(snap, profile)
+
+    def flush(self):
+        with self.lock:
+            self.writer.flush()
+
+    close = flush
+
+    def finish(self):
+        """Close the document, if any console started it"""
+        with self.lock:
+            if self.started:
+                self.writer.close()
+
+
+WRITERS = OrderedDict([
+    ("table", TableWriter),
+    ("json", JSONWriter),
+    ("ndjson", NDJSONWriter),
+    ("csv", CSVWriter),
+])
+
+
+def writer(output="table", fp=None, columns=None, profile=False):
+    """Create a SnapshotWriter for an output format
+
+    :type output: string
+    :param output: One of the `WRITERS` names.
+
+    :rtype: class:`SnapshotWriter`
+    :return: A writer instance.
+
+    """
+
+    return WRITERS[output](fp, columns, profile)
@@ -0,0 +1,306 @@
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Time spent in each phase of a command run
+
+SimpleSnapshot marks its phases, such as EC2 API requests, building
+snapshot records, sorting, filtering and output, with
+`profiler.phase(name)`. By default the profiler is `NULL_PROFILER`,
+which does nothing. A `RunProfiler` records the wall clock time, CPU
+time and optionally memory of every phase, and can run cProfile over
+the whole command.
+
+Phases may be nested. The time of a phase excludes the time of the
+phases run inside it, so the times of all phases add up to the time
+of the run.
+
+"""
+import os
+import platform
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+from StringIO import StringIO
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    # Python 3.4 and later, or the pytracemalloc backport for a
+    # patched Python 2.7.
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class _NullPhase(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullProfiler(object):
+    """A profiler that records nothing"""
+
+    _phase = _NullPhase()
+
+    def phase(self, name):
+        return self._phase
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class PhaseStats(object):
+    """Totals of a single phase"""
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.memory = 0
+
+
+class _Phase(object):
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self.name)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler._exit()
+        return False
+
+
+class RunProfiler(object):
+    """Thread safe timers of the phases of a command run"""
+
+    def __init__(self, cprofile=False, memory=False):
+        """Initialize a RunProfiler instance
+
+        :type cprofile: boolean
+        :param cprofile: Run cProfile between `start` and `stop`. Only
+            the thread calling `start` is profiled.
+
+        :type memory: boolean
+        :param memory: Record the memory of each phase. With tracemalloc
+            available this is the memory allocated and not yet freed by
+            the phase, otherwise the growth of the peak resident set
+            size of the process while the phase ran.
+
+        """
+
+        self.lock = threading.Lock()
+        self.phases = OrderedDict()
+        self.memory = memory
+        self.started = None
+        self.elapsed = 0.0
+        self._local = threading.local()
+        self._cprofile = None
+
+        if cprofile:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+
+    @property
+    def memory_source(self):
+        """The name of the memory measure, or None without `memory`"""
+        if not self.memory:
+            return None
+        if tracemalloc is not None:
+            return "tracemalloc"
+        return "ru_maxrss" if resource is not None else None
+
+    def _measure(self):
+        # Return (wall, cpu, memory) of the process right now. CPU time
+        # is for the whole process, as Python 2 can not read it per
+        # thread.
+        times = os.times()
+        memory = 0
+        source = self.memory_source
+        if source == "tracemalloc":
+            memory = tracemalloc.get_traced_memory()[0]
+        elif source == "ru_maxrss":
+            # Kilobytes on Linux, bytes on OS X.
+            memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if sys.platform != "darwin":
+                memory *= 1024
+        return time.time(), times[0] + times[1], memory
+
+    def phase(self, name):
+        """Return a context manager timing the phase `name`"""
+        return _Phase(self, name)
+
+    def _enter(self, name):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        # The phase, its start and the totals of its nested phases.
+        stack.append((name, self._measure(), [0.0, 0.0, 0]))
+
+    def _exit(self):
+        stack = self._local.stack
+        name, start, nested = stack.pop()
+        spent = [end - begin for end, begin in zip(self._measure(), start)]
+        if stack:
+            outer = stack[-1][2]
+            for i, value in enumerate(spent):
+                outer[i] += value
+
+        with self.lock:
+            stats = self.phases.get(name)
+            if stats is None:
+                stats = self.phases[name] = PhaseStats()
+            stats.calls += 1
+            stats.wall += spent[0] - nested[0]
+            stats.cpu += spent[1] - nested[1]
+            stats.memory += spent[2] - nested[2]
+
+    def start(self):
+        """Start timing the run"""
+
+        if self.memory_source == "tracemalloc" and \
+                not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.started = time.time()
+        if self._cprofile is not None:
+            self._cprofile.enable()
+
+    def stop(self):
+        """Stop timing the run"""
+
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self.started is not None:
+            self.elapsed += time.time() - self.started
+            self.started = None
+
+    def summary(self):
+        """Return a text table of the time spent in every phase
+
+        Time not spent in any phase is reported as '(other)'. With
+        several profiles or regions run concurrently, phases overlap
+        and their times add up to more than the time of the run.
+
+        """
+
+        with self.lock:
+            phases = list(self.phases.items())
+
+        unattributed = self.elapsed - sum(x.wall for _, x in phases)
+        if unattributed > 0:
+            other = PhaseStats()
+            other.wall = unattributed
+            phases.append(("(other)", other))
+
+        lines = ["{0:<12}{1:>8}{2:>10}{3:>10}{4:>8}".format(
+            "PHASE", "CALLS", "WALL_S", "CPU_S", "%WALL")]
+        if self.memory_source:
+            lines[0] += "{0:>12}".format("MEM_KB")
+
+        for name, stats in phases:
+            line = "{0:<12}{1:>8}{2:>10.3f}{3:>10.3f}{4:>8.1f}".format(
+                name, stats.calls, stats.wall, stats.cpu,
+                100.0 * stats.wall / self.elapsed if self.elapsed else 0.0)
+            if self.memory_source:
+                line += "{0:>12}".format(stats.memory // 1024)
+            lines.append(line)
+
+        lines.append("{0:<12}{1:>8}{2:>10.3f}".format("total", "",
+                                                      self.elapsed))
+        return "\n".join(lines)
+
+    def report(self, args=None, limit=30):
+        """Return a report of the run to attach to bug reports
+
+        :type args: class:`argparse.Namespace`
+        :param args: The parsed command line of the run, included in
+            the report.
+
+        :type limit: int
+        :param limit: The number of functions and allocation sites
+            listed from cProfile and tracemalloc.
+
+        """
+
+        import boto
+
+        out = StringIO()
+        out.write("ec2-simple-snapshot run profile\n\n")
+        out.write("date: {0}\n".format(
+            time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())))
+        out.write("python: {0} {1}\n".format(
+            platform.python_implementation(), platform.python_version()))
+        out.write("boto: {0}\n".format(boto.__version__))
+        out.write("platform: {0}\n".format(platform.platform()))
+        if args is not None:
+            out.write("arguments: {0}\n".format(" ".join(
+                "{0}={1!r}".format(k, v) for k, v in sorted(vars(args)
+                                                            .items()))))
+        if self.memory_source:
+            out.write("memory: {0}\n".format(self.memory_source))
+        out.write("\n{0}\n".format(self.summary()))
+
+        if self._cprofile is not None:
+            import pstats
+
+            out.write("\ncProfile, main thread, by cumulative time:\n")
+            pstats.Stats(self._cprofile, stream=out).sort_stats(
+                "cumulative").print_stats(limit)
+
+        if self.memory_source == "tracemalloc":
+            out.write("\ntracemalloc, memory held by line:\n")
+            stats = tracemalloc.take_snapshot().statistics("lineno")
+            for stat in stats[:limit]:
+                out.write("{0}\n".format(stat))
+
+        return out.getvalue()
+
+    def write(self, prefix, args=None):
+        """Write the report to `prefix`.txt and cProfile stats to
+        `prefix`.pstats
+
+        The stats file can be read with `pstats.Stats` or tools such as
+        snakeviz.
+
+        :rtype: list
+        :return: The paths of the files written.
+
+        """
+
+        paths = [prefix + ".txt"]
+        with open(paths[0], "w") as fp:
+            fp.write(self.report(args))
+
+        if self._cprofile is not None:
+            paths.append(prefix + ".pstats")
+            self._cprofile.dump_stats(paths[1])
+
+        return paths
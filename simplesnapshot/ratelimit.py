@@ -0,0 +1,366 @@
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Client side rate limiting of EC2 API calls
+
+EC2 throttles the calls of an account per region with token buckets
+per group of API actions, answering RequestLimitExceeded once a bucket
+is empty. The sizes of these buckets differ between accounts, so the
+limits here are learned from throttled calls. `RateLimiter.install`
+sends every call of a boto connection through:
+
+* a token bucket per API action. Its rate starts unlimited, or at a
+  given maximum, is halved when EC2 throttles a call of the action and
+  grows by about one call per second every second otherwise;
+* an additive increase, multiplicative decrease (AIMD) limit on the
+  number of calls in flight, halved when EC2 throttles a call and
+  grown by one for every limit's worth of successful calls;
+* retries of throttled calls after a jittered exponential backoff,
+  replacing boto's own retries of throttled calls.
+
+Bulk operations therefore slow down to the rate EC2 accepts instead of
+failing with throttled outcomes, and speed up again once it accepts
+more. Retried throttled attempts and the time spent waiting are
+reported to the `simplesnapshot.metrics.ApiMetrics` instrumenting the
+connection, if any.
+
+"""
+import random
+import threading
+import time
+
+from collections import Counter
+
+from boto.exception import BotoServerError
+
+from simplesnapshot.metrics import THROTTLE_CODES
+
+
+class TokenBucket(object):
+    """A thread safe token bucket with an AIMD rate
+
+    Callers reserve a token even if the bucket is empty and then sleep
+    until it would have been refilled, so waiting callers are served in
+    order.
+
+    """
+
+    def __init__(self, rate=None, burst=None, minimum=0.5, decrease=0.5,
+                 cooldown=1.0, clock=time.time, sleep=time.sleep):
+        """Initialize a TokenBucket instance
+
+        :type rate: float
+        :param rate: Tokens refilled per second, and the highest rate
+            the bucket grows back to after throttling. None leaves
+            calls unlimited until the first throttled call.
+
+        :type burst: int
+        :param burst: The bucket size. Defaults to one second worth of
+            tokens.
+
+        :type cooldown: float
+        :param cooldown: Seconds after a decrease during which further
+            throttled calls do not decrease the rate again, as calls
+            already in flight are likely throttled as well.
+
+        """
+
+        self.maximum = rate
+        self.rate = None if rate is None else float(rate)
+        self.burst = burst
+        self.minimum = minimum
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+        self.updated = self.window = clock()
+        self.tokens = self.capacity
+        self.sent = 0
+        self.measured = 0.0
+        self.decreased = None
+
+    @property
+    def capacity(self):
+        return float(self.burst or max(self.rate or 1, 1))
+
+    def acquire(self):
+        """Take a token, waiting for it if needed
+
+        :rtype: float
+        :return: The seconds waited.
+
+        """
+
+        with self.lock:
+            now = self.clock()
+            # The rate of calls over the last second or so, the
+            # starting point of the rate once a call is first throttled.
+            if now - self.window >= 1:
+                self.measured = self.sent / (now - self.window)
+                self.window, self.sent = now, 0
+            self.sent += 1
+
+            if self.rate is None:
+                return 0.0
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def success(self):
+        """Grow the rate by about one call per second every second"""
+        with self.lock:
+            if self.rate is not None:
+                self.rate += 1.0 / self.rate
+                if self.maximum is not None:
+                    self.rate = min(self.rate, self.maximum)
+
+    def throttled(self):
+        """Halve the rate after a throttled call"""
+        with self.lock:
+            now = self.clock()
+            if self.decreased is not None and \
+                    now - self.decreased < self.cooldown:
+                return
+
+            if self.rate is None:
+                self.rate = max(self.measured,
+                                self.sent / max(now - self.window, 1.0))
+            self.rate = max(self.minimum, self.rate * self.decrease)
+            # EC2 has no tokens left either.
+            self.tokens = min(self.tokens, 0)
+            self.updated = now
+            self.decreased = now
+
+
+class AdaptiveConcurrency(object):
+    """An AIMD limit on the number of calls in flight"""
+
+    def __init__(self, maximum=64, minimum=1, decrease=0.5, cooldown=1.0,
+                 clock=time.time):
+        """Initialize an AdaptiveConcurrency instance
+
+        :type maximum: int
+        :param maximum: The initial and highest limit.
+
+        :type decrease: float
+        :param decrease: The limit is multiplied by this factor when a
+            call is throttled.
+
+        :type cooldown: float
+        :param cooldown: Seconds after a decrease during which further
+            throttled calls do not decrease the limit again, as calls
+            already in flight are likely throttled as well.
+
+        """
+
+        self.maximum = float(maximum)
+        self.minimum = float(minimum)
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.clock = clock
+        self.limit = self.maximum
+        self.active = 0
+        self.decreased = None
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        """Wait until a call may be sent"""
+        with self.cond:
+            while self.active >= max(self.minimum, int(self.limit)):
+                self.cond.wait()
+            self.active += 1
+
+    def release(self):
+        """Mark a call acquired with `acquire` as done"""
+        with self.cond:
+            self.active -= 1
+            self.cond.notify()
+
+    def success(self):
+        """Grow the limit by one for every `limit` successful calls"""
+        with self.cond:
+            grown = min(self.maximum, self.limit + 1.0 / self.limit)
+            if int(grown) > int(self.limit):
+                self.cond.notify()
+            self.limit = grown
+
+    def throttled(self):
+        """Shrink the limit after a throttled call"""
+        with self.cond:
+            now = self.clock()
+            if self.decreased is None or \
+                    now - self.decreased >= self.cooldown:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self.decreased = now
+
+
+class RateLimiter(object):
+    """Rate and concurrency limits shared by the calls of connections
+
+    One limiter should be shared by every connection to the same
+    account and region, as EC2 limits them together.
+
+    """
+
+    def __init__(self, rate=None, burst=None, max_concurrency=64,
+                 max_retries=8, base_delay=0.25, max_delay=20.0,
+                 clock=time.time, sleep=time.sleep, random=random.random):
+        """Initialize a RateLimiter instance
+
+        :type rate: float
+        :param rate: The highest number of calls per second of every
+            API action. None leaves calls unlimited until EC2 throttles
+            them.
+
+        :type burst: int
+        :param burst: Calls of an action allowed at once. Defaults to
+            one second worth of calls.
+
+        :type max_concurrency: int
+        :param max_concurrency: The initial and highest number of calls
+            in flight.
+
+        :type max_retries: int
+        :param max_retries: Attempts after the first for throttled
+            calls. Also used by boto for calls failing with network
+            errors and other 5xx responses.
+
+        :type base_delay: float
+        :param base_delay: The backoff of the first retry is picked at
+            random up to this many seconds. The upper bound doubles with
+            every retry, up to `max_delay`.
+
+        """
+
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sleep = sleep
+        self.random = random
+        self.concurrency = AdaptiveConcurrency(max_concurrency, clock=clock)
+        self.buckets = {}
+        self.throttles = Counter()
+        self.lock = threading.Lock()
+
+    def bucket(self, action):
+        """Return the token bucket of `action`"""
+
+        with self.lock:
+            bucket = self.buckets.get(action)
+            if bucket is None:
+                bucket = self.buckets[action] = TokenBucket(
+                    self.rate, self.burst, clock=self.clock,
+                    sleep=self.sleep)
+            return bucket
+
+    def backoff(self, attempt):
+        """Return the seconds to wait before retry number `attempt` + 1
+
+        Waits are picked at random below an exponentially growing bound
+        ("full jitter"), so that throttled clients do not retry in step.
+
+        """
+
+        return self.random() * min(self.max_delay,
+                                   self.base_delay * 2 ** attempt)
+
+    def _retry_handler(self, action, retries, metrics=None):
+        # A boto retry handler, called with every response. Returning
+        # a (message, attempt, sleep) tuple makes boto send the request
+        # again.
+        def handler(response, attempt, next_sleep):
+            if response.status not in (400, 503):
+                return None
+
+            # boto caches the body, so it can still be read later.
+            error = BotoServerError(response.status, response.reason,
+                                    response.read())
+            if error.error_code not in THROTTLE_CODES:
+                return None
+
+            with self.lock:
+                self.throttles[action] += 1
+            self.bucket(action).throttled()
+            self.concurrency.throttled()
+            if attempt >= retries:
+                raise error
+
+            delay = self.backoff(attempt)
+            self.sleep(delay)
+            delay += self.bucket(action).acquire()
+            if metrics is not None:
+                metrics.throttle(action)
+                metrics.wait(action, delay)
+            return ("{0} throttled, retry {1}".format(action, attempt + 1),
+                    attempt + 1, 0)
+
+        return handler
+
+    def install(self, conn):
+        """Send every call made through a boto connection through the
+        limiter
+
+        A connection is wrapped once; installing another limiter only
+        makes later calls use that one instead.
+
+        :type conn: class:`boto.ec2.EC2Connection`
+        :param conn: The connection to limit.
+
+        """
+
+        first = getattr(conn, "_rate_limiter", None) is None
+        conn._rate_limiter = self
+        if not first:
+            return
+
+        mexe = conn._mexe
+
+        def limited(request, sender=None, override_num_retries=None,
+                    retry_handler=None):
+            limiter = conn._rate_limiter
+            metrics = getattr(conn, "_api_metrics", None)
+            action = request.params.get("Action")
+            retries = override_num_retries
+            if retries is None:
+                retries = limiter.max_retries
+
+            start = limiter.clock()
+            limiter.concurrency.acquire()
+            try:
+                waited = limiter.clock() - start
+                waited += limiter.bucket(action).acquire()
+                if metrics is not None:
+                    metrics.wait(action, waited)
+                response = mexe(request, sender, retries, retry_handler or
+                                limiter._retry_handler(action, retries,
+                                                       metrics))
+            finally:
+                limiter.concurrency.release()
+
+            if response.status < 400:
+                limiter.bucket(action).success()
+                limiter.concurrency.success()
+            return response
+
+        conn._mexe = limited
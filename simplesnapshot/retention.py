@@ -0,0 +1,129 @@
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from datetime import datetime
+
+_DAY = 86400
+_EPOCH = datetime(1970, 1, 1)
+
+
+class RetentionPolicy(object):
+    """A grandfather-father-son retention policy
+
+    The newest snapshot of each of the `daily` most recent days that
+    have snapshots is kept. Likewise for the `weekly` most recent ISO
+    weeks (Monday to Sunday) and the `monthly` most recent months. A
+    snapshot kept by more than one rule is only kept once. Days, weeks
+    and months are based on the UTC start time of the snapshots.
+
+    """
+
+    def __init__(self, daily=0, weekly=0, monthly=0):
+        """Initialize a RetentionPolicy instance
+
+        :type daily: int
+        :param daily: The number of daily snapshots to keep.
+
+        :type weekly: int
+        :param weekly: The number of weekly snapshots to keep.
+
+        :type monthly: int
+        :param monthly: The number of monthly snapshots to keep.
+
+        """
+
+        if min(daily, weekly, monthly) < 0:
+            raise ValueError("Retention counts must not be negative")
+        if not (daily or weekly or monthly):
+            raise ValueError("A retention policy must keep at least "
+                             "one daily, weekly or monthly snapshot")
+
+        self.daily = daily
+        self.weekly = weekly
+        self.monthly = monthly
+
+    def __repr__(self):
+        return ("RetentionPolicy(daily={0.daily}, weekly={0.weekly}, "
+                "monthly={0.monthly})".format(self))
+
+    def select(self, snapshots, keys=None):
+        """Split snapshots into the ones to keep and the ones to delete
+
+        Snapshots are bucketed in a single pass from newest to oldest.
+        The pass stops as soon as every daily, weekly and monthly slot
+        is filled, since every older snapshot is deleted.
+
+        :type snapshots: list
+        :param snapshots: Snapshots with a `date` attribute, sorted
+            newest to oldest.
+
+        :type keys: sequence
+        :param keys: The negated epoch timestamps of `snapshots`, as
+            stored in `SnapshotIndex.keys`. Computed when not given.
+
+        :rtype: tuple
+        :return: A tuple of (keep, delete) lists of indexes into
+            `snapshots`, both in newest to oldest order.
+
+        """
+
+        if keys is None:
+            keys = [-(x.date - _EPOCH).total_seconds() for x in snapshots]
+
+        daily, weekly, monthly = self.daily, self.weekly, self.monthly
+        last_day = last_week = last_month = None
+        keep = []
+
+        for i, key in enumerate(keys):
+            if not (daily or weekly or monthly):
+                stop = i
+                break
+
+            # Days since the epoch. Snapshots of the same day share their
+            # week and month, so those are only checked on a new day.
+            day = int(-key // _DAY)
+            if day == last_day:
+                continue
+            last_day = day
+
+            kept = False
+            if daily:
+                daily -= 1
+                kept = True
+
+            if weekly:
+                # The epoch was a Thursday; shift so weeks start Monday.
+                week = (day + 3) // 7
+                if week != last_week:
+                    last_week = week
+                    weekly -= 1
+                    kept = True
+
+            if monthly:
+                date = snapshots[i].date
+                month = date.year * 12 + date.month
+                if month != last_month:
+                    last_month = month
+                    monthly -= 1
+                    kept = True
+
+            if kept:
+                keep.append(i)
+        else:
+            stop = len(keys)
+
+        kept = set(keep)
+        delete = [i for i in xrange(stop) if i not in kept]
+        delete.extend(xrange(stop, len(keys)))
+
+        return keep, delete
@@ -0,0 +1,143 @@
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import threading
+
+
+class Session(object):
+    """EC2 connections shared by every profile, region and thread
+
+    One connection is created per profile and region, the first time
+    it is asked for. boto connections keep a thread safe pool of
+    keep-alive HTTP connections, so every SimpleSnapshot instance and
+    worker thread using the same profile and region reuses the same
+    TLS connections instead of opening new ones.
+
+    Credentials are read from the configuration file once per profile
+    and read again if the file changes, in which case the connections
+    of that profile are replaced.
+
+    The calls of every connection of a profile and region go through
+    one `simplesnapshot.ratelimit.RateLimiter`, which is kept when
+    connections are replaced.
+
+    """
+
+    def __init__(self, config="~/.aws/config", profile="default",
+                 endpoint_url=None, api_rate=None):
+        """Initialize a Session instance
+
+        :type config: string
+        :param config: The path to an AWS cli configuration file.
+
+        :type profile: string
+        :param profile: The profile used when none is given to
+            `connection`.
+
+        :type endpoint_url: string
+        :param endpoint_url: Send EC2 requests to this URL instead of
+            the AWS endpoint of the region.
+
+        :type api_rate: float
+        :param api_rate: Calls per second allowed per API action and
+            region. Defaults to the EC2 rate of each action; 0 disables
+            rate limiting.
+
+        """
+
+        self.config = config
+        self.profile = profile
+        self.endpoint_url = endpoint_url
+        self.api_rate = api_rate
+        self._lock = threading.Lock()
+        self._credentials = {}
+        self._connections = {}
+        self._limiters = {}
+
+    def credentials(self, profile=None):
+        """Return a copy of the configuration of `profile`
+
+        :rtype: dict
+        :return: A dictionary as returned by
+            `simplesnapshot.cmdline.read_config`.
+
+        """
+
+        with self._lock:
+            return dict(self._read(profile or self.profile)[1])
+
+    def connection(self, region=None, profile=None):
+        """Return the connection to EC2 in `region` for `profile`
+
+        :type region: string
+        :param region: The region name. Defaults to the region of the
+            profile.
+
+        :rtype: class:`boto.ec2.EC2Connection`
+        :return: A connection shared with every other caller asking for
+            the same profile and region.
+
+        """
+
+        # The command line module is light to import, but imports this
+        # module itself.
+        from simplesnapshot.cmdline import connect
+
+        profile = profile or self.profile
+        with self._lock:
+            mtime, config = self._read(profile)
+            region = region or config["region"]
+
+            cached = self._connections.get((profile, region))
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, connect(config, region, self.endpoint_url))
+                self._connections[(profile, region)] = cached
+
+                limiter = self._limiter(profile, region)
+                if limiter is not None:
+                    limiter.install(cached[1])
+
+        return cached[1]
+
+    def _limiter(self, profile, region):
+        # Return the RateLimiter of a profile and region, or None if
+        # rate limiting is disabled. Called with the lock held.
+        if self.api_rate == 0:
+            return None
+
+        from simplesnapshot.ratelimit import RateLimiter
+
+        limiter = self._limiters.get((profile, region))
+        if limiter is None:
+            limiter = self._limiters[(profile, region)] = RateLimiter(
+                self.api_rate)
+        return limiter
+
+    def _read(self, profile):
+        # Return the (mtime, config) of `profile`, reading the config
+        # file if it changed. Called with the lock held.
+        from simplesnapshot.cmdline import read_config
+
+        try:
+            mtime = os.stat(os.path.expanduser(self.config)).st_mtime
+        except (OSError, TypeError):
+            # A file-like object or a missing file, which read_config
+            # reports if it is read at all.
+            mtime = None
+
+        cached = self._credentials.get(profile)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, read_config(self.config, profile))
+            self._credentials[profile] = cached
+        return cached
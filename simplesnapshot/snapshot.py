@@ -14,9 +14,23 @@
 from __future__ import print_function
 
 import sys
+import uuid
 
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from boto.exception import EC2ResponseError
+from itertools import compress, ifilter, imap, islice
+from boto.ec2.snapshot import Snapshot
+from simplesnapshot.bulk import bulk_create, bulk_delete, wait_snapshots
+from simplesnapshot.journal import DeleteJournal
+from simplesnapshot.output import writer
+from simplesnapshot.profiling import NULL_PROFILER
+from simplesnapshot.session import Session
+from simplesnapshot.where import compile_where
+
+# Tag holding the id shared by the snapshots of one instance
+SET_TAG = "SnapshotSet"
 
 
 class SnapshotWrapper(object):
@@ -42,6 +56,175 @@ class SnapshotWrapper(object):
         return self._snapshot.__getattribute__(attr)
 
 
+def parse_timestamp(timestamp):
+    """Parse an AWS timestamp into a datetime object
+
+    Timestamps in the fixed 'YYYY-MM-DDTHH:MM:SS.mmmZ' format used by
+    AWS are sliced apart directly, which is much faster than
+    `datetime.strptime`. Any other format falls back to strptime.
+
+    :type timestamp: string
+    :param timestamp: A timestamp such as '2013-09-21T02:05:32.000Z'.
+        This assumes Amazon timestamps are always UTC.
+
+    :rtype: class:`datetime.datetime`
+    :return: A naive datetime instance in UTC.
+
+    """
+
+    if len(timestamp) == 24 and timestamp[19] == "." and timestamp[23] == "Z":
+        try:
+            return datetime(int(timestamp[0:4]), int(timestamp[5:7]),
+                            int(timestamp[8:10]), int(timestamp[11:13]),
+                            int(timestamp[14:16]), int(timestamp[17:19]),
+                            int(timestamp[20:23]) * 1000)
+        except ValueError:
+            pass
+
+    return datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def start_time_skew(snapshots):
+    """Return the spread of start times of snapshots in seconds
+
+    :type snapshots: list
+    :param snapshots: Snapshots with a `start_time` attribute.
+
+    :rtype: float
+    :return: Seconds between the earliest and latest start time, 0.0
+        for fewer than two snapshots.
+
+    """
+
+    dates = [parse_timestamp(x.start_time) for x in snapshots]
+    if len(dates) < 2:
+        return 0.0
+    return (max(dates) - min(dates)).total_seconds()
+
+
+def start_time_prefixes(start, end):
+    """Return 'start-time' filter values matching the days from `start`
+    to `end`
+
+    DescribeSnapshots filter values may contain '*' wildcards. Whole
+    years, whole months and runs of ten days are matched by a single
+    value such as '2013-*', '2013-09-*' or '2013-09-2*', the remaining
+    days by values such as '2013-09-21*'.
+
+    :type start: class:`datetime.datetime`
+    :param start: The first day matched.
+
+    :type end: class:`datetime.datetime`
+    :param end: The last day matched.
+
+    :rtype: list
+    :return: Filter values, oldest first.
+
+    """
+
+    day, end = start.date(), end.date()
+    one_day = timedelta(days=1)
+    values = []
+    while day <= end:
+        next_month = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+        last_of_month = next_month - one_day
+        last_of_decade = day.replace(day=min(last_of_month.day,
+                                             day.day // 10 * 10 + 9))
+
+        if day.month == 1 and day.day == 1 and \
+                day.replace(month=12, day=31) <= end:
+            values.append("{0:%Y}-*".format(day))
+            day = day.replace(year=day.year + 1)
+        elif day.day == 1 and last_of_month <= end:
+            values.append("{0:%Y-%m}-*".format(day))
+            day = next_month
+        elif day.day in (1, 10, 20, 30) and last_of_decade <= end:
+            values.append("{0:%Y-%m}-{1}*".format(day, day.day // 10))
+            day = last_of_decade + one_day
+        else:
+            values.append("{0:%Y-%m-%d}*".format(day))
+            day += one_day
+    return values
+
+
+class SnapshotRecord(object):
+    """Compact record of a boto.ec2.snapshot.Snapshot
+
+    Only the snapshot attributes used by this package are kept, in
+    slots rather than an instance dictionary, and the start time is
+    parsed once into the `date` attribute. Attribute names match those
+    of the boto Snapshot class. `tags` is None for untagged snapshots
+    and `region` is the RegionInfo shared by the connection.
+
+    """
+
+    __slots__ = ("id", "volume_id", "status", "progress", "start_time",
+                 "volume_size", "description", "tags", "region", "date")
+
+    def __init__(self, id, volume_id=None, status=None, progress=None,
+                 start_time=None, volume_size=None, description=None,
+                 tags=None, region=None):
+        self.id = id
+        self.volume_id = volume_id
+        self.status = status
+        self.progress = progress
+        self.start_time = start_time
+        self.volume_size = volume_size
+        self.description = description
+        self.tags = tags or None
+        self.region = region
+        self.date = parse_timestamp(start_time)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Build a record from a boto Snapshot instance"""
+
+        return cls(snapshot.id, snapshot.volume_id, snapshot.status,
+                   snapshot.progress, snapshot.start_time,
+                   snapshot.volume_size, snapshot.description,
+                   dict(snapshot.tags) if snapshot.tags else None,
+                   snapshot.region)
+
+    def __repr__(self):
+        return "SnapshotRecord:{0}".format(self.id)
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def epoch(date):
+    """Convert a naive UTC datetime into seconds since the epoch"""
+    return (date - _EPOCH).total_seconds()
+
+
+class SnapshotIndex(object):
+    """A date index over a list of snapshots sorted newest to oldest
+
+    Snapshot start times are kept as epoch timestamps in an array.
+    The timestamps are negated so the array is ascending, which lets
+    date based lookups use a binary search instead of a full pass.
+
+    """
+
+    def __init__(self, snapshots, keys=None):
+        self.snapshots = snapshots
+        if keys is None:
+            keys = array("d", (-epoch(x.date) for x in snapshots))
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def count_since(self, date):
+        """Return the number of snapshots taken at or after `date`
+
+        Since the snapshots are sorted newest to oldest, these are
+        the snapshots in the slice [0, count_since(date)).
+
+        """
+        return bisect_right(self.keys, -epoch(date))
+
+
 class SimpleSnapshot(object):
     """Base class for sorted snapshot discovery.
 
@@ -51,25 +234,37 @@ class SimpleSnapshot(object):
     during the discovery phase. See the constructor docstring for
     more information on filtering.
 
-    Each snapshot found is wrapped in a SnapshotWrapper instance.
+    Each snapshot found is converted into a SnapshotRecord instance.
     This allows us to easily sort the snapshot sequence by
     date. Sorting is done newest to oldest.
 
+    The sorted snapshots are indexed by date (see SnapshotIndex) so
+    that filtering and limiting only compute slice boundaries.
+
     The `get_snapshots` method returns a list of snapshots after
     filtering of that list has been done. It can also return the
     sequence of snapshots in reverse order. Please see `get_snapshots`
     docstring for more information.
 
+    Discovery, sorting and filtering are timed by `profiler`, a
+    `simplesnapshot.profiling.RunProfiler` when profiling a run.
+
     """
 
+    profiler = NULL_PROFILER
+
     def __init__(self, ec2_conn, snapshot_ids=[], count=0, limit=0,
                  count_type='num', filters={}, owner=["self"],
-                 from_date=datetime.utcnow()):
+                 from_date=None, page_size=0, catalog=None,
+                 retention=None, group_by=None, region=None,
+                 date_pushdown=False, where=None):
         """Initialize a SimpleSnapshot instance
 
-        :type conn: class:`boto.ec2.EC2Connection`
+        :type conn: class:`boto.ec2.EC2Connection` or
+            class:`simplesnapshot.session.Session`
         :param conn: An EC2Connection instance like that returned by
-            `boto.ec2.connect_to_region`
+            `boto.ec2.connect_to_region`, or a Session providing a
+            connection shared with other instances.
 
         :type snapshot_ids: list
         :param snapshot_ids: A list of EBS snapshot ids
@@ -90,7 +285,8 @@ class SimpleSnapshot(object):
         :param count_type: Controls the filter function used when
             searching for snapshots.
 
-            Valid values are 'num' or 'days'. Default is 'num'.
+            Valid values are 'num', 'days' or 'policy'. Default is
+            'num'. 'policy' matches the snapshots kept by `retention`.
 
         :type filters: dict
         :param filters: A dictionary of filters used to filter
@@ -110,10 +306,54 @@ class SimpleSnapshot(object):
         :param from_date: A datetime.datetime instance that is
             used for the base time of date based searches. This
             attribute is used for unit tests but may have other
-            good uses.
+            good uses. Default is the current UTC time when a search
+            is made.
+
+        :type page_size: int
+        :param page_size: Discover snapshots in pages of at most
+            `page_size` snapshots using MaxResults/NextToken. A value
+            of 0 requests every snapshot in a single call. Paging is
+            not used when `snapshot_ids` is set.
+
+        :type catalog: class:`simplesnapshot.catalog.SnapshotCatalog`
+        :param catalog: A local snapshot catalog. When set, a stored
+            discovery result is used instead of asking AWS, and new
+            discovery results are stored.
+
+        :type retention: class:`simplesnapshot.retention.RetentionPolicy`
+        :param retention: The retention policy used when `count_type`
+            is 'policy'.
+
+        :type group_by: string
+        :param group_by: Apply `count`, `retention` and `limit` to each
+            group of snapshots sharing a 'volume-id' or the value of a
+            tag, for example 'Name' or 'tag:Name', instead of to every
+            snapshot at once.
+
+        :type region: string
+        :param region: The region connected to when `conn` is a
+            Session. Defaults to the region of the session's profile.
+
+        :type date_pushdown: boolean
+        :param date_pushdown: When `count_type` is 'days', only request
+            snapshots started within the matched days from AWS, using
+            'start-time' filters, unless `filters` has its own
+            'start-time' filter. Snapshots outside the matched days are
+            then never discovered, so `get_snapshots` can not yield
+            them with `inverse` set.
+
+        :type where: string
+        :param where: An expression selecting snapshots on the client,
+            for example "size > 100 and not tag:Keep". See
+            `simplesnapshot.where`. `count`, `retention` and `limit`
+            apply to the matching snapshots only.
+
+        :raises: ValueError if `where` is not a valid expression.
 
         """
 
+        if isinstance(ec2_conn, Session):
+            ec2_conn = ec2_conn.connection(region)
         self.conn = ec2_conn
         self.snapshot_ids = snapshot_ids
         self.count = count
@@ -122,77 +362,303 @@ class SimpleSnapshot(object):
         self.filters = filters
         self.owner = owner
         self.from_date = from_date
+        self.page_size = page_size
+        self.catalog = catalog
+        self.retention = retention
+        self.group_by = group_by
+        self.date_pushdown = date_pushdown
+        self.where = where
+        self._predicate = compile_where(where) if where else None
 
         # set the filter function
         if self.count_type == "days":
             self._filter_func = self._by_days
         elif self.count_type == 'num':
             self._filter_func = self._by_num
+        elif self.count_type == 'policy':
+            if self.retention is None:
+                raise ValueError("count_type 'policy' requires a "
+                                 "retention policy")
+            self._filter_func = None
         else:
             raise ValueError("Invalid count_type: {0}".format(self.count_type))
 
         self._snapshots = None
+        self._index = None
+        self._groups = None
+        self._matched = None
 
     @property
-    def snapshots(self, update=False):
-        """A list of snapshots
+    def index(self):
+        """A SnapshotIndex over `snapshots`"""
+        if self._index is None or self._index.snapshots is not self.snapshots:
+            self._index = SnapshotIndex(self.snapshots)
 
-        :type update: boolean
-        :param update: If set to true, the list of raw snapshots
-            will be requested directly from AWS. If set to False,
-            a cached list of snapshots will be returned.
+        return self._index
 
-            Default value is False.
+    @property
+    def matched(self):
+        """The snapshots matching `where`
+
+        The expression is evaluated in a single pass over `snapshots`
+        and the result cached with them.
+
+        :rtype: tuple
+        :return: A (positions, index) tuple. `positions` are the indexes
+            of the matching snapshots in `snapshots` and `index` is a
+            SnapshotIndex over them. None if `where` is not set.
+
+        """
+
+        if self._predicate is None:
+            return None
+
+        snapshots = self.snapshots
+        if self._matched is None or self._matched[0] is not snapshots:
+            positions = list(compress(xrange(len(snapshots)),
+                                      imap(self._predicate, snapshots)))
+            keys = self.index.keys
+            index = SnapshotIndex([snapshots[i] for i in positions],
+                                  array("d", (keys[i] for i in positions)))
+            self._matched = (snapshots, (positions, index))
+
+        return self._matched[1]
+
+    @property
+    def groups(self):
+        """Snapshot groups built from `group_by`
+
+        Groups are built in a single pass over `snapshots`, so each
+        group is also sorted newest to oldest. Only snapshots matching
+        `where` are grouped.
+
+        :rtype: list
+        :return: A list of (key, positions, index) tuples. `positions`
+            are the indexes of the group's snapshots in `snapshots` and
+            `index` is a SnapshotIndex over the group.
+
+        """
+
+        snapshots = self.snapshots
+        if self._groups is None or self._groups[0] is not snapshots:
+            if self.group_by == "volume-id":
+                key = lambda snap: snap.volume_id
+            else:
+                name = self.group_by
+                if name.startswith("tag:"):
+                    name = name[4:]
+                key = lambda snap: (snap.tags or {}).get(name)
+
+            matched = self.matched
+            candidates = xrange(len(snapshots)) if matched is None \
+                else matched[0]
+            positions = OrderedDict()
+            for i in candidates:
+                positions.setdefault(key(snapshots[i]), []).append(i)
+
+            # Reuse the timestamps already computed for the full index.
+            keys = self.index.keys
+            groups = [(k, pos, SnapshotIndex([snapshots[i] for i in pos],
+                                             array("d", (keys[i]
+                                                         for i in pos))))
+                      for k, pos in positions.iteritems()]
+            self._groups = (snapshots, groups)
+
+        return self._groups[1]
+
+    @property
+    def snapshots(self):
+        """A list of snapshots
+
+        The list is discovered once and then cached. Use `refresh`
+        to request the list directly from AWS again.
 
         :rtype: list
         :return: The non-filtered list of snapshots.
 
         """
-        if update or self._snapshots is None:
+        if self._snapshots is None:
             self._find_snapshots()
 
         return self._snapshots
 
-    def _find_snapshots(self):
-        snaps = self.conn.get_all_snapshots(self.snapshot_ids,
-                                            owner=self.owner,
-                                            filters=self.filters)
-
-        # Wrap each snapshot and sort the list newest to oldest.
-        wrapped = [SnapshotWrapper(x) for x in snaps]
-        self._snapshots = sorted(wrapped, key=lambda snap: snap.date,
-                                 reverse=True)
-
-    def _by_days(self, inverse=False):
-        max_date = self.from_date + timedelta(days=-self.count)
-        for snap in self.snapshots:
-            if self.count <= 0:
-                # Negative count disables count so return all
-                # snapshots.
-                yield snap
-            elif inverse:
-                if snap.date < max_date:
-                    yield snap
-            elif snap.date >= max_date:
-                yield snap
-
-    def _by_num(self, inverse=False):
-        # We do not want a list slice done with a negative
-        # number. A negative count therefore disables count
-        # altogether.
-        count = self.count if self.count > 0 else None
+    def refresh(self):
+        """Discover snapshots from AWS, bypassing every cache"""
+
+        self._find_snapshots(refresh=True)
+
+    def _find_snapshots(self, refresh=False):
+        # Building records includes reading them from the catalog;
+        # the requests themselves are timed as the 'api' phase.
+        with self.profiler.phase("records"):
+            if self.catalog is None:
+                wrapped = list(self.iter_snapshots())
+            else:
+                key = self.catalog.key(self.owner, self.discovery_filters(),
+                                       self.snapshot_ids)
+                wrapped = None if refresh else self.catalog.load(key)
+                if wrapped is None:
+                    wrapped = list(self.iter_snapshots())
+                    self.catalog.store(key, wrapped)
+
+        # Sort the snapshot records newest to oldest.
+        with self.profiler.phase("sort"):
+            wrapped.sort(key=lambda snap: snap.date, reverse=True)
+        self._snapshots = wrapped
+
+    def discovery_filters(self):
+        """Return the filters sent with DescribeSnapshots requests
+
+        These are `filters`, plus the 'start-time' values of the days
+        matched by a 'days' count when `date_pushdown` is set.
+
+        :rtype: dict
+        :return: The filters, `filters` itself when nothing is added.
+
+        """
+
+        if not self.date_pushdown or self.count_type != "days" or \
+                self.count <= 0 or "start-time" in self.filters:
+            return self.filters
+
+        # A 'days' count also matches snapshots newer than `from_date`,
+        # so match every day up to tomorrow in case the local clock is
+        # behind.
+        now = datetime.utcnow()
+        filters = dict(self.filters)
+        filters["start-time"] = start_time_prefixes(
+            self._max_date(),
+            max(now, self.from_date or now) + timedelta(days=1))
+        return filters
+
+    def _pages(self):
+        filters = self.discovery_filters()
+        if self.page_size <= 0 or self.snapshot_ids:
+            with self.profiler.phase("api"):
+                page = self.conn.get_all_snapshots(self.snapshot_ids,
+                                                   owner=self.owner,
+                                                   filters=filters)
+            yield page
+            return
+
+        # Same request get_all_snapshots builds, plus paging params.
+        params = {"MaxResults": str(self.page_size)}
+        if self.owner:
+            params["Owner"] = self.owner
+        if filters:
+            self.conn.build_filter_params(params, filters)
+
+        while True:
+            with self.profiler.phase("api"):
+                page = self.conn.get_list("DescribeSnapshots", dict(params),
+                                          [("item", Snapshot)], verb="POST")
+            yield page
+
+            # EC2 answers with a lower case nextToken element, which
+            # ResultSet stores as an attribute of the same name.
+            token = getattr(page, "nextToken", None) or page.next_token
+            if not token:
+                break
+            params["NextToken"] = token
+
+    def iter_snapshots(self):
+        """A generator method that yields snapshots as they are discovered
+
+        Snapshots are requested page by page when `page_size` is set,
+        so the first snapshots are available before discovery has
+        finished. Snapshots are converted into records but not sorted
+        or cached.
+
+        :rtype: generator
+        :return: Yields SnapshotRecord instances in API order.
+
+        """
+
+        from_snapshot = SnapshotRecord.from_snapshot
+        for page in self._pages():
+            for snap in page:
+                yield from_snapshot(snap)
+
+    def stream_snapshots(self):
+        """A generator method that yields filtered, unsorted snapshots
+
+        Unlike `get_snapshots`, snapshots are yielded while discovery
+        is still running. Since no sorting takes place, a 'days' count
+        is applied to each snapshot on its own while a 'num' count and
+        `limit` simply cap the number of snapshots yielded. Snapshots
+        not matching `where` are skipped before counting.
+
+        :rtype: generator
+        :return: Yields SnapshotRecord instances in API order.
+
+        """
+
+        snapshots = self.iter_snapshots()
+        if self._predicate is not None:
+            snapshots = ifilter(self._predicate, snapshots)
+        caps = [self.limit]
+        if self.count_type == "days" and self.count > 0:
+            max_date = self._max_date()
+            snapshots = (x for x in snapshots if x.date >= max_date)
+        else:
+            caps.append(self.count)
+
+        caps = [x for x in caps if x > 0]
+        return islice(snapshots, min(caps) if caps else None)
+
+    def _max_date(self):
+        # The oldest date matched by a 'days' count. The current time
+        # is read on every search, as instances may be long lived.
+        from_date = self.from_date or datetime.utcnow()
+        return from_date + timedelta(days=-self.count)
+
+    # The filter functions return the (start, stop) boundaries of the
+    # matched slice of the newest to oldest snapshots in `index`.
+
+    def _by_days(self, index, inverse=False):
+        total = len(index)
+        if self.count <= 0:
+            # Negative count disables count so return all
+            # snapshots.
+            return 0, total
+
+        matched = index.count_since(self._max_date())
+        if inverse:
+            return matched, total
+        return 0, matched
+
+    def _by_num(self, index, inverse=False):
+        total = len(index)
+        # A negative count disables count altogether.
+        if self.count <= 0:
+            return 0, total
+
+        matched = min(self.count, total)
         if inverse:
             # Return the slice that is outside of the matched set.
-            return (x for x in self.snapshots[count:])
-        else:
-            return (x for x in self.snapshots[:count])
+            return matched, total
+        return 0, matched
+
+    def retain(self):
+        """Apply the retention policy to `snapshots`
+
+        :rtype: tuple
+        :return: A tuple of (keep, delete) lists of snapshots, both
+            sorted newest to oldest.
+
+        """
+
+        snapshots = self.snapshots
+        keep, delete = self.retention.select(snapshots, self.index.keys)
+        return ([snapshots[i] for i in keep], [snapshots[i] for i in delete])
 
     def get_snapshots(self, inverse=False):
         """A generator method that yields snapshots after filtering
 
         :type inverse: boolean
         :param inverse: Yield snapshots from oldest to newest instead
-            of the default newest to oldest.
+            of the default newest to oldest. The snapshots not matched
+            by the filter are yielded instead.
 
         :rtype: generator
         :return: Yields individual snapshots after filtering. The
@@ -201,18 +667,50 @@ class SimpleSnapshot(object):
 
         """
 
-        snapshots = list(self._filter_func(inverse=inverse))
-        if inverse:
-            snapshots.reverse()
-
-        counter = 0
-        for snap in snapshots:
-            if self.limit > 0 and counter >= self.limit:
-                break
+        if inverse and self.discovery_filters() is not self.filters:
+            raise ValueError("date_pushdown discovers only the matched "
+                             "snapshots, not the unmatched ones")
+
+        snapshots = self.snapshots
+        with self.profiler.phase("filter"):
+            if self.group_by is None and self._predicate is None:
+                indexes = self._select(self.index, inverse)
+            elif self.group_by is None:
+                positions, index = self.matched
+                indexes = [positions[i] for i in self._select(index, inverse)]
             else:
-                yield snap
+                # Matched positions of every group, merged back into
+                # date order.
+                indexes = []
+                for key, positions, index in self.groups:
+                    indexes.extend(positions[i]
+                                   for i in self._select(index, inverse))
+                indexes.sort(reverse=inverse)
+
+        for i in indexes:
+            yield snapshots[i]
+
+    def _select(self, index, inverse=False):
+        # Return the positions in `index` matched by the filter function
+        # or retention policy, after applying `limit`.
+        if self._filter_func is None:
+            # Retention policies match a set of snapshots, not a slice.
+            keep, delete = self.retention.select(index.snapshots,
+                                                 index.keys)
+            indexes = delete[::-1] if inverse else keep
+            if self.limit > 0:
+                indexes = indexes[:self.limit]
+            return indexes
+
+        start, stop = self._filter_func(index, inverse=inverse)
+        if inverse:
+            if self.limit > 0:
+                start = max(start, stop - self.limit)
+            return xrange(stop - 1, start - 1, -1)
 
-            counter += 1
+        if self.limit > 0:
+            stop = min(stop, start + self.limit)
+        return xrange(start, stop)
 
     def run(self):
         raise NotImplementedError("Must be defined in a subclass")
@@ -220,6 +718,12 @@ class SimpleSnapshot(object):
 
 class SimpleSnapshotConsole(SimpleSnapshot):
 
+    # Set by `simplesnapshot.fanout.run_consoles` when several consoles
+    # write to the same output, with the 'profile/region' label that
+    # tells their summaries apart.
+    shared_writer = None
+    summary_label = None
+
     def __init__(self, *args, **kwargs):
         """A console based driver for SimpleSnapshot
 
@@ -235,20 +739,110 @@ class SimpleSnapshotConsole(SimpleSnapshot):
             during the snapshot creation process. Each Key/Value pair
             is maped to an AWS Tag Name and Value.
 
+        :type volume_ids: list
+        :param volume_ids: Volume ids snapshotted by the `create` command.
+
+        :type volume_filters: dict
+        :param volume_filters: Filters selecting further volumes to
+            snapshot with the `create` command, for example
+            {'tag:Backup': 'true'}.
+
         :type volume_id: string
-        :param volume_id: A volume_id string used by the `create` command.
+        :param volume_id: A single volume id used by the `create`
+            command. Kept for compatibility, use `volume_ids`.
+
+        :type instance_id: string
+        :param instance_id: Snapshot every volume attached to this
+            instance as one set with the `create` command. See
+            `create`.
+
+        :type max_skew: float
+        :param max_skew: Make the `create` command fail when the start
+            times of an instance's snapshots are further apart than
+            this many seconds. Default is no limit.
 
         :type dry_run: boolean
         :param dry_run: Enable dry_run mode for create and delete
             actions.
 
+        :type workers: int
+        :param workers: The number of concurrent create or delete
+            requests used by the `create` and `delete` commands.
+            Default is 1.
+
+        :type profile: string
+        :param profile: When set, every output row is tagged with this
+            profile name. Used when running against several accounts.
+
+        :type stream: boolean
+        :param stream: Make the `list` command print snapshots as they
+            are discovered instead of sorted by date. See
+            `stream_snapshots`.
+
+        :type output: string
+        :param output: The output format of snapshot listings: 'table',
+            'json', 'ndjson' or 'csv'. Default is 'table'.
+
+        :type columns: list
+        :param columns: The columns of snapshot listings. See
+            `simplesnapshot.output.COLUMNS`.
+
+        :type wait: boolean
+        :param wait: Make the `create` command wait for the new
+            snapshots to complete, printing their progress.
+
+        :type wait_timeout: float
+        :param wait_timeout: Seconds to wait for new snapshots before
+            giving up. Default is 3600.
+
+        :type poll_interval: float
+        :param poll_interval: The initial number of seconds between
+            checks of the new snapshots. Default is 5.
+
+        :type journal: string
+        :param journal: The path of a `DeleteJournal`. The `delete`
+            command writes its candidates there before deleting them
+            and records the outcome of every delete. Dry runs do not
+            write a journal.
+
+        :type plan_info: dict
+        :param plan_info: Further values written to the header of plans
+            in `journal`, such as the profile they were made for.
+
+        :type plan_only: boolean
+        :param plan_only: Make the `delete` command stop after writing
+            its candidates to `journal`.
+
+        :type resume: boolean
+        :param resume: Make the `delete` command delete the snapshots
+            of the plan in `journal` that are not gone yet, instead of
+            discovering snapshots.
+
         """
 
         self.auto_confirm = kwargs.pop('auto_confirm', None)
         self.description = kwargs.pop('description', "")
         self.tags = kwargs.pop('tags', {})
-        self.volume_id = kwargs.pop('volume_id', None)
+        self.volume_ids = list(kwargs.pop('volume_ids', []))
+        self.volume_filters = kwargs.pop('volume_filters', {})
+        self.instance_id = kwargs.pop('instance_id', None)
+        self.max_skew = kwargs.pop('max_skew', None)
+        volume_id = kwargs.pop('volume_id', None)
+        if volume_id is not None:
+            self.volume_ids.append(volume_id)
         self.dry_run = kwargs.pop('dry_run', False)
+        self.workers = kwargs.pop('workers', 1)
+        self.profile = kwargs.pop('profile', None)
+        self.stream = kwargs.pop('stream', False)
+        self.output = kwargs.pop('output', "table")
+        self.columns = kwargs.pop('columns', None)
+        self.wait = kwargs.pop('wait', False)
+        self.wait_timeout = kwargs.pop('wait_timeout', 3600)
+        self.poll_interval = kwargs.pop('poll_interval', 5)
+        self.journal = kwargs.pop('journal', None)
+        self.plan_info = kwargs.pop('plan_info', {})
+        self.plan_only = kwargs.pop('plan_only', False)
+        self.resume = kwargs.pop('resume', False)
 
         super(SimpleSnapshotConsole, self).__init__(*args, **kwargs)
 
@@ -257,60 +851,209 @@ class SimpleSnapshotConsole(SimpleSnapshot):
 
         Gather a list of snapshots based on owner and filter information.
         The snapshots will be listed from the most recent start_time to the
-        oldest start_time.
+        oldest start_time, unless `stream` is set. Retention policies
+        and groups need the sorted list, so `stream` is ignored for them.
 
         """
 
-        self.output_header()
-        for snap in self.get_snapshots():
-            self.output_snap(snap)
+        if self.stream and not (self.retention or self.group_by):
+            snapshots = self.stream_snapshots()
+        else:
+            snapshots = self.get_snapshots()
 
-    def create(self):
-        """Create a snapshot for `volume_id`
+        self.output_snapshots(snapshots)
+
+    def resolve_volumes(self):
+        """Resolve `volume_ids` and `volume_filters` to volumes
 
-        Description and tags are also set based off the
-        `description` and `tags` instance attributes.
+        A single DescribeVolumes request is made. As with snapshot ids
+        and filters, volumes given by id must also match the filters.
+        With `instance_id` set, only volumes attached to that instance
+        match.
+        Without filters every id is kept, so an unknown id does not
+        fail the whole request; it is reported by its CreateSnapshot
+        request instead.
+
+        :rtype: class:`collections.OrderedDict`
+        :return: Maps volume ids to their Name tag, or None for
+            volumes without one.
 
         """
 
-        prompt = "Create snapshot for {0}".format(self.volume_id)
-        if self.auto_confirm or self.confirm(prompt):
-            self.output_header()
-            try:
-                snap = self.conn.create_snapshot(self.volume_id,
-                                                 description=self.description,
-                                                 dry_run=self.dry_run)
+        filters = dict(self.volume_filters)
+        if self.instance_id:
+            filters["attachment.instance-id"] = self.instance_id
+        if self.volume_ids:
+            # A filter rather than VolumeId parameters, which would fail
+            # the request for any unknown id.
+            filters["volume-id"] = self.volume_ids
+
+        names = dict((x.id, x.tags.get("Name"))
+                     for x in self.conn.get_all_volumes(filters=filters))
+
+        if self.volume_filters or self.instance_id:
+            ids = [x for x in self.volume_ids if x in names] or sorted(names)
+        else:
+            ids = self.volume_ids
+
+        return OrderedDict((x, names.get(x)) for x in ids)
+
+    def create(self):
+        """Create a snapshot for every volume in `volume_ids`
+
+        Volumes matching `volume_filters` are snapshotted as well.
+        CreateSnapshot requests are issued by `workers` concurrent
+        threads, then the new snapshots are tagged with their volume's
+        Name tag and the `tags` instance attribute using as few
+        CreateTags requests as possible. The description is set from
+        the `description` instance attribute.
 
-                self.output_snap(snap)
+        With `instance_id` set, every CreateSnapshot request of the
+        instance's volumes is sent at once to keep their start times as
+        close as possible. The snapshots are tagged with a shared
+        `SET_TAG` and the spread of their start times is reported,
+        failing the run if it exceeds `max_skew`.
 
-                if self.tags:
-                    self.conn.create_tags(snap.id, self.tags,
-                                          dry_run=self.dry_run)
+        With `wait` set, the new snapshots are then polled until they
+        complete or `wait_timeout` passes, and a row is printed every
+        time a snapshot makes progress.
 
-            except EC2ResponseError, e:
-                self._handle_error(e)
+        """
+
+        volumes = self.resolve_volumes()
+        if not volumes:
+            print("No volumes match the given filters", file=sys.stderr)
+            return
+
+        tags, workers = self.tags, self.workers
+        if self.instance_id:
+            prompt = "Create snapshots for {0} volumes of {1}".format(
+                len(volumes), self.instance_id)
+            tags = dict(tags, **{SET_TAG: "{0}-{1}".format(
+                self.instance_id, uuid.uuid4().hex[:8])})
+            workers = len(volumes)
+        elif len(volumes) == 1:
+            prompt = "Create snapshot for {0}".format(next(iter(volumes)))
+        else:
+            prompt = "Create snapshots for {0} volumes".format(len(volumes))
+
+        if self.auto_confirm or self.confirm(prompt):
+            with self.profiler.phase("create"):
+                result = bulk_create(self.conn, volumes,
+                                     description=self.description,
+                                     tags=tags, workers=workers,
+                                     dry_run=self.dry_run)
+
+            out = self.make_writer()
+            if result.snapshots:
+                out.header()
+                for snap in result.snapshots:
+                    out.write(snap, self.profile)
+                out.flush()
+
+            if self.catalog is not None:
+                self.catalog.invalidate()
+
+            self.output_summary(result)
+            failed = bool(result.errors)
+            if self.instance_id and result.snapshots:
+                failed = not self.check_skew(result.snapshots,
+                                             tags[SET_TAG]) or failed
+
+            if self.wait and result.snapshots and not self.dry_run:
+                def progress(snapshots):
+                    for snap in snapshots:
+                        out.write(snap, self.profile)
+                    out.flush()
+
+                with self.profiler.phase("wait"):
+                    waited = wait_snapshots(self.conn, result.snapshots,
+                                            timeout=self.wait_timeout,
+                                            interval=self.poll_interval,
+                                            progress=progress)
+                self.output_summary(waited)
+                failed = failed or bool(waited.errors)
+
+            if result.snapshots:
+                out.close()
+            if failed:
+                return 1
 
     def delete(self):
         """Delete snapshots starting from the oldest
 
         Snapshots are always sorted by date. Deletion begins from the oldest
         snapshot and continues up until the newest snapshot. You can limit
-        the number of deletions by using the `count` and `limit` attributes.
+        the number of deletions by using the `count` and `limit` attributes,
+        or delete every snapshot not kept by a retention policy.
+
+        Deletes are issued by `workers` concurrent threads. A failed
+        delete does not stop the rest of the batch; a summary of all
+        outcomes is printed once every snapshot has been processed.
+
+        With `journal` set, the candidates are written to the journal
+        before deleting starts and each outcome is recorded as it
+        comes in, so that an interrupted run can be continued with
+        `resume` without discovering snapshots again.
 
         """
 
-        candidates = list(self.get_snapshots(inverse=True))
-        self.output_header()
-        for snap in candidates:
-            self.output_snap(snap)
+        journal = None
+        if self.journal is not None:
+            journal = DeleteJournal(self.journal)
 
-        if self.auto_confirm or self.confirm("Delete Snapshots?"):
+        if self.resume:
             try:
-                for snap in candidates:
-                    snap.delete(dry_run=self.dry_run)
+                journal.load(self.conn.region)
+            except (IOError, ValueError), e:
+                print(e, file=sys.stderr)
+                return 1
+
+            region = getattr(self.conn.region, "name", None)
+            if journal.info.get("region") not in (None, region):
+                print("{0} is a plan for region {1}, not {2}".format(
+                    journal.path, journal.info["region"], region),
+                    file=sys.stderr)
+                return 1
+
+            candidates = journal.pending()
+            print("{0}: {1} of {2} planned snapshots left".format(
+                journal.path, len(candidates), len(journal.snapshots)),
+                file=sys.stderr)
+        else:
+            candidates = list(self.get_snapshots(inverse=True))
+            if journal is not None and (self.plan_only or
+                                        not self.dry_run):
+                journal.write_plan(
+                    candidates,
+                    region=getattr(self.conn.region, "name", None),
+                    **self.plan_info)
+
+        self.output_snapshots(candidates)
+        if self.plan_only:
+            print("Plan of {0} snapshots written to {1}".format(
+                len(candidates), journal.path), file=sys.stderr)
+            return
+
+        progress = None
+        if journal is not None and not self.dry_run:
+            progress = journal.record
 
-            except EC2ResponseError, e:
-                self._handle_error(e)
+        if self.auto_confirm or self.confirm("Delete Snapshots?"):
+            try:
+                with self.profiler.phase("delete"):
+                    result = bulk_delete(self.conn, candidates,
+                                         workers=self.workers,
+                                         dry_run=self.dry_run,
+                                         progress=progress)
+            finally:
+                if journal is not None:
+                    journal.close()
+            if self.catalog is not None:
+                self.catalog.discard(result.gone)
+            self.output_summary(result)
+            if result.errors:
+                return 1
 
     def run(self, command):
         """Execute the command method
@@ -324,27 +1067,66 @@ class SimpleSnapshotConsole(SimpleSnapshot):
 
         return getattr(self, command)()
 
-    def _handle_error(self, error):
-        if error.error_code == "DryRunOperation":
-            print("{0}: {1}".format(error.error_code, error.error_message))
-        else:
-            raise
+    def make_writer(self, fp=None):
+        """Create a SnapshotWriter for the `output` format and `columns`
 
-    @staticmethod
-    def output_snap(snap):
-        """Prints a single Snapshot's Information"""
+        Returns `shared_writer` instead when it is set and no `fp` is
+        given.
 
-        print("{0.id:<14}{0.status:<10}{0.progress:<5}{0.start_time:<25}"
-              "{0.region.name:<15}{0.volume_id:<13}"
-              "{0.description}".format(snap))
+        """
 
-    @staticmethod
-    def output_header():
-        """Prints a header for snapshot information"""
-        colums = ["SNAPSHOT_ID", "STATUS", "%", "START_TIME", "REGION",
-                  "VOLUME_ID", "DESCRIPTION"]
-        print("{0:<14}{1:<10}{2:<5}{3:<25}{4:<15}{5:<13}"
-              "{6}".format(*colums))
+        if fp is None and self.shared_writer is not None:
+            return self.shared_writer
+        return writer(self.output, fp, columns=self.columns,
+                      profile=self.profile is not None)
+
+    def output_snapshots(self, snapshots):
+        """Prints a header and every snapshot in `snapshots`"""
+
+        with self.profiler.phase("output"):
+            out = self.make_writer()
+            out.header()
+            for snap in snapshots:
+                out.write(snap, self.profile)
+            out.close()
+
+    def check_skew(self, snapshots, set_id):
+        """Report the start time spread of a snapshot set
+
+        :rtype: boolean
+        :return: False if the spread exceeds `max_skew`.
+
+        """
+
+        skew = start_time_skew(snapshots)
+        print("{0}: {1} snapshots, start time skew {2:.3f}s".format(
+            set_id, len(snapshots), skew),
+            file=sys.stdout if self.output == "table" else sys.stderr)
+
+        if self.max_skew is not None and skew > self.max_skew:
+            print("{0}: start time skew {1:.3f}s exceeds the maximum of "
+                  "{2}s".format(set_id, skew, self.max_skew),
+                  file=sys.stderr)
+            return False
+        return True
+
+    def output_summary(self, result):
+        """Prints the outcome of a bulk operation
+
+        Machine readable listings are kept parsable by printing the
+        summary to stderr. The summary starts with `summary_label`, if
+        set.
+
+        """
+
+        for resource_id, outcome, message in result.errors:
+            print("{0}: {1}: {2}".format(resource_id, outcome, message),
+                  file=sys.stderr)
+        summary = result.summary()
+        if self.summary_label:
+            summary = "{0}: {1}".format(self.summary_label, summary)
+        print(summary,
+              file=sys.stdout if self.output == "table" else sys.stderr)
 
     @staticmethod
     def confirm(prompt):
@@ -0,0 +1,556 @@
+#!/usr/bin/env python
+# Copyright (c) 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A local HTTP stand-in for the EC2 Query API calls used by this tool
+
+Only the calls needed by ec2-simple-snapshot are implemented:
+DescribeSnapshots (with filters and MaxResults/NextToken paging),
+CreateSnapshot, DeleteSnapshot, CreateTags and DescribeVolumes, which
+boto calls before every CreateSnapshot. Per call latency,
+RequestLimitExceeded throttling and InvalidSnapshot.InUse responses
+can be injected so that concurrency and retry behaviour can be
+measured end to end on one machine. Authentication is not checked.
+
+"""
+from __future__ import print_function
+
+import random
+import socket
+import sys
+import threading
+import time
+import uuid
+
+from argparse import ArgumentParser
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from fnmatch import fnmatch
+from urlparse import parse_qsl, urlparse
+from xml.sax.saxutils import escape
+
+XMLNS = "http://ec2.amazonaws.com/doc/2013-10-01/"
+OWNER_ID = "123456789012"
+
+
+class StandinError(Exception):
+    """An EC2 error response"""
+
+    def __init__(self, status, code, message):
+        Exception.__init__(self, message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+class TokenBucket(object):
+    """A thread safe token bucket refilled at `rate` tokens a second"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Take a token, returning False if the bucket is empty"""
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class StandinEC2(object):
+    """In memory EC2 snapshot state and fault injection settings"""
+
+    def __init__(self, snapshots=0, volumes=100, days=365, latency=0.0,
+                 action_latency=None, throttle_rate=0.0, rate_limit=0,
+                 in_use_rate=0.0, complete_after=0.0, seed=0):
+        """Initialize a StandinEC2 instance
+
+        :type snapshots: int
+        :param snapshots: The number of synthetic snapshots to create.
+
+        :type volumes: int
+        :param volumes: The number of synthetic volumes. Volumes are
+            attached to synthetic instances in pairs.
+
+        :type days: int
+        :param days: Synthetic snapshot start times are spread over
+            this many days before now.
+
+        :type latency: float
+        :param latency: Seconds added to every call.
+
+        :type action_latency: dict
+        :param action_latency: Seconds added to calls of a specific
+            action, overriding `latency`.
+
+        :type throttle_rate: float
+        :param throttle_rate: Fraction of calls randomly answered with
+            RequestLimitExceeded.
+
+        :type rate_limit: float
+        :param rate_limit: Calls per second accepted before answering
+            with RequestLimitExceeded. 0 disables the limit.
+
+        :type in_use_rate: float
+        :param in_use_rate: Fraction of synthetic snapshots that are in
+            use by an image and can not be deleted.
+
+        :type complete_after: float
+        :param complete_after: Seconds until a created snapshot moves
+            from 'pending' to 'completed'. Its progress grows linearly
+            until then.
+
+        :type seed: int
+        :param seed: Random seed for synthetic data and fault injection.
+
+        """
+
+        self.latency = latency
+        self.action_latency = action_latency or {}
+        self.throttle_rate = throttle_rate
+        self.bucket = TokenBucket(rate_limit) if rate_limit > 0 else None
+        self.complete_after = complete_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+
+        self.volumes = OrderedDict()
+        for i in xrange(volumes):
+            volume_id = "vol-{0:08x}".format(i)
+            self.volumes[volume_id] = {
+                "id": volume_id,
+                "size": 8,
+                "instance_id": "i-{0:08x}".format(i // 2),
+                "device": "/dev/sd{0}".format("fg"[i % 2]),
+                "tags": {},
+            }
+
+        self.snapshots = OrderedDict()
+        self.in_use = set()
+        now = datetime.utcnow()
+        for i in xrange(snapshots):
+            snap_id = "snap-{0:08x}".format(i)
+            start = now - timedelta(seconds=self.random.randrange(
+                max(days * 86400, 1)))
+            self.snapshots[snap_id] = {
+                "id": snap_id,
+                "volume_id": "vol-{0:08x}".format(
+                    self.random.randrange(max(volumes, 1))),
+                "status": "completed",
+                "progress": "100%",
+                "start_time": start.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "volume_size": 8,
+                "description": "Stand-in snapshot {0}".format(i),
+                "tags": {},
+                "completes": 0,
+            }
+            if self.random.random() < in_use_rate:
+                self.in_use.add(snap_id)
+
+    def handle(self, params):
+        """Dispatch a request and return the XML response body
+
+        :raises: StandinError for EC2 error responses.
+
+        """
+
+        action = params.get("Action")
+        with self.lock:
+            self.calls[action] = self.calls.get(action, 0) + 1
+            throttled = self.random.random() < self.throttle_rate
+
+        time.sleep(self.action_latency.get(action, self.latency))
+
+        if throttled or (self.bucket and not self.bucket.take()):
+            raise StandinError(503, "RequestLimitExceeded",
+                               "Request limit exceeded.")
+
+        method = getattr(self, "_" + str(action), None)
+        if method is None:
+            raise StandinError(400, "InvalidAction",
+                               "The action {0} is not valid for this "
+                               "web service.".format(action))
+
+        if params.get("DryRun") == "true":
+            method(params, dry_run=True)
+            raise StandinError(412, "DryRunOperation",
+                               "Request would have succeeded, but DryRun "
+                               "flag is set.")
+
+        body = method(params)
+        return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<{0}Response xmlns="{1}"><requestId>{2}</requestId>'
+                '{3}</{0}Response>'.format(action, XMLNS, uuid.uuid4(), body))
+
+    @staticmethod
+    def _list_param(params, label):
+        values = []
+        i = 1
+        while "{0}.{1}".format(label, i) in params:
+            values.append(params["{0}.{1}".format(label, i)])
+            i += 1
+        return values
+
+    def _filters(self, params):
+        filters = []
+        i = 1
+        while "Filter.{0}.Name".format(i) in params:
+            filters.append((params["Filter.{0}.Name".format(i)],
+                            self._list_param(params,
+                                             "Filter.{0}.Value".format(i))))
+            i += 1
+        return filters
+
+    @staticmethod
+    def _match(snap, name, values):
+        if name.startswith("tag:"):
+            value = snap["tags"].get(name[4:])
+        elif name == "tag-key":
+            return any(fnmatch(k, v) for k in snap["tags"] for v in values)
+        elif name == "owner-id":
+            value = OWNER_ID
+        elif name == "snapshot-id":
+            value = snap["id"]
+        else:
+            value = snap.get(name.replace("-", "_"))
+
+        return value is not None and any(fnmatch(str(value), v)
+                                         for v in values)
+
+    @staticmethod
+    def _tags_xml(tags):
+        return "<tagSet>{0}</tagSet>".format("".join(
+            "<item><key>{0}</key><value>{1}</value></item>".format(
+                escape(k), escape(v)) for k, v in tags.items()))
+
+    def _update_status(self, snap):
+        if snap["status"] != "pending":
+            return
+
+        now = time.time()
+        if now >= snap["completes"]:
+            snap["status"] = "completed"
+            snap["progress"] = "100%"
+        else:
+            # Progress grows linearly until the snapshot completes.
+            done = (now - snap["created"]) / self.complete_after
+            snap["progress"] = "{0}%".format(int(done * 100))
+
+    def _snapshot_xml(self, snap, tag="item"):
+        body = ("<snapshotId>{id}</snapshotId><volumeId>{volume_id}"
+                "</volumeId><status>{status}</status><startTime>{start_time}"
+                "</startTime><progress>{progress}</progress><ownerId>{0}"
+                "</ownerId><volumeSize>{volume_size}</volumeSize>"
+                "<description>{1}</description>{2}".format(
+                    OWNER_ID, escape(snap["description"] or ""),
+                    self._tags_xml(snap["tags"]), **snap))
+        return "<{0}>{1}</{0}>".format(tag, body) if tag else body
+
+    def _volume_xml(self, volume):
+        return ("<item><volumeId>{id}</volumeId><size>{size}</size>"
+                "<snapshotId/><availabilityZone>us-east-1a"
+                "</availabilityZone><status>in-use</status><createTime>"
+                "2013-01-01T00:00:00.000Z</createTime><attachmentSet><item>"
+                "<volumeId>{id}</volumeId><instanceId>{instance_id}"
+                "</instanceId><device>{device}</device><status>attached"
+                "</status><attachTime>2013-01-01T00:00:00.000Z</attachTime>"
+                "<deleteOnTermination>false</deleteOnTermination></item>"
+                "</attachmentSet>{0}</item>".format(
+                    self._tags_xml(volume["tags"]), **volume))
+
+    def _DescribeVolumes(self, params, dry_run=False):
+        ids = self._list_param(params, "VolumeId")
+        filters = self._filters(params)
+
+        with self.lock:
+            missing = [x for x in ids if x not in self.volumes]
+            if missing:
+                raise StandinError(400, "InvalidVolume.NotFound",
+                                   "The volume '{0}' does not "
+                                   "exist.".format(missing[0]))
+
+            matched = []
+            for volume in [self.volumes[x] for x in ids] or \
+                    self.volumes.values():
+                # The attributes filters are matched against.
+                view = {"volume_id": volume["id"], "size": volume["size"],
+                        "attachment.instance_id": volume["instance_id"],
+                        "attachment.device": volume["device"],
+                        "tags": volume["tags"]}
+                if all(self._match(view, name, values)
+                       for name, values in filters):
+                    matched.append(volume)
+
+        return "<volumeSet>{0}</volumeSet>".format(
+            "".join(self._volume_xml(x) for x in matched))
+
+    def _DescribeSnapshots(self, params, dry_run=False):
+        ids = self._list_param(params, "SnapshotId")
+        filters = self._filters(params)
+
+        with self.lock:
+            if ids:
+                missing = [x for x in ids if x not in self.snapshots]
+                if missing:
+                    raise StandinError(400, "InvalidSnapshot.NotFound",
+                                       "The snapshot '{0}' does not "
+                                       "exist.".format(missing[0]))
+                snaps = [self.snapshots[x] for x in ids]
+            else:
+                snaps = self.snapshots.values()
+
+            for snap in snaps:
+                self._update_status(snap)
+            matched = [x for x in snaps
+                       if all(self._match(x, name, values)
+                              for name, values in filters)]
+
+        token = ""
+        if "MaxResults" in params:
+            start = int(params.get("NextToken") or 0)
+            stop = start + int(params["MaxResults"])
+            if stop < len(matched):
+                token = "<nextToken>{0}</nextToken>".format(stop)
+            matched = matched[start:stop]
+
+        return "<snapshotSet>{0}</snapshotSet>{1}".format(
+            "".join(self._snapshot_xml(x) for x in matched), token)
+
+    def _CreateSnapshot(self, params, dry_run=False):
+        volume_id = params.get("VolumeId")
+        if not volume_id:
+            raise StandinError(400, "MissingParameter",
+                               "The request must contain the parameter "
+                               "volume")
+        volume = self.volumes.get(volume_id)
+        if volume is None:
+            raise StandinError(400, "InvalidVolume.NotFound",
+                               "The volume '{0}' does not "
+                               "exist.".format(volume_id))
+        if dry_run:
+            return
+
+        snap = {
+            "id": "snap-{0}".format(uuid.uuid4().hex[:8]),
+            "volume_id": volume_id,
+            "status": "pending",
+            "progress": "0%",
+            "start_time": datetime.utcnow().strftime(
+                "%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+            "volume_size": volume["size"],
+            "description": params.get("Description", ""),
+            "tags": {},
+            "created": time.time(),
+            "completes": time.time() + self.complete_after,
+        }
+        with self.lock:
+            self._update_status(snap)
+            self.snapshots[snap["id"]] = snap
+
+        return self._snapshot_xml(snap, tag=None)
+
+    def _DeleteSnapshot(self, params, dry_run=False):
+        snap_id = params.get("SnapshotId")
+        with self.lock:
+            if snap_id not in self.snapshots:
+                raise StandinError(400, "InvalidSnapshot.NotFound",
+                                   "The snapshot '{0}' does not "
+                                   "exist.".format(snap_id))
+            if snap_id in self.in_use:
+                raise StandinError(400, "InvalidSnapshot.InUse",
+                                   "The snapshot {0} is currently in use "
+                                   "by ami-12345678".format(snap_id))
+            if not dry_run:
+                del self.snapshots[snap_id]
+
+        return "<return>true</return>"
+
+    def _CreateTags(self, params, dry_run=False):
+        ids = self._list_param(params, "ResourceId")
+        tags = {}
+        i = 1
+        while "Tag.{0}.Key".format(i) in params:
+            tags[params["Tag.{0}.Key".format(i)]] = params.get(
+                "Tag.{0}.Value".format(i), "")
+            i += 1
+
+        with self.lock:
+            resources = []
+            for resource_id in ids:
+                resource = (self.snapshots.get(resource_id) or
+                            self.volumes.get(resource_id))
+                if resource is None:
+                    raise StandinError(400, "InvalidID",
+                                       "The ID '{0}' is not valid".format(
+                                           resource_id))
+                resources.append(resource)
+            if not dry_run:
+                for resource in resources:
+                    resource["tags"].update(tags)
+
+        return "<return>true</return>"
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._respond(urlparse(self.path).query)
+
+    def do_POST(self):
+        length = int(self.headers.getheader("content-length") or 0)
+        query = urlparse(self.path).query
+        self._respond("&".join(x for x in (query, self.rfile.read(length))
+                               if x))
+
+    def _respond(self, query):
+        params = dict(parse_qsl(query, keep_blank_values=True))
+        try:
+            status = 200
+            body = self.server.ec2.handle(params)
+        except StandinError, e:
+            status = e.status
+            body = ('<?xml version="1.0" encoding="UTF-8"?>\n<Response>'
+                    '<Errors><Error><Code>{0}</Code><Message>{1}</Message>'
+                    '</Error></Errors><RequestID>{2}</RequestID>'
+                    '</Response>'.format(e.code, escape(e.message),
+                                         uuid.uuid4()))
+
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml;charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class StandinServer(ThreadingMixIn, HTTPServer):
+    """A threaded HTTP server answering EC2 requests from a StandinEC2"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, ec2, verbose=False):
+        HTTPServer.__init__(self, address, StandinHandler)
+        self.ec2 = ec2
+        self.verbose = verbose
+
+        # Open keep-alive connections, so they can be closed on
+        # server_close instead of leaving handler threads blocked.
+        self._requests = set()
+        self._requests_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._requests_lock:
+            self._requests.add(request)
+        ThreadingMixIn.process_request(self, request, client_address)
+
+    def shutdown_request(self, request):
+        with self._requests_lock:
+            self._requests.discard(request)
+        HTTPServer.shutdown_request(self, request)
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        with self._requests_lock:
+            for request in list(self._requests):
+                try:
+                    request.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+
+    @property
+    def endpoint_url(self):
+        return "http://{0}:{1}/".format(*self.server_address)
+
+
+def parse_args(args):
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Address to listen on. DEFAULT: %(default)s")
+    parser.add_argument("--port", default=8773, type=int,
+                        help="Port to listen on. DEFAULT: %(default)s")
+    parser.add_argument("--snapshots", default=1000, type=int,
+                        help=("Number of synthetic snapshots. "
+                              "DEFAULT: %(default)s"))
+    parser.add_argument("--volumes", default=100, type=int,
+                        help=("Number of volumes the synthetic snapshots "
+                              "belong to. DEFAULT: %(default)s"))
+    parser.add_argument("--latency", default=0.0, type=float,
+                        help="Seconds added to every call.")
+    parser.add_argument("--action-latency", nargs="+", default=[],
+                        metavar="\"Action=seconds\"",
+                        help=("Per action latency. "
+                              "EXAMPLE: 'DeleteSnapshot=0.2'"))
+    parser.add_argument("--throttle-rate", default=0.0, type=float,
+                        help=("Fraction of calls answered with "
+                              "RequestLimitExceeded."))
+    parser.add_argument("--rate-limit", default=0, type=float,
+                        help=("Calls per second accepted before answering "
+                              "with RequestLimitExceeded."))
+    parser.add_argument("--in-use-rate", default=0.0, type=float,
+                        help=("Fraction of synthetic snapshots that are "
+                              "in use and can not be deleted."))
+    parser.add_argument("--complete-after", default=0.0, type=float,
+                        help=("Seconds until created snapshots are "
+                              "completed."))
+    parser.add_argument("--seed", default=0, type=int,
+                        help="Random seed. DEFAULT: %(default)s")
+    parser.add_argument("-v", "--verbose", default=False,
+                        action="store_true", help="Log every request.")
+    return parser.parse_args(args)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    action_latency = {}
+    for item in args.action_latency:
+        action, _, seconds = item.partition("=")
+        action_latency[action] = float(seconds)
+
+    ec2 = StandinEC2(snapshots=args.snapshots, volumes=args.volumes,
+                     latency=args.latency, action_latency=action_latency,
+                     throttle_rate=args.throttle_rate,
+                     rate_limit=args.rate_limit,
+                     in_use_rate=args.in_use_rate,
+                     complete_after=args.complete_after, seed=args.seed)
+    server = StandinServer((args.host, args.port), ec2, verbose=args.verbose)
+
+    print("EC2 stand-in listening on {0}".format(server.endpoint_url),
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+# Copyright 2013 Nick Downs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Snapshot selection expressions
+
+An expression is compiled once into a predicate, a function taking a
+snapshot and returning True or False. For example::
+
+    size >= 100 and description ~ '^nightly' and not tag:Keep
+
+Comparisons are written `field operator value`:
+
+* fields are 'id', 'volume-id', 'status', 'progress', 'description',
+  'start-time', 'size' (in GiB), 'date' and 'tag:<name>'. Underscores
+  may be used instead of dashes;
+* operators are '=', '!=', '<', '<=', '>', '>=', '~' (the value is a
+  regular expression found in the field) and '!~';
+* values are numbers for 'size' and 'progress' (in percent, with or
+  without '%'), dates such as '2013-09-21' or
+  '2013-09-21T02:05:32' for 'date' and strings otherwise. Values
+  containing spaces or operator characters must be quoted.
+
+A field on its own is true when the snapshot has a non-empty value,
+e.g. a tag. Comparisons with a missing value are false, except for
+'!=' and '!~'. Comparisons are combined with 'and', 'or', 'not' and
+parentheses.
+
+"""
+import operator
+import re
+
+from datetime import datetime
+
+__all__ = ["compile_where"]
+
+_TOKENS = re.compile(r"""\s*(?:
+    (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+    |(?P<op>==|!=|<=|>=|!~|[=<>~()])
+    |(?P<word>[^\s()'"=!<>~]+)
+    )""", re.X)
+
+_ATTRIBUTES = {
+    "id": "id",
+    "snapshot-id": "id",
+    "volume-id": "volume_id",
+    "status": "status",
+    "progress": "progress",
+    "description": "description",
+    "start-time": "start_time",
+    "size": "volume_size",
+    "volume-size": "volume_size",
+    "date": "date",
+}
+
+_COMPARISONS = {
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+_DATE_FORMATS = ["%Y-%m-%d", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S",
+                 "%Y-%m-%dT%H:%M:%S.%fZ"]
+
+
+def _tokenize(expression):
+    # Return a list of (kind, text, position) tuples.
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = _TOKENS.match(expression, pos)
+        if match is None or match.end() == pos:
+            raise ValueError("Invalid expression at position {0}: {1}"
+                             .format(pos + 1, expression[pos:]))
+        kind = match.lastgroup
+        text = match.group(kind)
+        start = match.start(kind) + 1
+        if kind == "string":
+            text = re.sub(r"\\(.)", r"\1", text[1:-1])
+        elif kind == "word" and text.lower() in ("and", "or", "not"):
+            kind, text = text.lower(), text.lower()
+        tokens.append((kind, text, start))
+        pos = match.end()
+    return tokens
+
+
+def _progress(snap):
+    # Progress as a number, e.g. 100.0 for '100%'.
+    try:
+        return float(snap.progress.rstrip("%"))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _getter(field):
+    # Return (getter, name of the snapshot attribute) of a field.
+    if field.startswith("tag:") and len(field) > 4:
+        name = field[4:]
+        return (lambda snap: snap.tags.get(name) if snap.tags else None,
+                None)
+
+    attr = _ATTRIBUTES.get(field.replace("_", "-"))
+    if attr is None:
+        raise ValueError("Unknown field: {0}".format(field))
+    if attr == "progress":
+        return _progress, attr
+    return operator.attrgetter(attr), attr
+
+
+def _value(attr, op, text):
+    # Convert a value to the type of the field it is compared with.
+    if op in ("~", "!~"):
+        if attr in ("volume_size", "progress", "date"):
+            raise ValueError("{0} can not be used with {1}".format(
+                op, "size" if attr == "volume_size" else attr))
+        try:
+            return re.compile(text)
+        except re.error, e:
+            raise ValueError("Invalid regular expression {0!r}: {1}"
+                             .format(text, e))
+
+    if attr == "volume_size":
+        try:
+            return float(text)
+        except ValueError:
+            raise ValueError("Invalid size: {0}".format(text))
+
+    if attr == "progress":
+        try:
+            return float(text.rstrip("%"))
+        except ValueError:
+            raise ValueError("Invalid progress: {0}".format(text))
+
+    if attr == "date":
+        for fmt in _DATE_FORMATS:
+            try:
+                return datetime.strptime(text, fmt)
+            except ValueError:
+                pass
+        raise ValueError("Invalid date: {0}".format(text))
+
+    return text
+
+
+def _comparison(get, op, value):
+    if op == "~":
+        search = value.search
+        return lambda snap: _search(search, get(snap))
+    if op == "!~":
+        search = value.search
+        return lambda snap: not _search(search, get(snap))
+
+    compare = _COMPARISONS[op]
+    if op == "!=":
+        return lambda snap: compare(get(snap), value)
+
+    def predicate(snap):
+        field = get(snap)
+        return field is not None and compare(field, value)
+    return predicate
+
+
+def _search(search, field):
+    return field is not None and search(field) is not None
+
+
+def _and(first, second):
+    return lambda snap: first(snap) and second(snap)
+
+
+def _or(first, second):
+    return lambda snap: first(snap) or second(snap)
+
+
+class _Parser(object):
+    # A recursive descent parser of the grammar
+    #
+    #   expression := term ('or' term)*
+    #   term       := factor ('and' factor)*
+    #   factor     := 'not' factor | '(' expression ')' | comparison
+    #   comparison := field [operator value]
+
+    def __init__(self, expression):
+        self.tokens = _tokenize(expression)
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None, None)
+
+    def take(self, kind=None, text=None):
+        token = self.peek()
+        if token[0] is None:
+            raise ValueError("Unexpected end of expression")
+        if (kind is not None and token[0] != kind) or \
+                (text is not None and token[1] != text):
+            raise ValueError("Unexpected {0!r} at position {1}".format(
+                token[1], token[2]))
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Empty expression")
+        predicate = self.expression()
+        kind, text, pos = self.peek()
+        if kind is not None:
+            raise ValueError("Unexpected {0!r} at position {1}".format(
+                text, pos))
+        return predicate
+
+    def expression(self):
+        predicate = self.term()
+        while self.peek()[0] == "or":
+            self.take()
+            predicate = _or(predicate, self.term())
+        return predicate
+
+    def term(self):
+        predicate = self.factor()
+        while self.peek()[0] == "and":
+            self.take()
+            predicate = _and(predicate, self.factor())
+        return predicate
+
+    def factor(self):
+        kind = self.peek()[0]
+        if kind == "not":
+            self.take()
+            predicate = self.factor()
+            return lambda snap: not predicate(snap)
+        if kind == "op" and self.peek()[1] == "(":
+            self.take()
+            predicate = self.expression()
+            self.take("op", ")")
+            return predicate
+        return self.comparison()
+
+    def comparison(self):
+        field = self.take("word")[1]
+        get, attr = _getter(field)
+
+        kind, op = self.peek()[:2]
+        if kind != "op" or op in ("(", ")"):
+            return lambda snap: get(snap) not in (None, "")
+
+        self.take()
+        kind, text, pos = self.take()
+        if kind not in ("word", "string"):
+            raise ValueError("Expected a value at position {0}, got {1!r}"
+                             .format(pos, text))
+        return _comparison(get, op, _value(attr, op, text))
+
+
+def compile_where(expression):
+    """Compile an expression into a snapshot predicate
+
+    :type expression: string
+    :param expression: An expression as described by this module, for
+        example "size > 100 and not tag:Keep".
+
+    :rtype: function
+    :return: A function taking a SnapshotRecord or boto Snapshot and
+        returning whether the snapshot matches `expression`.
+
+    :raises: ValueError if `expression` is invalid.
+
+    """
+
+    return _Parser(expression).parse()
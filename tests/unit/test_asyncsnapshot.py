@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+import threading
+import time
+import unittest
+
+from multiprocessing import TimeoutError
+from mock import Mock
+from boto.ec2 import EC2Connection
+from boto.ec2.snapshot import Snapshot
+from boto.exception import EC2ResponseError
+
+from simplesnapshot.asyncsnapshot import *
+from simplesnapshot.bulk import CREATED, DELETED, IN_USE
+
+
+def _snapshot(snapshot_id, start_time, volume_id="vol-1"):
+    snap = Snapshot()
+    snap.id = snapshot_id
+    snap.start_time = start_time
+    snap.volume_id = volume_id
+    return snap
+
+
+class TestFuture(unittest.TestCase):
+
+    def test_result_and_callbacks(self):
+        future = Future()
+        seen = []
+        future.add_done_callback(lambda x: seen.append(x.result()))
+        self.assertFalse(future.done())
+        self.assertRaises(TimeoutError, future.result, 0.01)
+
+        future.set_result(5)
+        future.add_done_callback(lambda x: seen.append(x.result() * 2))
+        self.assertEqual(future.result(), 5)
+        self.assertEqual(seen, [5, 10])
+        self.assertIsNone(future.exception())
+
+    def test_gather(self):
+        with SnapshotExecutor(4) as executor:
+            futures = [executor.submit(lambda x: x * 2, i)
+                       for i in range(10)]
+            self.assertEqual(gather(futures).result(1),
+                             [x * 2 for x in range(10)])
+            self.assertEqual(gather([]).result(), [])
+
+            failed = executor.submit(lambda: 1 / 0)
+            combined = gather(futures + [failed])
+            self.assertRaises(ZeroDivisionError, combined.result, 1)
+            self.assertIsInstance(combined.exception(), ZeroDivisionError)
+
+
+class TestAsyncSimpleSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = SnapshotExecutor(4)
+        self.fakeconn = Mock(spec=EC2Connection)
+        self.fakeconn.get_all_snapshots.return_value = [
+            _snapshot("snap-1", "2013-09-21T02:05:32.000Z"),
+            _snapshot("snap-3", "2013-09-23T22:09:55.000Z"),
+            _snapshot("snap-2", "2013-09-22T04:10:05.000Z"),
+        ]
+
+    def tearDown(self):
+        self.executor.close()
+
+    def snapshot(self, **kwargs):
+        return AsyncSimpleSnapshot(self.fakeconn, executor=self.executor,
+                                   **kwargs)
+
+    def test_close(self):
+        active = threading.active_count()
+        with AsyncSimpleSnapshot(self.fakeconn) as snapshot:
+            snapshot.discover().result(1)
+            self.assertGreater(threading.active_count(), active + 10)
+        self.assertEqual(threading.active_count(), active)
+
+        # A shared executor keeps running.
+        self.snapshot().close()
+        self.assertEqual(len(self.snapshot().discover().result(1)), 3)
+
+    def test_discover_once(self):
+        snapshot = self.snapshot()
+        futures = [snapshot.discover(), snapshot.fetch_snapshots(),
+                   snapshot.fetch_snapshots(inverse=True)]
+        snaps, newest, oldest = gather(futures).result(1)
+        self.assertEqual([x.id for x in snaps],
+                         ["snap-3", "snap-2", "snap-1"])
+        self.assertEqual([x.id for x in newest], [x.id for x in snaps])
+        self.assertEqual([x.id for x in oldest], [x.id for x in snaps][::-1])
+        self.assertEqual(self.fakeconn.get_all_snapshots.call_count, 1)
+
+        snapshot.discover(refresh=True).result(1)
+        self.assertEqual(self.fakeconn.get_all_snapshots.call_count, 2)
+
+    def test_filtering_semantics(self):
+        snapshot = self.snapshot(count=1, limit=1)
+        self.assertEqual([x.id for x in snapshot.fetch_snapshots(
+            inverse=True).result(1)], ["snap-1"])
+
+    def test_discovery_error(self):
+        self.fakeconn.get_all_snapshots.side_effect = RuntimeError("down")
+        self.assertRaises(RuntimeError, self.snapshot().delete().result, 1)
+
+    def test_delete(self):
+        error = EC2ResponseError(400, "Bad Request")
+        error.error_code = "InvalidSnapshot.InUse"
+        error.error_message = "In use"
+        self.fakeconn.delete_snapshot.side_effect = \
+            lambda snap_id, dry_run: self.raise_for(snap_id, "snap-2", error)
+
+        result = self.snapshot(count=1).delete().result(1)
+        self.assertEqual(sorted(result.results),
+                         [("snap-1", DELETED, None),
+                          ("snap-2", IN_USE, "InvalidSnapshot.InUse: In use")])
+
+    def raise_for(self, snap_id, failing, error):
+        if snap_id == failing:
+            raise error
+        return True
+
+    def test_delete_runs_concurrently(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def delete_snapshot(snap_id, dry_run):
+            with lock:
+                running.append(snap_id)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(snap_id)
+
+        self.fakeconn.delete_snapshot.side_effect = delete_snapshot
+        snaps = [_snapshot("snap-{0}".format(i), "2013-09-21T02:05:32.000Z")
+                 for i in range(8)]
+        result = self.snapshot().delete(snaps).result(5)
+        self.assertEqual(result.counts[DELETED], 8)
+        self.assertEqual(max(peak), 4)
+
+    def test_create(self):
+        def get_object(action, params, cls, verb):
+            return _snapshot(params["VolumeId"].replace("vol", "snap"),
+                             "2013-09-21T02:05:32.000Z", params["VolumeId"])
+
+        self.fakeconn.get_object.side_effect = get_object
+        result = self.snapshot().create({"vol-1": "web", "vol-2": "web"},
+                                        tags={"Type": "nightly"}).result(1)
+        self.assertEqual(result.counts[CREATED], 2)
+        self.assertEqual(sorted(x.id for x in result.snapshots),
+                         ["snap-1", "snap-2"])
+        (ids, tags), kwargs = self.fakeconn.create_tags.call_args
+        self.assertEqual(sorted(ids), ["snap-1", "snap-2"])
+        self.assertEqual(tags, {"Name": "web", "Type": "nightly"})
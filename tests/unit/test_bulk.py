@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+import thread
+import threading
+import time
+import unittest
+
+from mock import Mock, patch
+from multiprocessing.pool import ThreadPool
+from boto.ec2 import EC2Connection
+from boto.ec2.snapshot import Snapshot
+from boto.exception import BotoServerError, EC2ResponseError
+
+from simplesnapshot.bulk import *
+
+
+def _error(code):
+    error = EC2ResponseError(400, "Bad Request")
+    error.error_code = code
+    error.error_message = "Testing {0}".format(code)
+    return error
+
+
+class TestBulkDelete(unittest.TestCase):
+
+    def setUp(self):
+        self.snaps = []
+        for i in range(6):
+            snap = Mock()
+            snap.id = "snap-{0}".format(i)
+            self.snaps.append(snap)
+
+        self.errors = {"snap-1": _error("InvalidSnapshot.InUse"),
+                       "snap-2": _error("InvalidSnapshot.NotFound"),
+                       "snap-3": _error("RequestLimitExceeded"),
+                       "snap-4": RuntimeError("Connection reset")}
+        self.fakeconn = Mock(spec=EC2Connection)
+        self.fakeconn.delete_snapshot.side_effect = self.delete_snapshot
+
+    def delete_snapshot(self, snapshot_id, dry_run=False):
+        if snapshot_id in self.errors:
+            raise self.errors[snapshot_id]
+        return True
+
+    def assert_outcomes(self, result):
+        outcomes = dict((x[0], x[1]) for x in result.results)
+        self.assertEqual(outcomes, {"snap-0": DELETED,
+                                    "snap-1": IN_USE,
+                                    "snap-2": NOT_FOUND,
+                                    "snap-3": THROTTLED,
+                                    "snap-4": FAILED,
+                                    "snap-5": DELETED})
+        self.assertEqual(len(result.errors), 4)
+        self.assertEqual(sorted(result.gone), ["snap-0", "snap-2", "snap-5"])
+        self.assertEqual(sorted(x[0][0] for x in
+                                self.fakeconn.delete_snapshot.call_args_list),
+                         [x.id for x in self.snaps])
+
+    def test_serial_delete_continues_after_errors(self):
+        self.assert_outcomes(bulk_delete(self.fakeconn, self.snaps))
+
+    def test_concurrent_delete_continues_after_errors(self):
+        self.assert_outcomes(bulk_delete(self.fakeconn, self.snaps, workers=4))
+
+    def test_concurrent_delete_interrupted(self):
+        # Ctrl-C arrives while every delete is still busy; the deletes
+        # only return once the pool is terminated.
+        release = threading.Event()
+        terminate = ThreadPool.terminate
+
+        def release_workers(pool):
+            release.set()
+            terminate(pool)
+
+        self.fakeconn.delete_snapshot.side_effect = (
+            lambda snapshot_id, dry_run=False: release.wait(5))
+        timer = threading.Timer(0.2, thread.interrupt_main)
+        timer.start()
+        start = time.time()
+        with patch.object(ThreadPool, "terminate", release_workers):
+            self.assertRaises(KeyboardInterrupt, bulk_delete, self.fakeconn,
+                              self.snaps, workers=2)
+        self.assertTrue(time.time() - start < 3)
+        self.assertEqual(self.fakeconn.delete_snapshot.call_count, 2)
+
+    def test_dry_run_is_not_an_error(self):
+        self.fakeconn.delete_snapshot.side_effect = _error("DryRunOperation")
+
+        result = bulk_delete(self.fakeconn, self.snaps, workers=2,
+                             dry_run=True)
+        self.assertEqual(result.counts[DRY_RUN], 6)
+        self.assertEqual(result.errors, [])
+
+    def test_summary(self):
+        result = bulk_delete(self.fakeconn, self.snaps)
+        self.assertEqual(result.summary(),
+                         "deleted: 2  dry_run: 0  in_use: 1  not_found: 1  "
+                         "throttled: 1  failed: 1")
+
+
+class TestBulkCreate(unittest.TestCase):
+
+    def setUp(self):
+        self.volumes = {"vol-0": "web", "vol-1": "web", "vol-2": None,
+                        "vol-3": "db", "vol-4": None}
+        self.errors = {"vol-3": _error("InvalidVolume.NotFound")}
+        self.fakeconn = Mock(spec=EC2Connection)
+        self.fakeconn.get_object.side_effect = self.create_snapshot
+
+    def create_snapshot(self, action, params, cls, verb="GET"):
+        self.assertEqual((action, cls, verb), ("CreateSnapshot", Snapshot,
+                                               "POST"))
+        if params["VolumeId"] in self.errors:
+            raise self.errors[params["VolumeId"]]
+        snap = Snapshot()
+        snap.id = params["VolumeId"].replace("vol", "snap")
+        snap.volume_id = params["VolumeId"]
+        return snap
+
+    def tag_calls(self):
+        return sorted((sorted(x[0][0]), x[0][1])
+                      for x in self.fakeconn.create_tags.call_args_list)
+
+    def test_create_groups_tags(self):
+        result = bulk_create(self.fakeconn, self.volumes, "nightly",
+                             tags={"Type": "backup"}, workers=3)
+
+        self.assertEqual(result.counts[CREATED], 4)
+        self.assertEqual(result.errors, [("vol-3", NOT_FOUND,
+                                          "InvalidVolume.NotFound: "
+                                          "Testing InvalidVolume.NotFound")])
+        self.assertEqual(sorted(x.id for x in result.snapshots),
+                         ["snap-0", "snap-1", "snap-2", "snap-4"])
+        self.assertEqual(self.tag_calls(), [
+            (["snap-0", "snap-1"], {"Name": "web", "Type": "backup"}),
+            (["snap-2", "snap-4"], {"Type": "backup"})])
+        params = self.fakeconn.get_object.call_args_list[0][0][1]
+        self.assertEqual(params["Description"], "nightly")
+
+    def test_user_tags_override_volume_name(self):
+        del self.errors["vol-3"]
+        bulk_create(self.fakeconn, self.volumes, tags={"Name": "backup"})
+        self.assertEqual(self.tag_calls(), [
+            (["snap-0", "snap-1", "snap-2", "snap-3", "snap-4"],
+             {"Name": "backup"})])
+
+    def test_untagged_volumes_are_not_tagged(self):
+        bulk_create(self.fakeconn, {"vol-2": None, "vol-4": None})
+        self.assertFalse(self.fakeconn.create_tags.called)
+
+    def test_dry_run(self):
+        self.fakeconn.get_object.side_effect = _error("DryRunOperation")
+
+        result = bulk_create(self.fakeconn, self.volumes, dry_run=True)
+        self.assertEqual(result.counts[DRY_RUN], 5)
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.summary(),
+                         "created: 0  dry_run: 5  not_found: 0  "
+                         "throttled: 0  failed: 0")
+        params = self.fakeconn.get_object.call_args_list[0][0][1]
+        self.assertEqual(params["DryRun"], "true")
+
+    def test_tag_resources_batches(self):
+        ids = ["snap-{0}".format(i) for i in range(TAG_BATCH_SIZE + 1)]
+        self.assertEqual(tag_resources(self.fakeconn, ids, {"a": "b"}), 2)
+        calls = self.fakeconn.create_tags.call_args_list
+        self.assertEqual([len(x[0][0]) for x in calls], [TAG_BATCH_SIZE, 1])
+
+
+class TestWaitSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        # Scripted (status, progress) per snapshot for each poll.
+        self.polls = iter([
+            {"snap-0": ("pending", "10%"), "snap-1": ("pending", "0%"),
+             "snap-2": ("pending", "0%")},
+            {"snap-0": ("pending", "10%"), "snap-1": ("pending", "0%"),
+             "snap-2": ("pending", "0%")},
+            {"snap-0": ("completed", "100%"), "snap-1": ("error", "0%"),
+             "snap-2": ("pending", "0%")},
+        ])
+        self.snaps = []
+        for i in range(3):
+            snap = Snapshot()
+            snap.id = "snap-{0}".format(i)
+            snap.status = "pending"
+            snap.progress = "0%"
+            self.snaps.append(snap)
+
+        self.now = [0.0]
+        self.sleeps = []
+        self.fakeconn = Mock(spec=EC2Connection)
+        self.fakeconn.get_all_snapshots.side_effect = self.describe
+
+    def describe(self, owner=None, filters=None):
+        polled = []
+        for snap_id, (status, progress) in sorted(next(self.polls).items()):
+            if snap_id in filters["snapshot-id"]:
+                snap = Snapshot()
+                snap.id, snap.status, snap.progress = (snap_id, status,
+                                                       progress)
+                polled.append(snap)
+        return polled
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now[0] += seconds
+
+    def wait(self, snapshots, timeout=3600, progress=None):
+        return wait_snapshots(self.fakeconn, snapshots, timeout=timeout,
+                              interval=2, max_interval=3, progress=progress,
+                              sleep=self.sleep, clock=lambda: self.now[0])
+
+    def test_wait_until_done(self):
+        changes = []
+        result = self.wait(self.snaps[:2],
+                           progress=lambda x: changes.append(
+                               [(y.id, y.progress) for y in x]))
+
+        self.assertEqual(dict((x[0], x[1]) for x in result.results),
+                         {"snap-0": COMPLETED, "snap-1": FAILED})
+        self.assertEqual(changes, [[("snap-0", "10%")],
+                                   [("snap-0", "100%"), ("snap-1", "0%")]])
+        self.assertEqual(self.snaps[0].status, "completed")
+        # One request per poll; the interval grows while nothing changes.
+        self.assertEqual(self.fakeconn.get_all_snapshots.call_count, 3)
+        self.assertEqual(self.sleeps, [2, 2, 3])
+
+    def test_timeout(self):
+        result = self.wait(self.snaps[1:], timeout=5)
+        self.assertEqual(result.counts[TIMED_OUT], 2)
+        self.assertEqual(self.sleeps, [2, 3])
+        self.assertEqual(len(result.errors), 2)
+
+    def test_missing_snapshot(self):
+        # snap-2 is deleted after the first poll listed it.
+        self.polls = iter([{"snap-0": ("pending", "10%"),
+                            "snap-2": ("pending", "0%")},
+                           {"snap-0": ("pending", "10%")},
+                           {"snap-0": ("completed", "100%")}])
+        result = self.wait([self.snaps[0], self.snaps[2]])
+        self.assertEqual(result.results[0],
+                         ("snap-2", NOT_FOUND, "snapshot no longer exists"))
+        self.assertEqual(result.counts[COMPLETED], 1)
+        self.assertEqual(
+            self.fakeconn.get_all_snapshots.call_args[1]["filters"],
+            {"snapshot-id": ["snap-0"]})
+
+    def test_new_snapshot_not_listed_yet(self):
+        # DescribeSnapshots does not list snap-2 right after it is
+        # created.
+        self.polls = iter([{},
+                           {"snap-2": ("pending", "10%")},
+                           {"snap-2": ("completed", "100%")}])
+        result = self.wait([self.snaps[2]])
+        self.assertEqual(result.results, [("snap-2", COMPLETED, None)])
+
+    def test_never_listed(self):
+        self.polls = iter([{}] * MISSING_POLLS)
+        result = self.wait([self.snaps[2]])
+        self.assertEqual(result.counts[NOT_FOUND], 1)
+        self.assertEqual(self.fakeconn.get_all_snapshots.call_count,
+                         MISSING_POLLS)
+
+    def test_completed_snapshots_are_not_polled(self):
+        self.snaps[0].status = "completed"
+        result = self.wait(self.snaps[:1])
+        self.assertEqual(result.counts[COMPLETED], 1)
+        self.assertFalse(self.fakeconn.get_all_snapshots.called)
+
+    def test_throttled_poll_is_retried(self):
+        errors = iter([_error("RequestLimitExceeded")])
+
+        def describe(owner=None, filters=None):
+            for error in errors:
+                raise error
+            return self.describe(owner, filters)
+
+        self.fakeconn.get_all_snapshots.side_effect = describe
+        self.polls = iter([{"snap-0": ("completed", "100%")}])
+        result = self.wait(self.snaps[:1])
+        self.assertEqual(result.counts[COMPLETED], 1)
+        self.assertEqual(self.sleeps, [2, 3])
+
+    def test_server_error_is_retried(self):
+        errors = iter([BotoServerError(503, "Service Unavailable")])
+
+        def describe(owner=None, filters=None):
+            for error in errors:
+                raise error
+            return self.describe(owner, filters)
+
+        self.fakeconn.get_all_snapshots.side_effect = describe
+        self.polls = iter([{"snap-0": ("completed", "100%")}])
+        result = self.wait(self.snaps[:1])
+        self.assertEqual(result.counts[COMPLETED], 1)
+
+    def test_poll_error(self):
+        self.fakeconn.get_all_snapshots.side_effect = _error(
+            "UnauthorizedOperation")
+        result = self.wait(self.snaps[:2])
+        message = "UnauthorizedOperation: Testing UnauthorizedOperation"
+        self.assertEqual(result.results, [("snap-0", FAILED, message),
+                                          ("snap-1", FAILED, message)])
+        self.assertEqual(self.fakeconn.get_all_snapshots.call_count, 1)
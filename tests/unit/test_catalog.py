@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch, Mock
+from boto.ec2 import EC2Connection
+from boto.ec2.regioninfo import RegionInfo
+from boto.ec2.snapshot import Snapshot
+
+from simplesnapshot.snapshot import (SimpleSnapshot, SimpleSnapshotConsole,
+                                     SnapshotRecord)
+from simplesnapshot.catalog import *
+
+
+class TestSnapshotCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "cache", "catalog.db")
+
+        self.snaps = []
+        for i, day in enumerate([21, 23, 22]):
+            snap = Snapshot()
+            snap.id = "snap-{0}".format(i)
+            snap.start_time = "2013-09-{0}T02:05:32.000Z".format(day)
+            snap.volume_id = "vol-1"
+            snap.volume_size = 8
+            snap.region = RegionInfo(name="us-east-1")
+            snap.tags["Name"] = "backup"
+            self.snaps.append(snap)
+
+        self.fakeconn = Mock(spec=EC2Connection)
+        self.fakeconn.get_all_snapshots.return_value = self.snaps
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def catalog(self, **kwargs):
+        kwargs.setdefault("scope", ("testing", "us-east-1"))
+        return SnapshotCatalog(self.path, **kwargs)
+
+    def test_store_and_load(self):
+        catalog = self.catalog()
+        key = catalog.key("self", {"tag:Name": "backup"}, [])
+        self.assertIsNone(catalog.load(key))
+
+        catalog.store(key, self.snaps)
+        loaded = sorted(catalog.load(key), key=lambda x: x.id)
+        self.assertEqual([x.id for x in loaded],
+                         ["snap-0", "snap-1", "snap-2"])
+        self.assertEqual(loaded[0].start_time, self.snaps[0].start_time)
+        self.assertEqual(loaded[0].volume_size, 8)
+        self.assertEqual(loaded[0].region.name, "us-east-1")
+        self.assertEqual(loaded[0].tags, {"Name": "backup"})
+        self.assertIsInstance(loaded[0], SnapshotRecord)
+
+    def test_keys_are_scoped(self):
+        key = self.catalog().key("self", {}, [])
+        other = self.catalog(scope=("testing", "eu-west-1"))
+        self.assertNotEqual(key, other.key("self", {}, []))
+        self.assertNotEqual(key, self.catalog().key("amazon", {}, []))
+        self.assertNotEqual(key, self.catalog().key("self", {"a": "b"}, []))
+
+    def test_ttl_and_refresh(self):
+        catalog = self.catalog(ttl=60)
+        key = catalog.key("self", {}, [])
+        catalog.store(key, self.snaps)
+        self.assertIsNotNone(catalog.load(key))
+        self.assertIsNone(self.catalog(ttl=60, refresh=True).load(key))
+
+        with patch("simplesnapshot.catalog.time") as fake_time:
+            fake_time.time.return_value = 1e12
+            self.assertIsNone(catalog.load(key))
+
+    def test_discard_and_invalidate(self):
+        catalog = self.catalog()
+        key = catalog.key("self", {}, [])
+        catalog.store(key, self.snaps)
+
+        catalog.discard(["snap-1"])
+        self.assertEqual(sorted(x.id for x in catalog.load(key)),
+                         ["snap-0", "snap-2"])
+
+        catalog.invalidate()
+        self.assertIsNone(catalog.load(key))
+
+    def test_simple_snapshot_uses_catalog(self):
+        snapshot = SimpleSnapshot(self.fakeconn, catalog=self.catalog())
+        self.assertEqual([x.id for x in snapshot.snapshots],
+                         ["snap-1", "snap-2", "snap-0"])
+
+        cached = SimpleSnapshot(self.fakeconn, catalog=self.catalog())
+        self.assertEqual([x.id for x in cached.snapshots],
+                         ["snap-1", "snap-2", "snap-0"])
+        self.assertEqual(self.fakeconn.get_all_snapshots.call_count, 1)
+
+        cached.refresh()
+        self.assertEqual(self.fakeconn.get_all_snapshots.call_count, 2)
+
+    def test_delete_discards_snapshots(self):
+        catalog = self.catalog()
+        console = SimpleSnapshotConsole(self.fakeconn, count=1,
+                                        auto_confirm=True, catalog=catalog)
+        console.run("delete")
+
+        cached = SimpleSnapshot(self.fakeconn, catalog=catalog)
+        self.assertEqual([x.id for x in cached.snapshots], ["snap-1"])
+        self.assertEqual(self.fakeconn.get_all_snapshots.call_count, 1)
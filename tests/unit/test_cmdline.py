@@ -1,4 +1,7 @@
 #!/usr/bin/env python
+import socket
+import subprocess
+import sys
 import unittest
 
 from mock import patch, Mock
@@ -13,6 +16,8 @@ from simplesnapshot.cmdline import *
 class TestCmdline(unittest.TestCase):
 
     def setUp(self):
+        # The command modules are imported lazily; autospec needs them.
+        load_commands()
 
         self.fakeconn = Mock(spec=ec2.EC2Connection)
         self.fakecmdline = ("-c /etc/config -p testing -r us-east-1 -y "
@@ -51,11 +56,17 @@ class TestCmdline(unittest.TestCase):
         )
         self.mock_snapshot.return_value = self.mock_snapshot_instance
 
+        # Fake multi region runner
+        self.run_consoles_patch = patch("simplesnapshot.cmdline.run_consoles",
+                                        autospec=True)
+        self.mock_run_consoles = self.run_consoles_patch.start()
+
     def tearDown(self):
         self.parse_args_patch.stop()
         self.read_config_patch.stop()
         self.ec2_patch.stop()
         self.snapshot_patch.stop()
+        self.run_consoles_patch.stop()
 
     def test_list_parser(self):
         cmd_line = "list snap-123456 snap-54321"
@@ -72,6 +83,8 @@ class TestCmdline(unittest.TestCase):
         self.assertTrue(hasattr(args, 'limit'))
         self.assertTrue(hasattr(args, 'owner'))
         self.assertTrue(hasattr(args, 'type'))
+        self.assertTrue(hasattr(args, 'page_size'))
+        self.assertTrue(hasattr(args, 'stream'))
 
     def test_delete_parser(self):
         cmd_line = "delete snap-123456 snap-54321"
@@ -87,6 +100,8 @@ class TestCmdline(unittest.TestCase):
         self.assertTrue(hasattr(args, 'count'))
         self.assertTrue(hasattr(args, 'limit'))
         self.assertTrue(hasattr(args, 'type'))
+        self.assertTrue(hasattr(args, 'workers'))
+        self.assertTrue(hasattr(args, 'group_by'))
 
     def test_create_parser(self):
         cmd_line = "create vol-123456"
@@ -97,8 +112,128 @@ class TestCmdline(unittest.TestCase):
         self.assertTrue(hasattr(args, 'config'))
         self.assertTrue(hasattr(args, 'yes'))
         self.assertTrue(hasattr(args, 'dry_run'))
-        self.assertTrue(hasattr(args, 'volume_id'))
+        self.assertEquals(args.volume_ids, ["vol-123456"])
         self.assertTrue(hasattr(args, 'description'))
+        self.assertTrue(hasattr(args, 'workers'))
+
+    def test_output_parser(self):
+        args = parse_args("-o ndjson --columns id,tags list".split())
+        self.assertEquals(args.output, "ndjson")
+        self.assertEquals(args.columns, ["id", "tags"])
+        self.assertIsNone(parse_args(["list"]).columns)
+        with patch("sys.stderr"):
+            self.assertRaises(SystemExit, parse_args,
+                              "--columns id,size list".split())
+
+    def test_metrics_parser(self):
+        args = parse_args("--stats --statsd localhost:8125 list".split())
+        self.assertTrue(args.stats)
+        self.assertEquals(args.statsd, "localhost:8125")
+        self.assertIsNone(args.metrics_file)
+        args = parse_args("--statsd localhost list".split())
+        self.assertEquals(args.statsd, "localhost")
+        with patch("sys.stderr"):
+            for address in [":8125", "localhost:x", "localhost:70000"]:
+                self.assertRaises(SystemExit, parse_args,
+                                  ["--statsd", address, "list"])
+
+    def test_report_metrics_statsd_error(self):
+        args = parse_args("--statsd localhost list".split())
+        metrics = Mock()
+        metrics.send_statsd.side_effect = socket.gaierror(
+            -2, "Name or service not known")
+        with patch("sys.stderr", new=StringIO()) as stderr:
+            report_metrics(args, metrics)
+        self.assertIn("could not send metrics to StatsD at localhost",
+                      stderr.getvalue())
+
+    def test_profile_run_parser(self):
+        args = parse_args("--profile-run /tmp/run --cprofile list".split())
+        self.assertEquals(args.profile_run, "/tmp/run")
+        self.assertTrue(args.cprofile)
+        self.assertFalse(args.trace_memory)
+        # -p/--profile is not mistaken for --profile-run.
+        self.assertEquals(parse_args("--profile prod list".split()).profile,
+                          "prod")
+        with patch("sys.stderr"):
+            self.assertRaises(SystemExit, parse_args,
+                              "--trace-memory list".split())
+
+    def test_api_rate_parser(self):
+        self.assertIsNone(parse_args(["list"]).api_rate)
+        self.assertEquals(parse_args("--api-rate 2.5 list".split()).api_rate,
+                          2.5)
+
+    def test_journal_parser(self):
+        args = parse_args("delete --count 3 --plan-out plan.jsonl".split())
+        self.assertEquals(args.plan_out, "plan.jsonl")
+        self.assertFalse(args.resume)
+        self.assertEquals(journal_path(args, "prod", "us-east-1"),
+                          "plan.jsonl")
+
+        args = parse_args("delete --resume --journal "
+                          "/var/tmp/{profile}/{region}.jsonl".split())
+        self.assertTrue(args.resume)
+        self.assertEquals(journal_path(args, "prod", "us-east-1"),
+                          "/var/tmp/prod/us-east-1.jsonl")
+        self.assertIsNone(journal_path(parse_args(["list"]), "prod", None))
+
+        with patch("sys.stderr"):
+            self.assertRaises(SystemExit, parse_args,
+                              "delete --resume --apply plan.jsonl".split())
+
+    def test_where_parser(self):
+        args = parse_args(["delete", "--where", "size > 100 and not tag:Keep"])
+        self.assertEquals(args.where, "size > 100 and not tag:Keep")
+        self.assertIsNone(parse_args(["list"]).where)
+        with patch("sys.stderr"):
+            self.assertRaises(SystemExit, parse_args,
+                              ["list", "--where", "size ~ 100"])
+
+    def test_retention_parser(self):
+        args = parse_args("delete --daily 7 --weekly 4".split())
+        self.assertEquals(args.type, "policy")
+        policy = build_retention(args)
+        self.assertEquals((policy.daily, policy.weekly, policy.monthly),
+                          (7, 4, 0))
+        self.assertIsNone(build_retention(parse_args(["list"])))
+
+    def test_retention_parser_errors(self):
+        for cmd_line in ["delete --type policy",
+                         "list --type days --monthly 12"]:
+            with patch("sys.stderr"):
+                self.assertRaises(SystemExit, parse_args, cmd_line.split())
+
+    def test_create_parser_volume_filter(self):
+        cmd_line = "create --volume-filter tag:Backup=true"
+        args = parse_args(cmd_line.split())
+        self.assertEquals(args.volume_ids, [])
+        self.assertEquals(args.volume_filters, ["tag:Backup=true"])
+
+    def test_create_parser_instance(self):
+        args = parse_args("create --instance i-123456 --max-skew 1".split())
+        self.assertEquals(args.volume_ids, [])
+        self.assertEquals(args.instance_id, "i-123456")
+        self.assertEquals(args.max_skew, 1.0)
+        with patch("sys.stderr"):
+            self.assertRaises(SystemExit, parse_args,
+                              "create --max-skew 1 vol-123456".split())
+
+    def test_parse_args_does_not_import_boto(self):
+        # A new interpreter, since this one has boto loaded already.
+        code = ("import sys\n"
+                "from simplesnapshot.cmdline import parse_args\n"
+                "parse_args(['delete', '--daily', '7'])\n"
+                "print('boto.ec2' in sys.modules)")
+        output = subprocess.check_output([sys.executable, "-c", code])
+        self.assertEqual(output.strip(), "False")
+
+    def test_create_parser_wait(self):
+        cmd_line = "create --wait --wait-timeout 600 vol-123456"
+        args = parse_args(cmd_line.split())
+        self.assertTrue(args.wait)
+        self.assertEquals(args.wait_timeout, 600)
+        self.assertEquals(args.poll_interval, 5)
 
     def test_config_missing_region(self):
         fp = StringIO()
@@ -175,7 +310,10 @@ class TestCmdline(unittest.TestCase):
         self.mock_snapshot.assert_called_once_with(
             self.fakeconn,
             snapshot_ids=[],
-            volume_id=None,
+            volume_ids=[],
+            volume_filters={},
+            instance_id=None,
+            max_skew=None,
             description="",
             count=0,
             limit=0,
@@ -186,7 +324,25 @@ class TestCmdline(unittest.TestCase):
             tags={},
             owner="self",
             auto_confirm=True,
-            dry_run=True
+            dry_run=True,
+            workers=1,
+            page_size=0,
+            stream=False,
+            catalog=None,
+            retention=None,
+            group_by=None,
+            date_pushdown=True,
+            where=None,
+            output="table",
+            columns=None,
+            wait=False,
+            wait_timeout=3600,
+            poll_interval=5,
+            journal=None,
+            plan_info={"profile": "testing"},
+            plan_only=False,
+            resume=False,
+            profile=None
         )
         self.mock_snapshot_instance.run.assert_called_once_with("list")
         self.parse_args_patch.start()
@@ -194,13 +350,17 @@ class TestCmdline(unittest.TestCase):
     def test_main_create_call_signature(self):
         self.parse_args_patch.stop()
         cmdline = ("-y --region ap-northwest-1 create "
+                   "--cache-file /nonexistent/catalog.db "
                    "--description CreateTest --tags Name=Test "
                    "Type=UnderTest -- vol-9999999").split()
         self.assertRaises(RuntimeError, main, cmdline)
         self.mock_snapshot.assert_called_once_with(
             self.fakeconn,
             snapshot_ids=[],
-            volume_id="vol-9999999",
+            volume_ids=["vol-9999999"],
+            volume_filters={},
+            instance_id=None,
+            max_skew=None,
             description="CreateTest",
             count=0,
             limit=0,
@@ -210,7 +370,25 @@ class TestCmdline(unittest.TestCase):
                   "Type": "UnderTest"},
             owner="self",
             auto_confirm=True,
-            dry_run=False
+            dry_run=False,
+            workers=1,
+            page_size=0,
+            stream=False,
+            catalog=None,
+            retention=None,
+            group_by=None,
+            date_pushdown=False,
+            where=None,
+            output="table",
+            columns=None,
+            wait=False,
+            wait_timeout=3600,
+            poll_interval=5,
+            journal=None,
+            plan_info={"profile": "default"},
+            plan_only=False,
+            resume=False,
+            profile=None
         )
         self.mock_snapshot_instance.run.assert_called_once_with("create")
         self.parse_args_patch.start()
@@ -218,12 +396,15 @@ class TestCmdline(unittest.TestCase):
     def test_main_delete_call_signature(self):
         self.parse_args_patch.stop()
         cmdline = ("-y --r eu-west-1 delete --count=2 --type=days "
-                   "--filter Name=Backup -- snap-111111").split()
+                   "--workers=8 --filter Name=Backup -- snap-111111").split()
         self.assertRaises(RuntimeError, main, cmdline)
         self.mock_snapshot.assert_called_once_with(
             self.fakeconn,
             snapshot_ids=["snap-111111"],
-            volume_id=None,
+            volume_ids=[],
+            volume_filters={},
+            instance_id=None,
+            max_skew=None,
             description="",
             count=2,
             limit=0,
@@ -232,7 +413,104 @@ class TestCmdline(unittest.TestCase):
             tags={},
             owner="self",
             auto_confirm=True,
-            dry_run=False
+            dry_run=False,
+            workers=8,
+            page_size=0,
+            stream=False,
+            catalog=None,
+            retention=None,
+            group_by=None,
+            date_pushdown=False,
+            where=None,
+            output="table",
+            columns=None,
+            wait=False,
+            wait_timeout=3600,
+            poll_interval=5,
+            journal=("~/.cache/ec2-simple-snapshot/"
+                     "delete-default-eu-west-1.jsonl"),
+            plan_info={"profile": "default"},
+            plan_only=False,
+            resume=False,
+            profile=None
         )
         self.mock_snapshot_instance.run.assert_called_once_with("delete")
         self.parse_args_patch.start()
+
+    def test_parse_regions(self):
+        self.assertEquals(parse_regions(None), [None])
+        self.assertEquals(parse_regions("us-east-1"), ["us-east-1"])
+        self.assertEquals(parse_regions("us-east-1, eu-west-1,us-east-1"),
+                          ["us-east-1", "eu-west-1"])
+
+    def test_parse_regions_all(self):
+        regions = []
+        for name in ["us-west-2", "eu-west-1", "us-east-1"]:
+            region = Mock()
+            region.name = name
+            regions.append(region)
+        self.mock_ec2.regions.return_value = regions
+
+        self.assertEquals(parse_regions("all"),
+                          ["eu-west-1", "us-east-1", "us-west-2"])
+
+    def test_main_multi_region(self):
+        self.parse_args_patch.stop()
+        self.mock_run_consoles.return_value = 0
+        cmdline = "-r us-east-1,eu-west-1 list".split()
+        self.assertEquals(main(cmdline), 0)
+        self.assertEquals(
+            [x[0][0] for x in self.mock_ec2.connect_to_region.call_args_list],
+            ["us-east-1", "eu-west-1"]
+        )
+        self.mock_run_consoles.assert_called_once_with(
+            [self.mock_snapshot_instance, self.mock_snapshot_instance],
+            "list", workers=10, failures=[]
+        )
+        self.assertFalse(self.mock_snapshot_instance.run.called)
+        self.parse_args_patch.start()
+
+    def _fake_config(self):
+        fp = StringIO()
+        for profile in ["default", "prod-east", "prod-west", "staging"]:
+            fp.write("[{0}]\n".format(profile))
+            fp.write("aws_access_key_id = AMZTESTPASS\n")
+            fp.write("aws_secret_access_key = AMZTESTKEY\n")
+        fp.seek(0)
+        return fp
+
+    def test_parse_profiles(self):
+        self.assertEquals(parse_profiles(None, "testing"), ["testing"])
+        self.assertEquals(parse_profiles(self._fake_config(),
+                                         "staging,prod-*,prod-east"),
+                          ["staging", "prod-east", "prod-west"])
+
+    def test_parse_profiles_no_match(self):
+        self.assertRaises(ValueError, parse_profiles, self._fake_config(),
+                          "dev-*")
+
+    def test_main_multi_profile(self):
+        self.parse_args_patch.stop()
+        self.mock_read_config.side_effect = iter([self.fakeconfig,
+                                                  RuntimeError("Bad profile")])
+        self.mock_run_consoles.return_value = 1
+        cmdline = "-p prod,dev -r us-east-1 -j 4 list".split()
+        self.assertEquals(main(cmdline), 1)
+
+        self.assertEquals(self.mock_snapshot.call_args[1]["profile"], "prod")
+        args, kwargs = self.mock_run_consoles.call_args
+        self.assertEquals(args, ([self.mock_snapshot_instance], "list"))
+        self.assertEquals(kwargs["workers"], 4)
+        self.assertEquals([x[0] for x in kwargs["failures"]], ["dev"])
+        self.parse_args_patch.start()
+
+    def test_build_catalog(self):
+        args = parse_args("list --cache-ttl 60".split())
+        self.assertIsNone(build_catalog(parse_args(["list"]), "a", "b"))
+
+        with patch("simplesnapshot.cmdline.SnapshotCatalog",
+                   autospec=True) as catalog:
+            build_catalog(args, "testing", "us-east-1")
+            catalog.assert_called_once_with(args.cache_file, ttl=60,
+                                            scope=("testing", "us-east-1"),
+                                            refresh=False)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+import unittest
+
+from mock import patch
+from StringIO import StringIO
+
+from simplesnapshot.daemon import *
+
+SCHEDULE = """
+[nightly]
+command = -p prod -y create --volume-filter tag:Backup=true
+every = 1d
+offset = 2h
+
+[prune]
+command = -y delete --count 30 --cache-ttl 600
+every = 6h
+"""
+
+
+class TestDaemon(unittest.TestCase):
+
+    def test_parse_interval(self):
+        self.assertEqual(parse_interval("90"), 90)
+        self.assertEqual(parse_interval("15m"), 900)
+        self.assertEqual(parse_interval(" 1D "), 86400)
+        self.assertRaises(ValueError, parse_interval, "1y")
+
+    def test_next_run(self):
+        job = Job("nightly", None, 86400, 7200)
+        self.assertEqual(job.next_run(0), 7200)
+        self.assertEqual(job.next_run(7200), 86400 + 7200)
+        self.assertEqual(job.next_run(93600), 86400 * 2 + 7200)
+
+    def test_read_schedule(self):
+        jobs = read_schedule(StringIO(SCHEDULE))
+        self.assertEqual([(x.name, x.every, x.offset) for x in jobs],
+                         [("nightly", 86400, 7200), ("prune", 21600, 0)])
+        self.assertEqual(jobs[0].args.command, "create")
+        self.assertEqual(jobs[0].args.profile, "prod")
+        self.assertEqual(jobs[1].args.cache_ttl, 600)
+
+    def test_read_schedule_errors(self):
+        for schedule in ["", "[a]\nevery = 1h\n",
+                         "[a]\ncommand = -y list\n",
+                         "[a]\ncommand = delete --count 3\nevery = 1h\n",
+                         "[a]\ncommand = daemon x\nevery = 1h\n"]:
+            self.assertRaises(ValueError, read_schedule, StringIO(schedule))
+
+        with patch("sys.stderr"):
+            self.assertRaises(ValueError, read_schedule,
+                              StringIO("[a]\ncommand = -y nope\nevery = 1h"))
+
+    @patch("simplesnapshot.daemon.run")
+    def test_scheduler(self, mock_run):
+        now = [3600.0]
+        jobs = read_schedule(StringIO(SCHEDULE))
+        scheduler = Scheduler(jobs, clock=lambda: now[0])
+        mock_run.return_value = None
+
+        self.assertEqual(scheduler.run_pending(), 3600)
+        self.assertFalse(mock_run.called)
+
+        now[0] = 7200.0
+        with patch("sys.stderr"):
+            self.assertEqual(scheduler.run_pending(), 14400)
+        mock_run.assert_called_once_with(jobs[0].args, scheduler.warm)
+
+        # A failing job is reported and rescheduled.
+        now[0] = 21600.0
+        mock_run.side_effect = RuntimeError("Connection reset")
+        with patch("sys.stderr"):
+            self.assertEqual(scheduler.run_pending(), 21600)
+        self.assertEqual(mock_run.call_count, 2)
+
+    def test_warm_sessions(self):
+        warm = WarmState()
+        session = warm.session("~/.aws/config")
+        self.assertIs(warm.session("~/.aws/config"), session)
+        self.assertIsNot(warm.session("~/.aws/config",
+                                      "http://127.0.0.1:8773/"), session)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+import json
+import unittest
+
+from mock import patch, Mock
+from StringIO import StringIO
+from boto.ec2 import EC2Connection
+from boto.ec2.snapshot import Snapshot
+
+from simplesnapshot.snapshot import SimpleSnapshotConsole
+from simplesnapshot.fanout import *
+
+
+def _snapshot(snapshot_id, start_time):
+    snap = Snapshot()
+    snap.id = snapshot_id
+    snap.start_time = start_time
+    return snap
+
+
+class TestFanout(unittest.TestCase):
+
+    def setUp(self):
+        self.east = Mock(spec=EC2Connection)
+        self.east.get_all_snapshots.return_value = [
+            _snapshot("snap-e1", "2013-09-21T02:05:32.000Z"),
+            _snapshot("snap-e2", "2013-09-23T22:09:55.000Z"),
+        ]
+        self.west = Mock(spec=EC2Connection)
+        self.west.get_all_snapshots.return_value = [
+            _snapshot("snap-w1", "2013-09-22T04:10:05.000Z"),
+            _snapshot("snap-w2", "2013-09-24T22:09:55.000Z"),
+            _snapshot("snap-w3", "2013-09-20T22:09:55.000Z"),
+        ]
+        self.consoles = [SimpleSnapshotConsole(self.east, auto_confirm=True),
+                         SimpleSnapshotConsole(self.west, auto_confirm=True)]
+
+    def test_run_parallel_keeps_order(self):
+        self.assertEqual(run_parallel(lambda x: x * 2, range(10), 4),
+                         [x * 2 for x in range(10)])
+
+    def test_merge_snapshots(self):
+        streams = [x.get_snapshots() for x in self.consoles]
+        self.assertEqual([(tag, snap.id) for tag, snap in
+                          merge_snapshots(streams)],
+                         [(1, "snap-w2"), (0, "snap-e2"), (1, "snap-w1"),
+                          (0, "snap-e1"), (1, "snap-w3")])
+
+    def listed(self, status):
+        # Run `list` and return the snapshot ids written to stdout.
+        for console in self.consoles:
+            console.output = "csv"
+            console.columns = ["id"]
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            self.assertEqual(run_consoles(self.consoles, "list"), status)
+        return stdout.getvalue().split()[1:]
+
+    def test_run_consoles_list(self):
+        self.assertEqual(self.listed(0), ["snap-w2", "snap-e2", "snap-w1",
+                                          "snap-e1", "snap-w3"])
+        self.assertEqual(self.east.get_all_snapshots.call_count, 1)
+        self.assertEqual(self.west.get_all_snapshots.call_count, 1)
+
+    def test_run_consoles_status(self):
+        consoles = [Mock(profile=None, conn=None), Mock(profile=None,
+                                                        conn=None)]
+        for console in consoles:
+            console.auto_confirm = True
+        consoles[0].run.return_value = None
+        consoles[1].run.return_value = 1
+        self.assertEqual(run_consoles(consoles, "create"), 1)
+        for console in consoles:
+            console.run.assert_called_once_with("create")
+
+    def test_run_consoles_aggregates_failures(self):
+        self.consoles[0].profile = "prod"
+        self.east.get_all_snapshots.side_effect = RuntimeError("AuthFailure")
+        with patch("simplesnapshot.fanout.output_failures") as failures:
+            self.assertEqual(self.listed(1), ["snap-w2", "snap-w1",
+                                              "snap-w3"])
+        (reported,), _ = failures.call_args
+        self.assertEqual([x[0] for x in reported], ["prod"])
+
+    def test_console_label(self):
+        console = SimpleSnapshotConsole(self.east, profile="prod")
+        self.east.region = Mock()
+        self.east.region.name = "us-east-1"
+        self.assertEqual(console_label(console), "prod/us-east-1")
+
+    def test_run_consoles_delete_json(self):
+        for console in self.consoles:
+            console.output = "json"
+            console.columns = ["id"]
+            console.count = 1
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            with patch("sys.stderr"):
+                self.assertEqual(run_consoles(self.consoles, "delete"), 0)
+
+        # A single JSON document holds the rows of both consoles.
+        rows = json.loads(stdout.getvalue())
+        self.assertEqual(sorted(x["id"] for x in rows),
+                         ["snap-e1", "snap-w1", "snap-w3"])
+        self.assertIsNone(SimpleSnapshotConsole.shared_writer)
+
+    def test_run_consoles_delete_summaries(self):
+        self.consoles[0].profile = "prod"
+        self.consoles[1].profile = "test"
+        for console in self.consoles:
+            console.columns = ["id"]
+            console.count = 1
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            self.assertEqual(run_consoles(self.consoles, "delete"), 0)
+
+        summaries = [x for x in stdout.getvalue().splitlines()
+                     if "deleted:" in x]
+        self.assertEqual(sorted(x.split(":")[0] for x in summaries),
+                         ["prod", "test"])
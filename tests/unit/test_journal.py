@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+import os
+import shutil
+import tempfile
+import unittest
+
+from datetime import datetime
+from boto.ec2.regioninfo import RegionInfo
+from boto.ec2.snapshot import Snapshot
+
+from simplesnapshot.journal import *
+
+
+class TestDeleteJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "plans", "delete.jsonl")
+
+        self.snaps = []
+        for i, day in enumerate([21, 22, 23]):
+            snap = Snapshot()
+            snap.id = "snap-{0}".format(i)
+            snap.start_time = "2013-09-{0}T02:05:32.000Z".format(day)
+            snap.volume_id = "vol-1"
+            snap.volume_size = 8
+            snap.tags["Name"] = "backup"
+            self.snaps.append(snap)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_plan_round_trip(self):
+        DeleteJournal(self.path).write_plan(self.snaps, region="us-east-1")
+        self.assertEqual(os.listdir(os.path.dirname(self.path)),
+                         ["delete.jsonl"])
+
+        region = RegionInfo(name="us-east-1")
+        journal = DeleteJournal(self.path)
+        journal.load(region)
+        self.assertEqual(journal.info["region"], "us-east-1")
+        self.assertEqual(journal.info["count"], 3)
+        self.assertEqual([x.id for x in journal.pending()],
+                         ["snap-0", "snap-1", "snap-2"])
+
+        record = journal.snapshots[0]
+        self.assertEqual((record.volume_id, record.volume_size, record.tags),
+                         ("vol-1", 8, {"Name": "backup"}))
+        self.assertEqual(record.date, datetime(2013, 9, 21, 2, 5, 32))
+        self.assertIs(record.region, region)
+
+    def test_pending_after_outcomes(self):
+        journal = DeleteJournal(self.path)
+        journal.write_plan(self.snaps)
+        journal.record("snap-0", "deleted")
+        journal.record("snap-1", "in_use", "InvalidSnapshot.InUse: x")
+        journal.close()
+
+        # A crash while appending leaves a partial last line.
+        with open(self.path, "a") as fp:
+            fp.write('{"outcome": ["snap-2", "del')
+
+        journal = DeleteJournal(self.path)
+        journal.load()
+        self.assertEqual(journal.outcomes["snap-1"],
+                         ("in_use", "InvalidSnapshot.InUse: x"))
+        self.assertEqual([x.id for x in journal.pending()],
+                         ["snap-1", "snap-2"])
+
+        # Outcomes recorded after the partial line can be loaded again.
+        journal.record("snap-2", "deleted")
+        journal.close()
+        journal = DeleteJournal(self.path)
+        journal.load()
+        self.assertEqual([x.id for x in journal.pending()], ["snap-1"])
+
+    def test_missing_final_newline(self):
+        journal = DeleteJournal(self.path)
+        journal.write_plan(self.snaps)
+        journal.close()
+        with open(self.path, "a") as fp:
+            fp.write('{"outcome": ["snap-0", "deleted", null]}')
+
+        journal = DeleteJournal(self.path)
+        journal.load()
+        journal.record("snap-1", "deleted")
+        journal.close()
+        journal.load()
+        self.assertEqual([x.id for x in journal.pending()], ["snap-2"])
+
+    def test_not_a_journal(self):
+        os.makedirs(os.path.dirname(self.path))
+        for content in ["", '{"outcome": ["snap-0", "deleted", null]}\n',
+                        '{"plan": {}}\nnot json\n{"plan": {}}\n']:
+            with open(self.path, "w") as fp:
+                fp.write(content)
+            self.assertRaises(ValueError, DeleteJournal(self.path).load)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+import gc
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from mock import patch
+
+from simplesnapshot.bulk import bulk_delete
+from simplesnapshot.cmdline import connect
+from simplesnapshot.ratelimit import RateLimiter
+from simplesnapshot.snapshot import SimpleSnapshot
+from simplesnapshot.standin import StandinEC2, StandinServer
+from simplesnapshot.metrics import *
+
+
+class TestApiMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = ApiMetrics()
+        for seconds in [0.002, 0.02, 0.2, 20]:
+            self.metrics.record("DeleteSnapshot", seconds, 100)
+        self.metrics.record("DeleteSnapshot", 0.03, 200,
+                            "InvalidSnapshot.InUse")
+        self.metrics.record("DeleteSnapshot", 0.04, 200,
+                            "RequestLimitExceeded")
+
+    def test_record(self):
+        stats = self.metrics.actions["DeleteSnapshot"]
+        self.assertEqual((stats.calls, stats.errors, stats.throttled,
+                          stats.bytes), (6, 2, 1, 800))
+        self.assertEqual(stats.quantile(0.5), 0.04)
+        self.assertEqual(stats.quantile(0.99), 20)
+        self.assertIn("DeleteSnapshot", self.metrics.summary())
+
+    def test_throttle_and_wait(self):
+        self.metrics.throttle("DeleteSnapshot")
+        self.metrics.wait("DeleteSnapshot", 1.5)
+        stats = self.metrics.actions["DeleteSnapshot"]
+        self.assertEqual((stats.calls, stats.throttled, stats.wait),
+                         (6, 2, 1.5))
+        self.assertIn('simplesnapshot_api_rate_limit_wait_seconds_total'
+                      '{action="DeleteSnapshot"} 1.500000\n',
+                      self.metrics.prometheus())
+        self.assertIn("simplesnapshot.api.DeleteSnapshot.wait_ms:1500|c",
+                      self.metrics.statsd_lines())
+
+    def test_prometheus(self):
+        text = self.metrics.prometheus()
+        self.assertIn('simplesnapshot_api_requests_total'
+                      '{action="DeleteSnapshot"} 6\n', text)
+        self.assertIn('simplesnapshot_api_throttled_total'
+                      '{action="DeleteSnapshot"} 1\n', text)
+        name = "simplesnapshot_api_request_duration_seconds"
+        self.assertIn(name + '_bucket{action="DeleteSnapshot",le="0.005"} 1\n',
+                      text)
+        self.assertIn(name + '_bucket{action="DeleteSnapshot",le="0.05"} 4\n',
+                      text)
+        self.assertIn(name + '_bucket{action="DeleteSnapshot",le="10.0"} 5\n',
+                      text)
+        self.assertIn(name + '_bucket{action="DeleteSnapshot",le="+Inf"} 6\n',
+                      text)
+
+    def test_write_textfile(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "simplesnapshot.prom")
+            self.metrics.write_textfile(path)
+            self.assertEqual(os.listdir(directory), ["simplesnapshot.prom"])
+            with open(path) as fp:
+                self.assertEqual(fp.read(), self.metrics.prometheus())
+        finally:
+            shutil.rmtree(directory)
+
+    def test_send_statsd(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(("127.0.0.1", 0))
+        server.settimeout(5)
+        try:
+            self.metrics.send_statsd("127.0.0.1:{0}".format(
+                server.getsockname()[1]))
+            lines = server.recv(4096).splitlines()
+        finally:
+            server.close()
+
+        self.assertEqual(lines, self.metrics.statsd_lines())
+        self.assertIn("simplesnapshot.api.DeleteSnapshot.calls:6|c", lines)
+
+    def test_send_statsd_default_port(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(("127.0.0.1", 0))
+        server.settimeout(5)
+        try:
+            with patch("simplesnapshot.metrics.STATSD_PORT",
+                       server.getsockname()[1]):
+                self.metrics.send_statsd("127.0.0.1")
+            lines = server.recv(4096).splitlines()
+        finally:
+            server.close()
+
+        self.assertEqual(lines, self.metrics.statsd_lines())
+
+
+class TestInstrument(unittest.TestCase):
+
+    def setUp(self):
+        self.ec2 = StandinEC2(snapshots=20, in_use_rate=0.25, seed=1)
+        self.server = StandinServer(("127.0.0.1", 0), self.ec2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        config = {"aws_access_key_id": "AKTEST",
+                  "aws_secret_access_key": "TESTKEY"}
+        self.conn = connect(config, "us-east-1", self.server.endpoint_url)
+
+    def tearDown(self):
+        # The instrumented connection references itself; collect it so
+        # its keep-alive connections to the server are closed.
+        del self.conn
+        gc.collect()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_instrument(self):
+        metrics = ApiMetrics()
+        metrics.instrument(self.conn)
+        metrics.instrument(self.conn)
+
+        snapshot = SimpleSnapshot(self.conn)
+        result = bulk_delete(self.conn, snapshot.snapshots, workers=4)
+
+        describe = metrics.actions["DescribeSnapshots"]
+        self.assertEqual(describe.calls, 1)
+        self.assertTrue(describe.bytes > 0)
+
+        delete = metrics.actions["DeleteSnapshot"]
+        self.assertEqual(delete.calls, 20)
+        self.assertEqual(delete.errors, len(result.errors))
+        self.assertTrue(delete.errors > 0)
+        self.assertEqual(len(delete.latencies), 20)
+
+    def test_instrument_rate_limited(self):
+        self.ec2.throttle_rate = 0.3
+        self.ec2.in_use.clear()
+        limiter = RateLimiter(base_delay=0.2, random=lambda: 1.0)
+        limiter.install(self.conn)
+        metrics = ApiMetrics()
+        metrics.instrument(self.conn)
+
+        snapshot = SimpleSnapshot(self.conn)
+        bulk_delete(self.conn, snapshot.snapshots, workers=4)
+
+        # Every throttled attempt is counted, though each call succeeds
+        # in the end, and backoff is wait time rather than latency.
+        delete = metrics.actions["DeleteSnapshot"]
+        self.assertEqual(delete.calls, 20)
+        self.assertEqual(delete.errors, 0)
+        self.assertEqual(delete.throttled,
+                         self.ec2.calls["DeleteSnapshot"] - 20)
+        self.assertTrue(delete.throttled > 0)
+        self.assertTrue(delete.wait >= 0.2 * delete.throttled)
+        self.assertTrue(max(delete.latencies) < 0.2)
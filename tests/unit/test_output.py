@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import unittest
+
+from mock import Mock, patch
+from StringIO import StringIO
+from boto.ec2.regioninfo import RegionInfo
+
+from simplesnapshot.output import *
+from simplesnapshot.snapshot import SnapshotRecord
+
+
+class TestOutput(unittest.TestCase):
+
+    def setUp(self):
+        region = RegionInfo(name="us-east-1")
+        self.snaps = [
+            SnapshotRecord("snap-1", "vol-1", "completed", "100%",
+                           "2013-09-22T04:10:05.000Z", 8, u"Caf\xe9 backup",
+                           tags={"Name": "web", "Type": "nightly"},
+                           region=region),
+            SnapshotRecord("snap-2", "vol-2", "pending", None,
+                           "2013-09-21T02:05:32.000Z", 16, "",
+                           region=region),
+        ]
+
+    def render(self, output, columns=None, profile=None, fp=None):
+        fp = fp or StringIO()
+        out = writer(output, fp, columns, profile=profile is not None)
+        out.header()
+        for snap in self.snaps:
+            out.write(snap, profile)
+        out.close()
+        return fp.getvalue()
+
+    def test_table(self):
+        lines = self.render("table").splitlines()
+        self.assertEqual(lines[0],
+                         "SNAPSHOT_ID   STATUS    %    START_TIME" + " " * 15 +
+                         "REGION         VOLUME_ID    DESCRIPTION")
+        self.assertEqual(lines[1].decode("utf-8"),
+                         u"snap-1        completed 100% "
+                         u"2013-09-22T04:10:05.000Z us-east-1      "
+                         u"vol-1        Caf\xe9 backup")
+        self.assertEqual(lines[2].split(), ["snap-2", "pending", "None",
+                                            "2013-09-21T02:05:32.000Z",
+                                            "us-east-1", "vol-2"])
+
+    def test_table_profile(self):
+        lines = self.render("table", ["id"], profile="prod").splitlines()
+        self.assertEqual(lines, ["PROFILE" + " " * 13 + "SNAPSHOT_ID",
+                                 "prod" + " " * 16 + "snap-1",
+                                 "prod" + " " * 16 + "snap-2"])
+
+    def test_csv(self):
+        self.assertEqual(self.render("csv", ["id", "progress", "tags",
+                                             "description"]),
+                         "id,progress,tags,description\n"
+                         "snap-1,100%,Name=web;Type=nightly,"
+                         "Caf\xc3\xa9 backup\n"
+                         "snap-2,,,\n")
+
+    def test_ndjson(self):
+        lines = self.render("ndjson", ["id", "volume_size", "tags",
+                                       "progress"]).splitlines()
+        self.assertTrue(lines[0].startswith('{"id": "snap-1", '
+                                            '"volume_size": 8, "tags": {'))
+        self.assertEqual(json.loads(lines[0])["tags"],
+                         {"Name": "web", "Type": "nightly"})
+        self.assertEqual(json.loads(lines[1]),
+                         {"id": "snap-2", "volume_size": 16, "tags": {},
+                          "progress": None})
+
+    def test_json(self):
+        rows = json.loads(self.render("json", profile="prod"))
+        self.assertEqual([x["id"] for x in rows], ["snap-1", "snap-2"])
+        self.assertEqual(rows[0]["profile"], "prod")
+        self.assertEqual(rows[0]["description"], u"Caf\xe9 backup")
+        self.assertTrue(self.render("json").startswith('[\n{"id": '))
+
+        out = writer("json", StringIO())
+        out.header()
+        out.close()
+        self.assertEqual(json.loads(out.out.fp.getvalue()), [])
+
+    def test_shared_writer(self):
+        fp = StringIO()
+        shared = SharedWriter(writer("json", fp, ["id"]))
+        for snap in self.snaps:
+            # Every console writes a header and closes its output.
+            shared.header()
+            shared.write(snap)
+            shared.close()
+        shared.finish()
+        self.assertEqual(json.loads(fp.getvalue()),
+                         [{"id": "snap-1"}, {"id": "snap-2"}])
+
+        fp = StringIO()
+        SharedWriter(writer("json", fp)).finish()
+        self.assertEqual(fp.getvalue(), "")
+
+    def test_ndjson_flushes_incrementally(self):
+        fp = Mock()
+        out = writer("ndjson", fp, ["id"])
+        for i in range(NDJSONWriter.rows * 2 + 1):
+            out.write(self.snaps[0])
+        self.assertEqual(fp.write.call_count, 2)
+        out.close()
+        self.assertEqual(fp.write.call_count, 3)
+
+    def test_buffered_output_interval(self):
+        fp = Mock()
+        out = BufferedOutput(fp, rows=1000, interval=0.5)
+        with patch("simplesnapshot.output.time.time", return_value=0):
+            out.flushed = 0
+            out.write("a")
+        self.assertFalse(fp.write.called)
+        with patch("simplesnapshot.output.time.time", return_value=1):
+            out.write("b")
+        fp.write.assert_called_once_with("ab")
+
+    def test_parse_columns(self):
+        self.assertEqual(parse_columns("id, tags,"), ["id", "tags"])
+        self.assertRaises(ValueError, parse_columns, "id,size")
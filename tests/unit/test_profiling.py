@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from argparse import Namespace
+from mock import patch
+
+from simplesnapshot.profiling import *
+
+
+class TestRunProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = RunProfiler()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_nested_phases(self):
+        # (wall, cpu, memory) read on entering and leaving each phase.
+        measures = iter([(0.0, 0.0, 0), (1.0, 0.5, 0), (4.0, 1.0, 0),
+                         (5.0, 1.5, 0), (7.0, 2.0, 0), (8.0, 2.0, 0)])
+        with patch.object(self.profiler, "_measure",
+                          side_effect=lambda: next(measures)):
+            with self.profiler.phase("records"):
+                for _ in range(2):
+                    with self.profiler.phase("api"):
+                        pass
+
+        phases = self.profiler.phases
+        self.assertEqual(list(phases), ["api", "records"])
+        self.assertEqual((phases["api"].calls, phases["api"].wall,
+                          phases["api"].cpu), (2, 5.0, 1.0))
+        self.assertEqual((phases["records"].calls, phases["records"].wall,
+                          phases["records"].cpu), (1, 3.0, 1.0))
+
+    def test_summary(self):
+        self.profiler.start()
+        with self.profiler.phase("sort"):
+            pass
+        self.profiler.stop()
+        self.profiler.elapsed = 10.0
+
+        lines = self.profiler.summary().splitlines()
+        self.assertEqual(lines[0].split(),
+                         ["PHASE", "CALLS", "WALL_S", "CPU_S", "%WALL"])
+        self.assertEqual([x.split()[0] for x in lines[1:]],
+                         ["sort", "(other)", "total"])
+        self.assertEqual(lines[-1].split(), ["total", "10.000"])
+
+    def test_memory(self):
+        profiler = RunProfiler(memory=True)
+        self.assertIn(profiler.memory_source, ["tracemalloc", "ru_maxrss"])
+        profiler.start()
+        with profiler.phase("records"):
+            records = [object() for _ in range(1000)]
+        profiler.stop()
+
+        self.assertEqual(len(records), 1000)
+        self.assertGreaterEqual(profiler.phases["records"].memory, 0)
+        self.assertIn("MEM_KB", profiler.summary())
+
+    def test_write(self):
+        profiler = RunProfiler(cprofile=True)
+        profiler.start()
+        with profiler.phase("filter"):
+            sorted(range(100), reverse=True)
+        profiler.stop()
+
+        prefix = os.path.join(self.tmpdir, "run")
+        paths = profiler.write(prefix, Namespace(command="delete"))
+        self.assertEqual(paths, [prefix + ".txt", prefix + ".pstats"])
+
+        with open(paths[0]) as fp:
+            report = fp.read()
+        self.assertIn("arguments: command='delete'", report)
+        self.assertIn("filter", report)
+        self.assertIn("cProfile", report)
+        self.assertTrue(pstats.Stats(paths[1]).total_calls > 0)
+
+    def test_write_without_cprofile(self):
+        prefix = os.path.join(self.tmpdir, "run")
+        self.assertEqual(self.profiler.write(prefix), [prefix + ".txt"])
+        self.assertFalse(os.path.exists(prefix + ".pstats"))
+
+    def test_null_profiler(self):
+        with NULL_PROFILER.phase("api") as phase:
+            pass
+        self.assertIs(NULL_PROFILER.phase("sort"), phase)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+import gc
+import threading
+import unittest
+
+from boto.exception import BotoServerError
+
+from simplesnapshot.bulk import bulk_delete, DELETED
+from simplesnapshot.cmdline import connect
+from simplesnapshot.snapshot import SimpleSnapshot
+from simplesnapshot.standin import StandinEC2, StandinServer
+from simplesnapshot.ratelimit import *
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [0.0]
+        self.slept = []
+
+    def clock(self):
+        return self.now[0]
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now[0] += seconds
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(2, clock=self.clock, sleep=self.sleep)
+        self.assertEqual([bucket.acquire() for _ in range(4)],
+                         [0.0, 0.0, 0.5, 0.5])
+        self.now[0] += 10
+        # Refills stop at the bucket size.
+        self.assertEqual([bucket.acquire() for _ in range(3)],
+                         [0.0, 0.0, 0.5])
+
+    def test_token_bucket_aimd(self):
+        bucket = TokenBucket(clock=self.clock, sleep=self.sleep)
+        self.assertEqual(sum(bucket.acquire() for _ in range(40)), 0.0)
+
+        # Throttling starts limiting at half the rate calls were sent.
+        bucket.throttled()
+        self.assertEqual(bucket.rate, 20)
+        bucket.throttled()
+        self.assertEqual(bucket.rate, 20)
+        self.assertEqual(bucket.acquire(), 0.05)
+
+        for _ in range(20):
+            bucket.success()
+        self.assertAlmostEqual(bucket.rate, 21, places=1)
+
+        # A given rate is never exceeded.
+        bucket = TokenBucket(10, clock=self.clock, sleep=self.sleep)
+        bucket.success()
+        self.assertEqual(bucket.rate, 10)
+
+    def test_concurrency_aimd(self):
+        concurrency = AdaptiveConcurrency(8, cooldown=1.0, clock=self.clock)
+        concurrency.throttled()
+        self.assertEqual(concurrency.limit, 4)
+        # Calls throttled right after a decrease do not decrease again.
+        concurrency.throttled()
+        self.assertEqual(concurrency.limit, 4)
+
+        # About one more call for every `limit` successful calls.
+        for _ in range(4):
+            concurrency.success()
+        self.assertAlmostEqual(concurrency.limit, 4.92, places=2)
+
+        self.now[0] = 1.0
+        for _ in range(5):
+            concurrency.throttled()
+            self.now[0] += 1
+        self.assertEqual(concurrency.limit, 1)
+
+    def test_backoff(self):
+        limiter = RateLimiter(base_delay=0.5, max_delay=3.0,
+                              random=lambda: 1.0)
+        self.assertEqual([limiter.backoff(i) for i in range(4)],
+                         [0.5, 1.0, 2.0, 3.0])
+        limiter.random = lambda: 0.5
+        self.assertEqual(limiter.backoff(1), 0.5)
+
+    def test_buckets_per_action(self):
+        limiter = RateLimiter()
+        self.assertIs(limiter.bucket("DeleteSnapshot"),
+                      limiter.bucket("DeleteSnapshot"))
+        self.assertIsNot(limiter.bucket("DescribeSnapshots"),
+                         limiter.bucket("DeleteSnapshot"))
+        self.assertIsNone(limiter.bucket("DeleteSnapshot").rate)
+        self.assertEqual(RateLimiter(50).bucket("DeleteSnapshot").rate, 50)
+
+
+class TestInstall(unittest.TestCase):
+
+    def setUp(self):
+        self.ec2 = StandinEC2(snapshots=60, rate_limit=40, seed=1)
+        self.server = StandinServer(("127.0.0.1", 0), self.ec2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        config = {"aws_access_key_id": "AKTEST",
+                  "aws_secret_access_key": "TESTKEY"}
+        self.conn = connect(config, "us-east-1", self.server.endpoint_url)
+
+    def tearDown(self):
+        # The wrapped connection references itself; collect it so its
+        # keep-alive connections to the server are closed.
+        del self.conn
+        gc.collect()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_throttled_calls_are_retried(self):
+        limiter = RateLimiter(base_delay=0.05)
+        limiter.install(self.conn)
+        limiter.install(self.conn)
+
+        snapshots = SimpleSnapshot(self.conn).snapshots
+        result = bulk_delete(self.conn, snapshots, workers=16)
+
+        self.assertEqual(result.counts[DELETED], 60)
+        self.assertEqual(self.ec2.snapshots, {})
+        self.assertTrue(limiter.throttles["DeleteSnapshot"] > 0)
+        self.assertTrue(limiter.bucket("DeleteSnapshot").rate > 0)
+        self.assertTrue(limiter.concurrency.limit < 64)
+        self.assertEqual(limiter.concurrency.active, 0)
+
+    def test_retries_exhausted(self):
+        self.ec2.throttle_rate = 1.0
+        limiter = RateLimiter(max_retries=2, sleep=lambda seconds: None)
+        limiter.install(self.conn)
+
+        try:
+            self.conn.get_all_snapshots()
+            self.fail("BotoServerError not raised")
+        except BotoServerError, e:
+            self.assertEqual(e.error_code, "RequestLimitExceeded")
+
+        self.assertEqual(self.ec2.calls["DescribeSnapshots"], 3)
+        self.assertEqual(limiter.throttles["DescribeSnapshots"], 3)
+        self.assertEqual(limiter.concurrency.active, 0)
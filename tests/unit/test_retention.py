@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+import unittest
+
+from datetime import datetime, timedelta
+from mock import Mock
+
+from simplesnapshot.retention import *
+from simplesnapshot.snapshot import SimpleSnapshot, SnapshotIndex
+
+
+def _snaps(dates):
+    snaps = []
+    for i, date in enumerate(dates):
+        snap = Mock()
+        snap.id = "snap-{0}".format(i)
+        snap.date = date
+        snaps.append(snap)
+    return snaps
+
+
+class TestRetentionPolicy(unittest.TestCase):
+
+    def setUp(self):
+        # Two snapshots a day, newest first, from Tuesday 2013-10-01
+        # back to Sunday 2013-08-04.
+        start = datetime(2013, 10, 1, 20)
+        dates = []
+        for day in range(59):
+            for hour in [0, 12]:
+                dates.append(start - timedelta(days=day, hours=hour))
+        self.snaps = _snaps(dates)
+
+    def assert_split(self, policy, expected):
+        keep, delete = policy.select(self.snaps)
+        self.assertEqual([self.snaps[i].date.strftime("%m-%d %H")
+                          for i in keep], expected)
+        self.assertEqual(sorted(keep + delete), range(len(self.snaps)))
+        self.assertEqual(delete, sorted(delete))
+
+    def test_daily(self):
+        self.assert_split(RetentionPolicy(daily=3),
+                          ["10-01 20", "09-30 20", "09-29 20"])
+
+    def test_weekly(self):
+        # Weeks start on Monday: 09-30, 09-23 and 09-16.
+        self.assert_split(RetentionPolicy(weekly=3),
+                          ["10-01 20", "09-29 20", "09-22 20"])
+
+    def test_monthly(self):
+        self.assert_split(RetentionPolicy(monthly=4),
+                          ["10-01 20", "09-30 20", "08-31 20"])
+
+    def test_combined_rules_share_snapshots(self):
+        self.assert_split(RetentionPolicy(daily=2, weekly=2, monthly=2),
+                          ["10-01 20", "09-30 20", "09-29 20"])
+
+    def test_keys_from_index(self):
+        policy = RetentionPolicy(daily=7, weekly=4, monthly=12)
+        self.assertEqual(policy.select(self.snaps,
+                                       SnapshotIndex(self.snaps).keys),
+                         policy.select(self.snaps))
+
+    def test_empty(self):
+        self.assertEqual(RetentionPolicy(daily=1).select([]), ([], []))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, RetentionPolicy)
+        self.assertRaises(ValueError, RetentionPolicy, daily=-1, weekly=2)
+
+
+class TestSimpleSnapshotRetention(unittest.TestCase):
+
+    def setUp(self):
+        dates = [datetime(2013, 9, 22, 6), datetime(2013, 9, 22, 2),
+                 datetime(2013, 9, 21), datetime(2013, 9, 15),
+                 datetime(2013, 9, 14), datetime(2013, 8, 1)]
+        self.snaps = _snaps(dates)
+        self.snapshot = SimpleSnapshot(Mock(), count_type="policy",
+                                       retention=RetentionPolicy(daily=2,
+                                                                 monthly=2))
+        self.snapshot._snapshots = self.snaps
+
+    def ids(self, snaps):
+        return [x.id for x in snaps]
+
+    def test_retain(self):
+        keep, delete = self.snapshot.retain()
+        self.assertEqual(self.ids(keep), ["snap-0", "snap-2", "snap-5"])
+        self.assertEqual(self.ids(delete), ["snap-1", "snap-3", "snap-4"])
+
+    def test_get_snapshots(self):
+        self.assertEqual(self.ids(self.snapshot.get_snapshots()),
+                         ["snap-0", "snap-2", "snap-5"])
+        self.assertEqual(self.ids(self.snapshot.get_snapshots(inverse=True)),
+                         ["snap-4", "snap-3", "snap-1"])
+
+    def test_get_snapshots_limit(self):
+        self.snapshot.limit = 2
+        self.assertEqual(self.ids(self.snapshot.get_snapshots()),
+                         ["snap-0", "snap-2"])
+        self.assertEqual(self.ids(self.snapshot.get_snapshots(inverse=True)),
+                         ["snap-4", "snap-3"])
+
+    def test_policy_required(self):
+        self.assertRaises(ValueError, SimpleSnapshot, Mock(),
+                          count_type="policy")
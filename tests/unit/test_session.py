@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+import threading
+import unittest
+
+from mock import patch, Mock
+from boto.ec2 import EC2Connection
+
+from simplesnapshot.snapshot import SimpleSnapshot
+from simplesnapshot.session import *
+
+
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        self.read_config_patch = patch("simplesnapshot.cmdline.read_config")
+        self.mock_read_config = self.read_config_patch.start()
+        self.mock_read_config.side_effect = lambda path, profile: {
+            "aws_access_key_id": "AK" + profile,
+            "aws_secret_access_key": "TESTKEY",
+            "region": "us-east-1",
+        }
+
+        self.connect_patch = patch("simplesnapshot.cmdline.connect")
+        self.mock_connect = self.connect_patch.start()
+        self.mock_connect.side_effect = lambda *args: Mock(spec=EC2Connection)
+
+        self.stat_patch = patch("os.stat")
+        self.mock_stat = self.stat_patch.start()
+        self.mock_stat.return_value.st_mtime = 1
+
+        self.session = Session("/etc/config")
+
+    def tearDown(self):
+        self.read_config_patch.stop()
+        self.connect_patch.stop()
+        self.stat_patch.stop()
+
+    def test_connection_per_profile_and_region(self):
+        conn = self.session.connection()
+        self.assertIs(self.session.connection("us-east-1", "default"), conn)
+        self.assertIsNot(self.session.connection("eu-west-1"), conn)
+        self.assertIsNot(self.session.connection(profile="prod"), conn)
+        self.assertEqual(self.mock_connect.call_count, 3)
+        self.assertEqual(self.mock_read_config.call_count, 2)
+
+    def test_connection_shared_by_threads(self):
+        conns = []
+
+        def connect():
+            conns.append(self.session.connection("us-east-1"))
+
+        threads = [threading.Thread(target=connect) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(id(x) for x in conns)), 1)
+        self.assertEqual(self.mock_connect.call_count, 1)
+
+    def test_changed_config_reconnects(self):
+        conn = self.session.connection()
+        self.mock_stat.return_value.st_mtime = 2
+        self.assertIsNot(self.session.connection(), conn)
+        self.assertEqual(self.mock_read_config.call_count, 2)
+
+    def test_rate_limiter_per_profile_and_region(self):
+        conn = self.session.connection()
+        limiter = conn._rate_limiter
+        self.assertIsNone(limiter.rate)
+
+        # The limiter outlives reconnects after configuration changes.
+        self.mock_stat.return_value.st_mtime = 2
+        self.assertIs(self.session.connection()._rate_limiter, limiter)
+        self.assertIsNot(
+            self.session.connection("eu-west-1")._rate_limiter, limiter)
+
+        self.assertEqual(Session("/etc/config", api_rate=20).connection()
+                         ._rate_limiter.rate, 20)
+        conn = Session("/etc/config", api_rate=0).connection()
+        self.assertRaises(AttributeError, getattr, conn, "_rate_limiter")
+
+    def test_credentials_are_copied(self):
+        self.session.credentials()["region"] = "eu-west-1"
+        self.assertEqual(self.session.credentials()["region"], "us-east-1")
+
+    def test_simple_snapshot_accepts_session(self):
+        snapshot = SimpleSnapshot(self.session, region="eu-west-1")
+        self.assertIs(snapshot.conn, self.session.connection("eu-west-1"))
+        self.mock_connect.assert_called_once_with(
+            self.mock_read_config("/etc/config", "default"), "eu-west-1",
+            None)
@@ -5,7 +5,10 @@ from datetime import datetime
 from mock import patch, Mock
 from boto.ec2 import EC2Connection
 from boto.ec2.snapshot import Snapshot
+from boto.exception import EC2ResponseError
+from boto.resultset import ResultSet
 
+from simplesnapshot.profiling import RunProfiler
 from simplesnapshot.snapshot import *
 
 
@@ -36,6 +39,110 @@ class TestSimpleSnapshot(unittest.TestCase):
         self.fakeconn = Mock(spec=EC2Connection)
         self.fakeconn.get_all_snapshots.return_value = self.unsorted_snaps
 
+    def test_start_time_skew(self):
+        snaps = []
+        for start_time in ["2013-09-21T02:05:32.125Z",
+                           "2013-09-21T02:05:31.875Z",
+                           "2013-09-21T02:05:32.000Z"]:
+            snap = Mock()
+            snap.start_time = start_time
+            snaps.append(snap)
+
+        self.assertEqual(start_time_skew(snaps), 0.25)
+        self.assertEqual(start_time_skew(snaps[:1]), 0.0)
+
+    def test_parse_timestamp(self):
+        self.assertEqual(parse_timestamp("2013-09-21T02:05:32.125Z"),
+                         datetime(2013, 9, 21, 2, 5, 32, 125000))
+        self.assertEqual(parse_timestamp("2013-09-21T02:05:32.5Z"),
+                         datetime(2013, 9, 21, 2, 5, 32, 500000))
+        self.assertRaises(ValueError, parse_timestamp, "2013-09-21")
+
+    def test_snapshot_record(self):
+        self.fake1.volume_id = "vol-1"
+        self.fake1.tags["Name"] = "backup"
+        record = SnapshotRecord.from_snapshot(self.fake1)
+        self.assertEqual(record.id, "snap-1")
+        self.assertEqual(record.volume_id, "vol-1")
+        self.assertEqual(record.tags, {"Name": "backup"})
+        self.assertEqual(record.date, datetime(2013, 9, 21, 2, 5, 32))
+        self.assertIsNone(SnapshotRecord.from_snapshot(self.fake2).tags)
+        self.assertFalse(hasattr(record, "__dict__"))
+
+    def test_snapshot_index(self):
+        snapshot = SimpleSnapshot(self.fakeconn)
+        index = snapshot.index
+        self.assertEqual(len(index), 5)
+        self.assertEqual(index.count_since(datetime(2013, 9, 25)), 0)
+        self.assertEqual(index.count_since(datetime(2013, 9, 22)), 4)
+        # A snapshot taken exactly at the boundary is counted.
+        self.assertEqual(index.count_since(datetime(2013, 9, 22, 4, 10, 5)),
+                         4)
+        self.assertEqual(index.count_since(datetime(2013, 9, 22, 4, 10, 6)),
+                         3)
+        self.assertEqual(index.count_since(datetime(2013, 1, 1)), 5)
+
+    def test_by_days_many_windows(self):
+        snapshot = SimpleSnapshot(self.fakeconn, count_type="days",
+                                  from_date=self.fakedate)
+        windows = []
+        for count in range(1, 6):
+            snapshot.count = count
+            windows.append(len(list(snapshot.get_snapshots())))
+        self.assertEqual(windows, [1, 2, 3, 4, 5])
+        self.assertEqual(self.fakeconn.get_all_snapshots.call_count, 1)
+
+    def set_volumes(self):
+        # snap-5, snap-3 and snap-1 belong to vol-1, the others to vol-2.
+        for snap in self.unsorted_snaps:
+            snap.volume_id = "vol-{0}".format(2 - int(snap.id[-1]) % 2)
+            snap.tags["Name"] = snap.volume_id
+
+    def test_groups(self):
+        self.set_volumes()
+        snapshot = SimpleSnapshot(self.fakeconn, group_by="volume-id")
+        self.assertEqual([(k, p, [x.id for x in i.snapshots])
+                          for k, p, i in snapshot.groups],
+                         [("vol-1", [0, 2, 4], ["snap-5", "snap-3",
+                                                "snap-1"]),
+                          ("vol-2", [1, 3], ["snap-4", "snap-2"])])
+        self.assertEqual(list(snapshot.groups[0][2].keys),
+                         [snapshot.index.keys[i] for i in [0, 2, 4]])
+
+    def test_grouped_by_num(self):
+        self.set_volumes()
+        for group_by in ["volume-id", "Name", "tag:Name"]:
+            snapshot = SimpleSnapshot(self.fakeconn, count=1,
+                                      group_by=group_by)
+            self.assertEqual([x.id for x in snapshot.get_snapshots()],
+                             ["snap-5", "snap-4"])
+            self.assertEqual([x.id for x in
+                              snapshot.get_snapshots(inverse=True)],
+                             ["snap-1", "snap-2", "snap-3"])
+
+    def test_grouped_limit(self):
+        self.set_volumes()
+        snapshot = SimpleSnapshot(self.fakeconn, limit=1,
+                                  group_by="volume-id")
+        self.assertEqual([x.id for x in snapshot.get_snapshots(inverse=True)],
+                         ["snap-1", "snap-2"])
+
+    def test_grouped_by_days(self):
+        self.set_volumes()
+        snapshot = SimpleSnapshot(self.fakeconn, count=2, count_type="days",
+                                  from_date=self.fakedate, limit=1,
+                                  group_by="volume-id")
+        self.assertEqual([x.id for x in snapshot.get_snapshots()],
+                         ["snap-5", "snap-4"])
+        self.assertEqual([x.id for x in snapshot.get_snapshots(inverse=True)],
+                         ["snap-1", "snap-2"])
+
+    def test_grouped_missing_tag(self):
+        snapshot = SimpleSnapshot(self.fakeconn, count=2, group_by="Backup")
+        self.assertEqual([k for k, p, i in snapshot.groups], [None])
+        self.assertEqual([x.id for x in snapshot.get_snapshots()],
+                         ["snap-5", "snap-4"])
+
     def test_correct_filter_select(self):
         snapshot = SimpleSnapshot(self.fakeconn, count_type="days")
         self.assertEqual(snapshot._filter_func, snapshot._by_days)
@@ -43,177 +150,331 @@ class TestSimpleSnapshot(unittest.TestCase):
     def test_wrapped_snapshots(self):
         snapshot = SimpleSnapshot(self.fakeconn)
         for snap in snapshot.snapshots:
-            self.assertIsInstance(snap, SnapshotWrapper)
+            self.assertIsInstance(snap, SnapshotRecord)
 
     def test_proper_sort(self):
         snapshot = SimpleSnapshot(self.fakeconn)
 
-        # The real snapshot object is available via the _snapshot private
-        # attribute from the SnapshotWrapper class.
-        self.assertEqual([x._snapshot for x in snapshot.snapshots],
-                         [self.fake5, self.fake4, self.fake3,
-                          self.fake2, self.fake1])
+        self.assertEqual([x.id for x in snapshot.snapshots],
+                         ["snap-5", "snap-4", "snap-3",
+                          "snap-2", "snap-1"])
+
+    def test_profiled_phases(self):
+        snapshot = SimpleSnapshot(self.fakeconn, count=2)
+        snapshot.profiler = RunProfiler()
+        self.assertEqual(len(list(snapshot.get_snapshots())), 2)
+        self.assertEqual(list(snapshot.profiler.phases),
+                         ["api", "records", "sort", "filter"])
+        # Other instances are not profiled.
+        self.assertIs(SimpleSnapshot(self.fakeconn).profiler, NULL_PROFILER)
 
     def test_by_num(self):
         snapcount1 = SimpleSnapshot(self.fakeconn, count=1)
-        self.assertEqual([x._snapshot for x in snapcount1.get_snapshots()],
-                         [self.fake5])
+        self.assertEqual([x.id for x in snapcount1.get_snapshots()],
+                         ["snap-5"])
 
         snapcount2 = SimpleSnapshot(self.fakeconn, count=2)
-        self.assertEqual([x._snapshot for x in snapcount2.get_snapshots()],
-                         [self.fake5, self.fake4])
+        self.assertEqual([x.id for x in snapcount2.get_snapshots()],
+                         ["snap-5", "snap-4"])
 
         snapcount3 = SimpleSnapshot(self.fakeconn)
-        self.assertEqual([x._snapshot for x in snapcount3.get_snapshots()],
-                         [self.fake5, self.fake4, self.fake3,
-                          self.fake2, self.fake1])
+        self.assertEqual([x.id for x in snapcount3.get_snapshots()],
+                         ["snap-5", "snap-4", "snap-3",
+                          "snap-2", "snap-1"])
 
         snapnegative1 = SimpleSnapshot(self.fakeconn, count=-2)
-        self.assertEqual([x._snapshot for x in snapnegative1.get_snapshots()],
-                         [self.fake5, self.fake4, self.fake3,
-                          self.fake2, self.fake1])
+        self.assertEqual([x.id for x in snapnegative1.get_snapshots()],
+                         ["snap-5", "snap-4", "snap-3",
+                          "snap-2", "snap-1"])
 
     def test_by_num_limit(self):
         snaplimit2 = SimpleSnapshot(self.fakeconn, limit=2)
-        self.assertEqual([x._snapshot for x in snaplimit2.get_snapshots()],
-                         [self.fake5, self.fake4])
+        self.assertEqual([x.id for x in snaplimit2.get_snapshots()],
+                         ["snap-5", "snap-4"])
 
         snaplimit4 = SimpleSnapshot(self.fakeconn, limit=4)
-        self.assertEqual([x._snapshot for x in snaplimit4.get_snapshots()],
-                         [self.fake5, self.fake4, self.fake3, self.fake2])
+        self.assertEqual([x.id for x in snaplimit4.get_snapshots()],
+                         ["snap-5", "snap-4", "snap-3", "snap-2"])
 
         snapnegative1 = SimpleSnapshot(self.fakeconn, limit=-1)
-        self.assertEqual([x._snapshot for x in snapnegative1.get_snapshots()],
-                         [self.fake5, self.fake4, self.fake3,
-                          self.fake2, self.fake1])
+        self.assertEqual([x.id for x in snapnegative1.get_snapshots()],
+                         ["snap-5", "snap-4", "snap-3",
+                          "snap-2", "snap-1"])
 
     def test_by_num_inverse(self):
         snapinverse = SimpleSnapshot(self.fakeconn)
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapinverse.get_snapshots(inverse=True)],
-                         [self.fake1, self.fake2, self.fake3,
-                          self.fake4, self.fake5])
+                         ["snap-1", "snap-2", "snap-3",
+                          "snap-4", "snap-5"])
 
         snapinverse1 = SimpleSnapshot(self.fakeconn, count=1)
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapinverse1.get_snapshots(inverse=True)],
-                         [self.fake1, self.fake2, self.fake3, self.fake4])
+                         ["snap-1", "snap-2", "snap-3", "snap-4"])
 
         snapinverse4 = SimpleSnapshot(self.fakeconn, count=4)
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapinverse4.get_snapshots(inverse=True)],
-                         [self.fake1])
+                         ["snap-1"])
 
         snapnegative = SimpleSnapshot(self.fakeconn, count=-2)
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapnegative.get_snapshots(inverse=True)],
-                         [self.fake1, self.fake2, self.fake3,
-                          self.fake4, self.fake5])
+                         ["snap-1", "snap-2", "snap-3",
+                          "snap-4", "snap-5"])
 
     def test_inverse_limit(self):
         snapnum1 = SimpleSnapshot(self.fakeconn, limit=1)
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapnum1.get_snapshots(inverse=True)],
-                         [self.fake1])
+                         ["snap-1"])
 
         snapnum2 = SimpleSnapshot(self.fakeconn, count=2, limit=4)
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapnum2.get_snapshots(inverse=True)],
-                         [self.fake1, self.fake2, self.fake3])
+                         ["snap-1", "snap-2", "snap-3"])
 
         snapdays1 = SimpleSnapshot(self.fakeconn, count=2, limit=2,
                                    count_type="days")
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapdays1.get_snapshots(inverse=True)],
-                         [self.fake1, self.fake2])
+                         ["snap-1", "snap-2"])
 
         snapdays2 = SimpleSnapshot(self.fakeconn, count=1, limit=4,
                                    count_type="days")
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapdays2.get_snapshots(inverse=True)],
-                         [self.fake1, self.fake2, self.fake3, self.fake4])
+                         ["snap-1", "snap-2", "snap-3", "snap-4"])
 
         snapnegative1 = SimpleSnapshot(self.fakeconn, count=3, limit=-1)
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapnegative1.get_snapshots(inverse=True)],
-                         [self.fake1, self.fake2])
+                         ["snap-1", "snap-2"])
 
         snapnegative2 = SimpleSnapshot(self.fakeconn, count=-1,
                                        limit=-1, count_type="days")
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapnegative2.get_snapshots(inverse=True)],
-                         [self.fake1, self.fake2, self.fake3,
-                          self.fake4, self.fake5])
+                         ["snap-1", "snap-2", "snap-3",
+                          "snap-4", "snap-5"])
 
         snapnegative3 = SimpleSnapshot(self.fakeconn, count=-1, limit=2)
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapnegative3.get_snapshots(inverse=True)],
-                         [self.fake1, self.fake2])
+                         ["snap-1", "snap-2"])
 
         snapnegative4 = SimpleSnapshot(self.fakeconn, count=-1, limit=4,
                                        count_type="days")
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapnegative4.get_snapshots(inverse=True)],
-                         [self.fake1, self.fake2, self.fake3, self.fake4])
+                         ["snap-1", "snap-2", "snap-3", "snap-4"])
 
     def test_by_days(self):
         snapshot1 = SimpleSnapshot(self.fakeconn, count=1,
                                    count_type="days", from_date=self.fakedate)
-        self.assertEqual([x._snapshot for x in snapshot1.get_snapshots()],
-                         [self.fake5])
+        self.assertEqual([x.id for x in snapshot1.get_snapshots()],
+                         ["snap-5"])
 
         snapshot2 = SimpleSnapshot(self.fakeconn, count=3,
                                    count_type="days", from_date=self.fakedate)
-        self.assertEqual([x._snapshot for x in snapshot2.get_snapshots()],
-                         [self.fake5, self.fake4, self.fake3])
+        self.assertEqual([x.id for x in snapshot2.get_snapshots()],
+                         ["snap-5", "snap-4", "snap-3"])
 
         snapshot3 = SimpleSnapshot(self.fakeconn, count=4,
                                    count_type="days", from_date=self.fakedate)
-        self.assertEqual([x._snapshot for x in snapshot3.get_snapshots()],
-                         [self.fake5, self.fake4, self.fake3, self.fake2])
+        self.assertEqual([x.id for x in snapshot3.get_snapshots()],
+                         ["snap-5", "snap-4", "snap-3", "snap-2"])
 
         snapshot4 = SimpleSnapshot(self.fakeconn, count=3,
                                    count_type="days",
                                    from_date=datetime(2013, 9, 25))
-        self.assertEqual([x._snapshot for x in snapshot4.get_snapshots()],
-                         [self.fake5, self.fake4, self.fake3, self.fake2])
+        self.assertEqual([x.id for x in snapshot4.get_snapshots()],
+                         ["snap-5", "snap-4", "snap-3", "snap-2"])
 
         snapnegative1 = SimpleSnapshot(self.fakeconn, count=-1,
                                        count_type="days",
                                        from_date=self.fakedate)
-        self.assertEqual([x._snapshot for x in snapnegative1.get_snapshots()],
-                         [self.fake5, self.fake4, self.fake3,
-                          self.fake2, self.fake1])
+        self.assertEqual([x.id for x in snapnegative1.get_snapshots()],
+                         ["snap-5", "snap-4", "snap-3",
+                          "snap-2", "snap-1"])
+
+    def test_by_days_current_time(self):
+        # Without from_date, the current time is read on every search.
+        now = [self.fakedate]
+
+        class FakeDatetime(datetime):
+            @classmethod
+            def utcnow(cls):
+                return now[0]
+
+        snapshot = SimpleSnapshot(self.fakeconn, count=1, count_type="days")
+        with patch("simplesnapshot.snapshot.datetime", FakeDatetime):
+            self.assertEqual([x.id for x in snapshot.get_snapshots()],
+                             ["snap-5"])
+            now[0] = datetime(2013, 9, 27)
+            self.assertEqual(list(snapshot.get_snapshots()), [])
 
     def test_by_days_inverse(self):
         snapshot1 = SimpleSnapshot(self.fakeconn, count=2,
                                    limit=1, count_type="days",
                                    from_date=self.fakedate)
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapshot1.get_snapshots(inverse=True)],
-                         [self.fake1])
+                         ["snap-1"])
 
         snapshot2 = SimpleSnapshot(self.fakeconn, count=3,
                                    count_type="days",
                                    from_date=self.fakedate)
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapshot2.get_snapshots(inverse=True)],
-                         [self.fake1, self.fake2])
+                         ["snap-1", "snap-2"])
 
         snapnegative1 = SimpleSnapshot(self.fakeconn, limit=-2,
                                        count_type="days",
                                        from_date=self.fakedate)
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapnegative1.get_snapshots(inverse=True)],
-                         [self.fake1, self.fake2, self.fake3,
-                          self.fake4, self.fake5])
+                         ["snap-1", "snap-2", "snap-3",
+                          "snap-4", "snap-5"])
 
         snapnegative2 = SimpleSnapshot(self.fakeconn, count=-1,
                                        limit=4, count_type="days",
                                        from_date=self.fakedate)
-        self.assertEqual([x._snapshot for x in
+        self.assertEqual([x.id for x in
                           snapnegative2.get_snapshots(inverse=True)],
-                         [self.fake1, self.fake2, self.fake3, self.fake4])
+                         ["snap-1", "snap-2", "snap-3", "snap-4"])
+
+    def test_start_time_prefixes(self):
+        self.assertEqual(start_time_prefixes(datetime(2013, 9, 18, 5),
+                                             datetime(2013, 9, 21)),
+                         ["2013-09-18*", "2013-09-19*",
+                          "2013-09-20*", "2013-09-21*"])
+        self.assertEqual(start_time_prefixes(datetime(2013, 8, 30),
+                                             datetime(2013, 10, 12)),
+                         ["2013-08-3*", "2013-09-*", "2013-10-0*",
+                          "2013-10-10*", "2013-10-11*", "2013-10-12*"])
+        self.assertEqual(start_time_prefixes(datetime(2011, 12, 31),
+                                             datetime(2013, 2, 28)),
+                         ["2011-12-31*", "2012-*", "2013-01-*",
+                          "2013-02-*"])
+        self.assertEqual(start_time_prefixes(datetime(2013, 9, 2),
+                                             datetime(2013, 9, 1)), [])
+
+    def test_date_pushdown(self):
+        class FakeDatetime(datetime):
+            @classmethod
+            def utcnow(cls):
+                return datetime(2013, 9, 25, 10)
+
+        snapshot = SimpleSnapshot(self.fakeconn, count=3, count_type="days",
+                                  from_date=self.fakedate,
+                                  filters={"tag:Name": "backup"},
+                                  date_pushdown=True)
+        with patch("simplesnapshot.snapshot.datetime", FakeDatetime):
+            self.assertEqual(len(list(snapshot.get_snapshots())), 3)
+            self.assertRaises(ValueError, list,
+                              snapshot.get_snapshots(inverse=True))
+
+        self.fakeconn.get_all_snapshots.assert_called_once_with(
+            [], owner=["self"], filters={
+                "tag:Name": "backup",
+                "start-time": ["2013-09-22*", "2013-09-23*", "2013-09-24*",
+                               "2013-09-25*", "2013-09-26*"]})
+
+        # Filters of the caller's own on the start time are kept.
+        snapshot.filters = {"start-time": "2013-09-2*"}
+        self.assertIs(snapshot.discovery_filters(), snapshot.filters)
+        snapshot.filters, snapshot.count = {}, 0
+        self.assertEqual(snapshot.discovery_filters(), {})
+
+    def test_where(self):
+        # snap-5, snap-3 and snap-1 belong to vol-1.
+        self.set_volumes()
+        where = "volume-id = vol-1"
+        snapnum = SimpleSnapshot(self.fakeconn, count=2, where=where)
+        self.assertEqual([x.id for x in snapnum.get_snapshots()],
+                         ["snap-5", "snap-3"])
+        self.assertEqual([x.id for x in snapnum.get_snapshots(inverse=True)],
+                         ["snap-1"])
+        self.assertEqual(snapnum.matched[0], [0, 2, 4])
+
+        snapdays = SimpleSnapshot(self.fakeconn, count=3, limit=1,
+                                  count_type="days", from_date=self.fakedate,
+                                  where=where)
+        self.assertEqual([x.id for x in snapdays.get_snapshots()],
+                         ["snap-5"])
+        self.assertEqual([x.id for x in
+                          snapdays.get_snapshots(inverse=True)], ["snap-1"])
+
+        grouped = SimpleSnapshot(self.fakeconn, count=1, group_by="Name",
+                                 where="not id = snap-5")
+        self.assertEqual([x.id for x in grouped.get_snapshots()],
+                         ["snap-4", "snap-3"])
+
+        streamed = SimpleSnapshot(self.fakeconn, count=2, where=where)
+        self.assertEqual([x.id for x in streamed.stream_snapshots()],
+                         ["snap-1", "snap-3"])
+
+        self.assertIsNone(SimpleSnapshot(self.fakeconn).matched)
+        self.assertRaises(ValueError, SimpleSnapshot, self.fakeconn,
+                          where="size ~ 1")
+
+    def _paged_conn(self):
+        pages = []
+        for token, snaps in [("token-1", self.unsorted_snaps[:2]),
+                             ("token-2", self.unsorted_snaps[2:4]),
+                             (None, self.unsorted_snaps[4:])]:
+            page = ResultSet()
+            page.extend(snaps)
+            page.next_token = token
+            pages.append(page)
+
+        self.fakeconn.get_list.side_effect = iter(pages)
+        self.fakeconn.build_filter_params.side_effect = (
+            lambda params, filters: params.update({"Filter.1.Name": "x"})
+        )
+        return self.fakeconn
+
+    def test_paged_discovery(self):
+        snapshot = SimpleSnapshot(self._paged_conn(), page_size=2,
+                                  filters={"x": "y"})
+        self.assertEqual([x.id for x in snapshot.snapshots],
+                         ["snap-5", "snap-4", "snap-3",
+                          "snap-2", "snap-1"])
+        self.assertFalse(self.fakeconn.get_all_snapshots.called)
+
+        tokens = [x[0][1].get("NextToken") for x in
+                  self.fakeconn.get_list.call_args_list]
+        self.assertEqual(tokens, [None, "token-1", "token-2"])
+        params = self.fakeconn.get_list.call_args[0][1]
+        self.assertEqual(params["MaxResults"], "2")
+        self.assertEqual(params["Owner"], ["self"])
+        self.assertEqual(params["Filter.1.Name"], "x")
+
+    def test_paged_discovery_with_snapshot_ids(self):
+        snapshot = SimpleSnapshot(self.fakeconn, page_size=2,
+                                  snapshot_ids=["snap-1"])
+        self.assertEqual(len(snapshot.snapshots), 5)
+        self.assertFalse(self.fakeconn.get_list.called)
+
+    def test_stream_snapshots(self):
+        snapshot = SimpleSnapshot(self._paged_conn(), page_size=2)
+        stream = snapshot.stream_snapshots()
+        self.assertEqual(next(stream).id, "snap-4")
+        self.assertEqual(self.fakeconn.get_list.call_count, 1)
+        self.assertEqual([x.id for x in stream],
+                         ["snap-1", "snap-3", "snap-5", "snap-2"])
+
+    def test_stream_snapshots_filters(self):
+        snapcount = SimpleSnapshot(self.fakeconn, count=3, limit=4)
+        self.assertEqual([x.id for x in snapcount.stream_snapshots()],
+                         ["snap-4", "snap-1", "snap-3"])
+
+        snapdays = SimpleSnapshot(self.fakeconn, count=3, count_type="days",
+                                  from_date=self.fakedate)
+        self.assertEqual([x.id for x in snapdays.stream_snapshots()],
+                         ["snap-4", "snap-3", "snap-5"])
 
 
 class TestSnapshotActions(unittest.TestCase):
@@ -228,12 +489,18 @@ class TestSnapshotActions(unittest.TestCase):
         self.fakesnap.volume_id = "vol-1234567"
         self.fakesnap.id = "snap-1"
         self.fakesnap.description = "Snapshot Under test"
-        self.fakesnap.delete = Mock()
+        self.fakesnap.volume_size = 8
+        self.fakesnap.tags = {}
 
         self.fakedate = datetime(2013, 9, 22)
         self.fakeconn = Mock(spec=EC2Connection)
         self.fakeconn.get_all_snapshots.return_value = [self.fakesnap]
-        self.fakeconn.create_snapshot.return_value = self.fakesnap
+        self.fakeconn.get_all_volumes.return_value = []
+        self.fakeconn.get_object.side_effect = self.create_snapshot
+
+    def create_snapshot(self, action, params, cls, verb="GET"):
+        self.fakesnap.volume_id = params["VolumeId"]
+        return self.fakesnap
 
     def test_create_snapshot(self):
         tags = {"Name": "Testing"}
@@ -242,10 +509,12 @@ class TestSnapshotActions(unittest.TestCase):
                                       tags=tags,
                                       auto_confirm=True)
         snap1.run("create")
-        self.fakeconn.create_snapshot.assert_called_once_with("vol-123456",
-                                                              description="",
-                                                              dry_run=False)
-        self.fakeconn.create_tags.assert_called_once_with(self.fakesnap.id,
+        self.fakeconn.get_all_volumes.assert_called_once_with(
+            filters={"volume-id": ["vol-123456"]})
+        self.fakeconn.get_object.assert_called_once_with(
+            "CreateSnapshot", {"VolumeId": "vol-123456"}, Snapshot,
+            verb="POST")
+        self.fakeconn.create_tags.assert_called_once_with([self.fakesnap.id],
                                                           tags,
                                                           dry_run=False)
 
@@ -254,17 +523,63 @@ class TestSnapshotActions(unittest.TestCase):
                                      volume_id="vol-3231412",
                                      auto_confirm=True, dry_run=True)
         snap.run("create")
-        self.fakeconn.create_snapshot.assert_called_once_with("vol-3231412",
-                                                              description="",
-                                                              dry_run=True)
+        self.fakeconn.get_object.assert_called_once_with(
+            "CreateSnapshot", {"VolumeId": "vol-3231412", "DryRun": "true"},
+            Snapshot, verb="POST")
+
+    def test_create_snapshot_volume_filter(self):
+        volumes = []
+        for i, name in enumerate(["web", None]):
+            volume = Mock()
+            volume.id = "vol-{0}".format(i)
+            volume.tags = {"Name": name} if name else {}
+            volumes.append(volume)
+        self.fakeconn.get_all_volumes.return_value = volumes
+
+        snap = SimpleSnapshotConsole(self.fakeconn, workers=2,
+                                     volume_filters={"tag:Backup": "true"},
+                                     auto_confirm=True)
+        self.assertEqual(snap.resolve_volumes().items(),
+                         [("vol-0", "web"), ("vol-1", None)])
+        self.fakeconn.get_all_volumes.assert_called_once_with(
+            filters={"tag:Backup": "true"})
+
+        def create_snapshot(action, params, cls, verb):
+            snap = Snapshot()
+            snap.id = params["VolumeId"].replace("vol", "snap")
+            snap.volume_id = params["VolumeId"]
+            snap.region = self.fakesnap.region
+            return snap
+
+        self.fakeconn.get_object.side_effect = create_snapshot
+        self.assertIsNone(snap.run("create"))
+        self.assertEqual(self.fakeconn.get_object.call_count, 2)
+        self.fakeconn.create_tags.assert_called_once_with(
+            ["snap-0"], {"Name": "web"}, dry_run=False)
 
     def test_delete_snapshot(self):
         snap = SimpleSnapshotConsole(self.fakeconn, auto_confirm=True)
         snap.run("delete")
-        self.fakesnap.delete.assert_called_once_with(dry_run=False)
+        self.fakeconn.delete_snapshot.assert_called_once_with("snap-1",
+                                                              dry_run=False)
 
     def test_delete_snapshot_dry_run(self):
         snap = SimpleSnapshotConsole(self.fakeconn, auto_confirm=True,
                                      dry_run=True)
         snap.run("delete")
-        self.fakesnap.delete.assert_called_once_with(dry_run=True)
+        self.fakeconn.delete_snapshot.assert_called_once_with("snap-1",
+                                                              dry_run=True)
+
+    def test_delete_snapshot_workers(self):
+        snap = SimpleSnapshotConsole(self.fakeconn, auto_confirm=True,
+                                     workers=4)
+        self.assertIsNone(snap.run("delete"))
+        self.fakeconn.delete_snapshot.assert_called_once_with("snap-1",
+                                                              dry_run=False)
+
+    def test_delete_snapshot_failure_exit_code(self):
+        error = EC2ResponseError(400, "Bad Request")
+        error.error_code = "InvalidSnapshot.InUse"
+        self.fakeconn.delete_snapshot.side_effect = error
+        snap = SimpleSnapshotConsole(self.fakeconn, auto_confirm=True)
+        self.assertEqual(snap.run("delete"), 1)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from StringIO import StringIO
+from mock import patch
+from boto.exception import BotoServerError, EC2ResponseError
+
+from simplesnapshot.bulk import bulk_delete, DELETED, IN_USE, NOT_FOUND
+from simplesnapshot.cmdline import connect
+from simplesnapshot.fanout import run_consoles
+from simplesnapshot.journal import DeleteJournal
+from simplesnapshot.snapshot import (SET_TAG, SimpleSnapshot,
+                                     SimpleSnapshotConsole)
+from simplesnapshot.standin import *
+
+
+class TestStandin(unittest.TestCase):
+
+    def setUp(self):
+        self.ec2 = StandinEC2(snapshots=25, in_use_rate=0.2, seed=1)
+        self.server = StandinServer(("127.0.0.1", 0), self.ec2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        config = {"aws_access_key_id": "AKTEST",
+                  "aws_secret_access_key": "TESTKEY"}
+        self.conn = connect(config, "us-east-1", self.server.endpoint_url)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_endpoint_override(self):
+        self.assertEqual(self.conn.host, "127.0.0.1")
+        self.assertEqual(self.conn.port, self.server.server_address[1])
+        self.assertFalse(self.conn.is_secure)
+
+    def test_describe_snapshots_paged(self):
+        snapshot = SimpleSnapshot(self.conn, page_size=10)
+        self.assertEqual(sorted(x.id for x in snapshot.snapshots),
+                         sorted(self.ec2.snapshots))
+        self.assertEqual(self.ec2.calls["DescribeSnapshots"], 3)
+
+    def test_describe_snapshots_filters(self):
+        volume_id = self.ec2.snapshots.values()[0]["volume_id"]
+        expected = sorted(x["id"] for x in self.ec2.snapshots.values()
+                          if x["volume_id"] == volume_id)
+
+        snaps = self.conn.get_all_snapshots(filters={"volume-id": volume_id})
+        self.assertEqual(sorted(x.id for x in snaps), expected)
+
+        snaps = self.conn.get_all_snapshots(filters={"volume-id": "vol-x*"})
+        self.assertEqual(snaps, [])
+
+    def test_date_pushdown(self):
+        everything = SimpleSnapshot(self.conn, count=60, count_type="days")
+        pushed = SimpleSnapshot(self.conn, count=60, count_type="days",
+                                date_pushdown=True)
+        expected = [x.id for x in everything.get_snapshots()]
+        self.assertEqual([x.id for x in pushed.get_snapshots()], expected)
+        self.assertEqual(len(everything.snapshots), 25)
+        self.assertLess(len(pushed.snapshots), 25)
+        self.assertGreaterEqual(len(pushed.snapshots), len(expected))
+
+    def test_create_and_tag_snapshot(self):
+        snap = self.conn.create_snapshot("vol-00000001", description="Test")
+        self.assertEqual(snap.volume_id, "vol-00000001")
+        self.assertEqual(snap.status, "completed")
+        self.conn.create_tags([snap.id], {"Name": "Testing"})
+
+        found = self.conn.get_all_snapshots([snap.id])
+        self.assertEqual(found[0].tags, {"Name": "Testing"})
+        self.assertEqual(found[0].description, "Test")
+
+    def test_dry_run(self):
+        try:
+            self.conn.create_snapshot("vol-00000001", dry_run=True)
+        except EC2ResponseError, e:
+            self.assertEqual(e.error_code, "DryRunOperation")
+        else:
+            self.fail("DryRunOperation not raised")
+        self.assertEqual(len(self.ec2.snapshots), 25)
+
+    def test_bulk_delete_outcomes(self):
+        snaps = SimpleSnapshot(self.conn).snapshots
+        gone = SimpleSnapshot(self.conn).snapshots[0]
+        self.conn.delete_snapshot(gone.id)
+
+        result = bulk_delete(self.conn, snaps, workers=4)
+        self.assertEqual(result.counts[IN_USE], len(self.ec2.in_use))
+        self.assertEqual(result.counts[NOT_FOUND], 1)
+        self.assertEqual(result.counts[DELETED], 24 - len(self.ec2.in_use))
+        self.assertEqual(sorted(self.ec2.snapshots), sorted(self.ec2.in_use))
+
+    def test_throttling(self):
+        self.ec2.throttle_rate = 1.0
+        self.conn.num_retries = 0
+        try:
+            self.conn.get_all_snapshots()
+        except BotoServerError, e:
+            self.assertEqual(e.status, 503)
+            self.assertEqual(e.error_code, "RequestLimitExceeded")
+        else:
+            self.fail("RequestLimitExceeded not raised")
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=1, burst=2)
+        self.assertEqual([bucket.take() for _ in range(3)],
+                         [True, True, False])
+
+    def test_describe_volumes(self):
+        volumes = self.conn.get_all_volumes(
+            filters={"attachment.instance-id": "i-00000001"})
+        self.assertEqual(sorted(x.id for x in volumes),
+                         ["vol-00000002", "vol-00000003"])
+        self.assertEqual(volumes[0].attach_data.instance_id, "i-00000001")
+
+    def test_create_many_volumes(self):
+        self.conn.create_tags(["vol-00000001", "vol-00000002"],
+                              {"Backup": "true"})
+        self.conn.create_tags(["vol-00000002"], {"Name": "web"})
+        self.ec2.calls.clear()
+
+        console = SimpleSnapshotConsole(self.conn, auto_confirm=True,
+                                        volume_filters={"tag:Backup": "true"},
+                                        tags={"Type": "nightly"}, workers=4)
+        self.assertIsNone(console.run("create"))
+        self.assertEqual(self.ec2.calls["DescribeVolumes"], 1)
+        self.assertEqual(self.ec2.calls["CreateSnapshot"], 2)
+        self.assertEqual(self.ec2.calls["CreateTags"], 2)
+
+        created = [x for x in self.ec2.snapshots.values()
+                   if x["tags"].get("Type") == "nightly"]
+        self.assertEqual(sorted((x["volume_id"], x["tags"].get("Name"))
+                                for x in created),
+                         [("vol-00000001", None), ("vol-00000002", "web")])
+
+    def test_create_unknown_volume(self):
+        console = SimpleSnapshotConsole(self.conn, auto_confirm=True,
+                                        volume_ids=["vol-00000005",
+                                                    "vol-x"], workers=2)
+        self.assertEqual(console.run("create"), 1)
+        self.assertEqual(self.ec2.calls["CreateSnapshot"], 2)
+        self.assertEqual(len(self.ec2.snapshots), 26)
+
+    def test_create_instance_set(self):
+        console = SimpleSnapshotConsole(self.conn, auto_confirm=True,
+                                        instance_id="i-00000001",
+                                        tags={"Type": "nightly"},
+                                        max_skew=60)
+        with patch("sys.stdout"):
+            self.assertIsNone(console.run("create"))
+        self.assertEqual(self.ec2.calls["DescribeVolumes"], 1)
+        self.assertEqual(self.ec2.calls["CreateTags"], 1)
+
+        created = [x for x in self.ec2.snapshots.values()
+                   if x["tags"].get("Type") == "nightly"]
+        self.assertEqual(sorted(x["volume_id"] for x in created),
+                         ["vol-00000002", "vol-00000003"])
+        set_ids = set(x["tags"][SET_TAG] for x in created)
+        self.assertEqual(len(set_ids), 1)
+        self.assertTrue(set_ids.pop().startswith("i-00000001-"))
+
+    def test_create_instance_set_skew(self):
+        console = SimpleSnapshotConsole(self.conn, auto_confirm=True,
+                                        instance_id="i-00000001",
+                                        max_skew=-1)
+        with patch("sys.stdout"):
+            with patch("sys.stderr"):
+                self.assertEqual(console.run("create"), 1)
+
+    def test_create_and_wait(self):
+        self.ec2.complete_after = 0.3
+        console = SimpleSnapshotConsole(self.conn, auto_confirm=True,
+                                        volume_ids=["vol-00000001",
+                                                    "vol-00000002"],
+                                        workers=2, wait=True,
+                                        poll_interval=0.05, output="csv",
+                                        columns=["id", "status"])
+        with patch("sys.stdout", new=StringIO()) as stdout:
+            with patch("sys.stderr"):
+                self.assertIsNone(console.run("create"))
+
+        rows = stdout.getvalue().splitlines()
+        self.assertEqual(rows[0], "id,status")
+        created = [x.split(",")[0] for x in rows[1:3]]
+        self.assertEqual(sorted(x for x in rows if x.endswith(",completed")),
+                         sorted(x + ",completed" for x in created))
+        self.assertEqual([self.ec2.snapshots[x]["status"] for x in created],
+                         ["completed", "completed"])
+
+    def test_delete_journal_resume(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, "delete.jsonl")
+        self.ec2.in_use.clear()
+
+        # The run is interrupted after six deletes, before the outcome
+        # of the sixth is recorded.
+        console = SimpleSnapshotConsole(self.conn, auto_confirm=True,
+                                        journal=path)
+        record = DeleteJournal.record
+        done = []
+
+        def interrupt(journal, *outcome):
+            if len(done) == 5:
+                raise KeyboardInterrupt()
+            done.append(outcome[0])
+            record(journal, *outcome)
+
+        with patch.object(DeleteJournal, "record", interrupt):
+            with patch("sys.stdout"):
+                self.assertRaises(KeyboardInterrupt, console.run, "delete")
+        self.assertEqual(len(self.ec2.snapshots), 19)
+
+        self.ec2.calls.clear()
+        console = SimpleSnapshotConsole(self.conn, auto_confirm=True,
+                                        journal=path, resume=True)
+        with patch("sys.stdout"):
+            with patch("sys.stderr"):
+                # The sixth snapshot is reported as not found.
+                self.assertEqual(console.run("delete"), 1)
+        # Only the unrecorded sixth delete is sent again, without
+        # discovering snapshots.
+        self.assertEqual(self.ec2.snapshots, {})
+        self.assertEqual(self.ec2.calls, {"DeleteSnapshot": 20})
+
+    def test_delete_plan_and_apply(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, "plan.jsonl")
+
+        console = SimpleSnapshotConsole(self.conn, auto_confirm=True,
+                                        count=20, journal=path,
+                                        plan_info={"profile": "prod"},
+                                        plan_only=True)
+        with patch("sys.stdout"):
+            with patch("sys.stderr"):
+                self.assertIsNone(console.run("delete"))
+        self.assertEqual(len(self.ec2.snapshots), 25)
+
+        planned = [x.id for x in console.get_snapshots(inverse=True)]
+        console = SimpleSnapshotConsole(self.conn, auto_confirm=True,
+                                        journal=path, resume=True)
+        with patch("sys.stdout"):
+            with patch("sys.stderr"):
+                self.assertEqual(console.run("delete"), 1)
+
+        in_use = set(planned) & self.ec2.in_use
+        self.assertEqual(set(self.ec2.snapshots) & set(planned), in_use)
+        journal = DeleteJournal(path)
+        journal.load()
+        self.assertEqual(sorted(x.id for x in journal.pending()),
+                         sorted(in_use))
+        self.assertEqual((journal.info["profile"], journal.info["region"]),
+                         ("prod", "us-east-1"))
+
+    def test_delete_resume_several_consoles(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.ec2.in_use.clear()
+        ids = sorted(self.ec2.snapshots)
+        paths = []
+        for i, part in enumerate([ids[:10], ids[10:]]):
+            paths.append(os.path.join(tmpdir, "plan-{0}.jsonl".format(i)))
+            console = SimpleSnapshotConsole(self.conn, auto_confirm=True,
+                                            snapshot_ids=part,
+                                            journal=paths[-1],
+                                            plan_only=True)
+            with patch("sys.stdout"):
+                console.run("delete")
+
+        self.ec2.calls.clear()
+        consoles = [SimpleSnapshotConsole(self.conn, auto_confirm=True,
+                                          journal=x, resume=True)
+                    for x in paths]
+        with patch("sys.stdout"):
+            with patch("sys.stderr"):
+                self.assertEqual(run_consoles(consoles, "delete"), 0)
+        self.assertEqual(self.ec2.snapshots, {})
+        self.assertEqual(self.ec2.calls, {"DeleteSnapshot": 25})
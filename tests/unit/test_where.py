@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+import unittest
+
+from simplesnapshot.snapshot import SnapshotRecord
+from simplesnapshot.where import *
+
+
+class TestCompileWhere(unittest.TestCase):
+
+    def setUp(self):
+        self.nightly = SnapshotRecord(
+            "snap-1", "vol-1", "completed", "100%",
+            "2013-09-21T02:05:32.000Z", 120, "nightly backup",
+            {"Keep": "yes", "Name": "db"})
+        self.manual = SnapshotRecord(
+            "snap-2", "vol-2", "pending", "10%",
+            "2013-09-22T02:05:32.000Z", 8, None, None)
+
+    def matches(self, expression):
+        where = compile_where(expression)
+        return [x.id for x in [self.nightly, self.manual] if where(x)]
+
+    def test_comparisons(self):
+        self.assertEqual(self.matches("size >= 100"), ["snap-1"])
+        self.assertEqual(self.matches("size < 120.5"), ["snap-1", "snap-2"])
+        self.assertEqual(self.matches("status = pending"), ["snap-2"])
+        self.assertEqual(self.matches("volume-id != vol-1"), ["snap-2"])
+        self.assertEqual(self.matches("volume_id == 'vol-1'"), ["snap-1"])
+        self.assertEqual(self.matches("date < 2013-09-22"), ["snap-1"])
+        self.assertEqual(self.matches("date >= 2013-09-21T02:05:33"),
+                         ["snap-2"])
+        self.assertEqual(self.matches('start-time > "2013-09-21T03"'),
+                         ["snap-2"])
+        self.assertEqual(self.matches("progress < 50"), ["snap-2"])
+        self.assertEqual(self.matches("progress >= 100%"), ["snap-1"])
+        self.assertEqual(self.matches("progress = 10"), ["snap-2"])
+        self.manual.progress = "0%"
+        self.assertEqual(self.matches("progress"), ["snap-1", "snap-2"])
+
+    def test_regular_expressions(self):
+        self.assertEqual(self.matches("description ~ '^night'"), ["snap-1"])
+        # A missing description matches only !~.
+        self.assertEqual(self.matches("description !~ backup"), ["snap-2"])
+        self.assertEqual(self.matches("description ~ '.*'"), ["snap-1"])
+
+    def test_tags(self):
+        self.assertEqual(self.matches("tag:Keep"), ["snap-1"])
+        self.assertEqual(self.matches("not tag:Keep"), ["snap-2"])
+        self.assertEqual(self.matches("tag:Name = db"), ["snap-1"])
+        self.assertEqual(self.matches("tag:Name != db"), ["snap-2"])
+
+    def test_boolean_operators(self):
+        self.assertEqual(self.matches("size > 100 and tag:Keep"), ["snap-1"])
+        self.assertEqual(self.matches("size > 100 AND not tag:Keep"), [])
+        self.assertEqual(self.matches("tag:Keep or size < 10"),
+                         ["snap-1", "snap-2"])
+        # 'and' binds tighter than 'or'.
+        self.assertEqual(self.matches("status = pending or size > 100 "
+                                      "and not tag:Keep"), ["snap-2"])
+        self.assertEqual(self.matches("(status = pending or size > 100) "
+                                      "and not tag:Keep"), ["snap-2"])
+        self.assertEqual(self.matches("not (status=pending or tag:Keep)"),
+                         [])
+
+    def test_errors(self):
+        for expression in ["", "  ", "size ~ 1", "bogus = 1", "tag: = x",
+                           "size > big", "date > 2013/09/21", "size >",
+                           "(size > 1", "size > 1)", "id = a b", "and",
+                           "description ~ '('", "id ! x", "size > (",
+                           "progress > half", "progress ~ 1"]:
+            self.assertRaises(ValueError, compile_where, expression)